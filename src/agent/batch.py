@@ -0,0 +1,268 @@
+"""
+Bulk question answering: the engine behind POST /api/v1/chat/batch, and an
+offline job over a JSONL file.
+
+Questions are processed BATCH_CHUNK_SIZE at a time. For each chunk, all questions
+are embedded in as few embedding calls as possible (cached embeddings are reused)
+and searched with multi-vector Milvus searches (BATCH_SEARCH_SIZE vectors each),
+instead of one embedding and one search per question. The graph then runs over the
+chunk, at most BATCH_MAX_CONCURRENCY questions in flight, while the next chunk is
+embedded and searched.
+
+Served by the API, each question in flight holds an admission slot, as a /chat
+request would (so batches count against ADMISSION_MAX_IN_FLIGHT, run degraded
+near capacity, and questions turned away get a 429/503 error result), and has
+its own REQUEST_DEADLINE_SECONDS deadline.
+
+Each question gets the experiment variant a /chat request from its user would get
+(`user_id`), and repeated questions are answered from the semantic cache.
+Results are written as they complete, one JSON object per line, with the input's
+`index` and `id`: {"index", "id", "answer", "documents", "route", "strategy"}, or
+{"index", "id", "error", "status"} for a question that failed.
+
+Input lines are JSON objects with the question (field --question-field), and
+optionally an ID (--id-field, echoed back) and a `user_id`. The job exits with
+status 1 if any question failed.
+
+Usage:
+    python -m src.agent.batch questions.jsonl --output answers.jsonl
+    python -m src.agent.batch requests.jsonl --question-field body --id-field request_id
+    cat questions.jsonl | python -m src.agent.batch - > answers.jsonl
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import sys
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
+from src.agent.graph import app as agent_app
+from src.agent.tools import format_document, retrieve_many
+from src.core.admission import AdmissionController
+from src.core.concurrency import deadline_scope, new_deadline
+from src.core.config import settings
+from src.core.container import Container, container
+from src.core.errors import error_response
+from src.core.experiments import experiments
+from src.core.metrics import DEGRADED_REQUESTS, GRAPH_ROUTES, llm_metrics
+from src.core.semantic_cache import CachedAnswer
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class BatchItem:
+    """One question of a batch; `index` is its position in the input."""
+    index: int
+    question: str
+    id: Any = None
+    user_id: Optional[str] = None
+
+@dataclass
+class _Prepared:
+    """A question with its variant, embedding, and cached answer or search hits."""
+    item: BatchItem
+    strategy: str
+    vector: List[float]
+    cached: Optional[CachedAnswer] = None
+    retrieved: Optional[List[Document]] = None
+
+def _config(strategy: str, deps: Container, degraded: bool = False) -> RunnableConfig:
+    """Graph config for the batch's questions of one variant (as for /chat, labelled as batch in metrics)."""
+    configurable = {"strategy": strategy, "variant": experiments.variants[strategy], "deps": deps}
+    if degraded:
+        configurable["degraded"] = True
+    return RunnableConfig(
+        configurable=configurable,
+        metadata={"strategy": strategy, "batch": True},
+        callbacks=[llm_metrics],
+    )
+
+async def _prepare(items: List[BatchItem], deps: Container) -> List[_Prepared]:
+    """Embeds a chunk of questions, looks them up in the semantic cache and searches for the rest."""
+    vectors = await deps.embeddings.aembed_documents([item.question for item in items])
+    prepared = [
+        _Prepared(item, experiments.assign(item.user_id), vector) for item, vector in zip(items, vectors)
+    ]
+
+    if deps.semantic_cache is not None:
+        cached = await asyncio.gather(*(deps.semantic_cache.alookup(p.strategy, p.vector) for p in prepared))
+        for p, answer in zip(prepared, cached):
+            p.cached = answer
+
+    # Variants may search with different top-k and search params: one set of searches per variant
+    by_strategy: Dict[str, List[_Prepared]] = {}
+    for p in prepared:
+        if p.cached is None:
+            by_strategy.setdefault(p.strategy, []).append(p)
+    results = await asyncio.gather(*(
+        retrieve_many([p.item.question for p in group], [p.vector for p in group], _config(strategy, deps))
+        for strategy, group in by_strategy.items()
+    ))
+    for group, documents in zip(by_strategy.values(), results):
+        for p, docs in zip(group, documents):
+            p.retrieved = docs
+    return prepared
+
+def _error(item: BatchItem, e: BaseException) -> Dict[str, Any]:
+    status, detail, _ = error_response(e)
+    return {"index": item.index, "id": item.id, "error": detail, "status": status}
+
+async def _answer(p: _Prepared, deps: Container, admission: Optional[AdmissionController]) -> Dict[str, Any]:
+    """Runs the graph for one question, within its deadline and (if given) an admission slot."""
+    try:
+        async with deadline_scope(new_deadline()), (admission.admit() if admission else nullcontext(False)) as degraded:
+            if degraded:
+                DEGRADED_REQUESTS.labels("overload").inc()
+            state = {"question": p.item.question, "documents": [], "query_vector": p.vector, "retrieved": p.retrieved}
+            output = await agent_app.ainvoke(state, config=_config(p.strategy, deps, degraded))
+    except Exception as e:
+        logger.warning("Batch question failed", extra={"index": p.item.index, "error": repr(e)})
+        return _error(p.item, e)
+    route = output["route"]
+    GRAPH_ROUTES.labels("->".join(route), p.strategy).inc()
+    documents = [format_document(d) for d in output["documents"]]
+    # Degraded answers (ungraded context) are not cached, as for /chat
+    if deps.semantic_cache is not None and not degraded and route[-1] != "no_context":
+        await deps.semantic_cache.astore(p.strategy, p.vector, output["generation"], documents)
+    return {
+        "index": p.item.index, "id": p.item.id, "answer": output["generation"],
+        "documents": documents, "route": route, "strategy": p.strategy,
+    }
+
+async def _run_chunk(
+    prepared: List[_Prepared], deps: Container, max_concurrency: int, admission: Optional[AdmissionController]
+) -> AsyncIterator[Dict[str, Any]]:
+    runs: List[_Prepared] = []
+    for p in prepared:
+        if p.cached is not None:
+            yield {
+                "index": p.item.index, "id": p.item.id, "answer": p.cached.answer,
+                "documents": p.cached.documents, "route": ["semantic_cache"], "strategy": p.strategy,
+            }
+        else:
+            runs.append(p)
+
+    # Tasks of our own rather than the graph's abatch: each question needs its own deadline and admission slot
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def bounded(p: _Prepared) -> Dict[str, Any]:
+        async with semaphore:
+            return await _answer(p, deps, admission)
+
+    tasks = [asyncio.create_task(bounded(p)) for p in runs]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        # The consumer went away (e.g. the client disconnected): stop the rest
+        for task in tasks:
+            task.cancel()
+
+def _chunks(items: Iterable[BatchItem], size: int) -> Iterator[List[BatchItem]]:
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+async def answer_batch(
+    items: Iterable[BatchItem],
+    deps: Optional[Container] = None,
+    max_concurrency: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    admission: Optional[AdmissionController] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Answers `items` (read lazily, a chunk at a time), yielding one result per item
+    in completion order. A question that fails yields an error result; the others go on.
+    With `admission`, every question in flight holds one of its slots.
+    """
+    deps = deps or container
+    max_concurrency = max_concurrency or settings.BATCH_MAX_CONCURRENCY
+    chunks = _chunks(items, chunk_size or settings.BATCH_CHUNK_SIZE)
+
+    def start(chunk: Optional[List[BatchItem]]):
+        return (chunk, asyncio.create_task(_prepare(chunk, deps))) if chunk else (None, None)
+
+    chunk, preparing = start(next(chunks, None))
+    try:
+        while preparing is not None:
+            current = chunk
+            try:
+                prepared, failure = await preparing, None
+            except Exception as e:
+                # Embedding or search failed for the whole chunk
+                logger.warning("Batch chunk failed", extra={"items": len(current), "error": repr(e)})
+                prepared, failure = None, e
+            # Embed and search the next chunk while this one runs through the graph
+            chunk, preparing = start(next(chunks, None))
+            if failure is not None:
+                for item in current:
+                    yield _error(item, failure)
+            else:
+                async for result in _run_chunk(prepared, deps, max_concurrency, admission):
+                    yield result
+    finally:
+        if preparing is not None:
+            preparing.cancel()
+
+def _read_items(lines: Iterable[str], question_field: str, id_field: str) -> Iterator[BatchItem]:
+    index = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        yield BatchItem(index=index, question=record[question_field], id=record.get(id_field), user_id=record.get("user_id"))
+        index += 1
+
+async def run_job(args: argparse.Namespace) -> int:
+    """Runs the batch job; returns the number of failed questions."""
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    sink = sys.stdout if args.output is None else open(args.output, "w", encoding="utf-8")
+    answered = failed = 0
+    started = time.perf_counter()
+    try:
+        items = _read_items(source, args.question_field, args.id_field)
+        async for result in answer_batch(items, max_concurrency=args.concurrency, chunk_size=args.chunk_size):
+            sink.write(json.dumps(result) + "\n")
+            if "error" in result:
+                failed += 1
+            else:
+                answered += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+        await container.aclose()
+    elapsed = time.perf_counter() - started
+    print(
+        f"Batch: {answered} answered, {failed} failed in {elapsed:.1f}s "
+        f"({(answered + failed) / elapsed:.1f} questions/s)",
+        file=sys.stderr,
+    )
+    return failed
+
+def main():
+    from src.core.log import setup_logging
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of questions ('-' for stdin)")
+    parser.add_argument("--output", default=None, help="JSONL file for the results (default: stdout)")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--concurrency", type=int, default=settings.BATCH_MAX_CONCURRENCY,
+                        help="Questions in flight through the graph")
+    parser.add_argument("--chunk-size", type=int, default=settings.BATCH_CHUNK_SIZE,
+                        help="Questions embedded and searched together")
+    args = parser.parse_args()
+
+    setup_logging()
+    failed = asyncio.run(run_job(args))
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
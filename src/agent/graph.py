@@ -1,30 +1,76 @@
+from typing import Optional
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import END, StateGraph
+from langgraph.graph.state import CompiledStateGraph
+from src.core.config import settings
 from src.agent.state import AgentState
-from src.agent.nodes import retrieve, grade_documents, generate
+from src.agent.nodes import (
+    retrieve,
+    rerank,
+    grade_documents,
+    generate,
+    rewrite_query,
+    no_context,
+    recall,
+    remember,
+    route_start,
+    route_after_retrieve,
+    route_after_grade,
+)
 
-# 1. Initialize Graph
-workflow = StateGraph(AgentState)
+def build_graph(checkpointer: Optional[BaseCheckpointSaver] = None) -> CompiledStateGraph:
+    """
+    Compiles the agent graph. With a checkpointer it is the session graph: state is
+    saved per thread_id, follow-ups can reuse the thread's graded chunks (`recall`),
+    and each turn is recorded (`remember`).
+    """
+    # 1. Initialize Graph
+    workflow = StateGraph(AgentState)
 
-# 2. Add Nodes
-workflow.add_node("retrieve", retrieve)
-workflow.add_node("grade_documents", grade_documents)
-workflow.add_node("generate", generate)
+    # 2. Add Nodes
+    workflow.add_node("retrieve", retrieve)
+    workflow.add_node("grade_documents", grade_documents)
+    workflow.add_node("generate", generate)
+    workflow.add_node("rewrite_query", rewrite_query)
+    workflow.add_node("no_context", no_context)
 
-# 3. Add Edges
-# Entry point -> Retrieve
-workflow.set_entry_point("retrieve")
+    # 3. Add Edges
+    if checkpointer is None:
+        # Entry point -> Retrieve
+        workflow.set_entry_point("retrieve")
+        done = END
+    else:
+        # Entry point -> Recall the thread's chunks for a close follow-up, else Retrieve
+        workflow.add_node("recall", recall)
+        workflow.add_node("remember", remember)
+        workflow.set_conditional_entry_point(route_start, ["recall", "retrieve"])
+        workflow.add_edge("recall", "generate")
+        workflow.add_edge("remember", END)
+        done = "remember"
 
-# Retrieve -> Grade
-workflow.add_edge("retrieve", "grade_documents")
+    # Retrieve -> Rerank and pack the context (unless RERANKER is "none")
+    ranked = "retrieve"
+    if settings.RERANKER != "none":
+        workflow.add_node("rerank", rerank)
+        workflow.add_edge("retrieve", "rerank")
+        ranked = "rerank"
 
-# Grade -> Generate
-# In a full agentic loop, we would add a conditional edge here:
-# If no docs are relevant -> Rewrite query.
-# For this step, we proceed linearly to Generation to ensure connectivity.
-workflow.add_edge("grade_documents", "generate")
+    # -> Grade, or straight to Generate when every hit scores above the accept threshold
+    workflow.add_conditional_edges(ranked, route_after_retrieve, ["grade_documents", "generate"])
 
-# Generate -> End
-workflow.add_edge("generate", END)
+    # Grade -> Generate if anything relevant is left,
+    # otherwise Rewrite (bounded by ROUTING_MAX_REWRITES) or a fixed "no context" answer
+    workflow.add_conditional_edges("grade_documents", route_after_grade, ["generate", "rewrite_query", "no_context"])
 
-# 4. Compile
-app = workflow.compile()
\ No newline at end of file
+    # Rewrite -> Retrieve again with the new query
+    workflow.add_edge("rewrite_query", "retrieve")
+
+    # Generate / No Context -> End (sessions: -> Remember -> End)
+    workflow.add_edge("generate", done)
+    workflow.add_edge("no_context", done)
+
+    # 4. Compile
+    return workflow.compile(checkpointer=checkpointer)
+
+# Stateless graph, for requests without a thread_id
+app = build_graph()
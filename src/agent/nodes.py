@@ -1,20 +1,22 @@
-from typing import Any, Dict, Literal
-from langchain_openai import ChatOpenAI
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+import numpy as np
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import Runnable, RunnableConfig
 from pydantic import BaseModel, Field
-from src.core.config import settings
+from src.core.concurrency import DeadlineExceeded, run_with_budget
+from src.core.config import GENERATE_PROMPT_NAMES, settings
+from src.core.container import get_deps
+from src.core.experiments import get_variant
+from src.core.metrics import CONTEXT_TOKENS, DEGRADED_REQUESTS, timed_stage
+from src.agent.rerank import hit_similarity, pack_context
 from src.agent.state import AgentState
-from src.agent.tools import retriever_tool
-
-# Initialize LLM
-# We use temperature=0 for deterministic outputs in logic nodes (grading)
-llm = ChatOpenAI(
-    model="gpt-4o-mini", 
-    temperature=0, 
-    api_key=settings.OPENAI_API_KEY
-)
+from src.agent.tools import retriever_tool, format_document
+
+logger = logging.getLogger(__name__)
 
 # --- DATA MODELS ---
 
@@ -25,13 +27,15 @@ class Grade(BaseModel):
     )
 
 # --- PROMPTS FOR A/B TESTING ---
+# Selected per request by the experiment variant's `prompt` (EXPERIMENT_VARIANTS)
 
-PROMPT_A = """You are a helpful assistant. Use the context to answer the question.
+# {history} is empty outside conversation sessions
+PROMPT_A = """{history}You are a helpful assistant. Use the context to answer the question.
 Context: {context}
 Question: {question}
 Answer:"""
 
-PROMPT_B = """You are a Senior MLOps Engineer named 'Dani-Bot'. 
+PROMPT_B = """{history}You are a Senior MLOps Engineer named 'Dani-Bot'. 
 You speak in a professional, direct, and technical tone. 
 Use the retrieved context to provide a concise, production-ready answer.
 If the context is missing, admit it immediately.
@@ -40,77 +44,355 @@ Context: {context}
 Question: {question}
 Answer:"""
 
+REWRITE_PROMPT = """You are improving a search query for a technical knowledge base.
+A search for the question below found no relevant documents.
+Rewrite it as a short, keyword-rich search query with the same intent. Return only the query.
+
+Question: {question}
+Previous search query: {query}
+Search query:"""
+
+SUMMARIZE_PROMPT = """Summarize this conversation between a user and an assistant in at most 150 words.
+Keep the topics, facts and decisions a follow-up question could refer to.
+
+Earlier summary: {summary}
+
+Conversation:
+{turns}
+
+Summary:"""
+
+GRADE_SYSTEM_PROMPT = """You are a grader assessing relevance of a retrieved document to a user question. \n 
+    If the document contains keyword(s) or semantic meaning related to the question, grade it as relevant. \n
+    Give a binary score 'yes' or 'no' score to indicate whether the document is relevant to the question."""
+
+# Returned without an LLM call when nothing relevant was found
+NO_CONTEXT_ANSWER = "I couldn't find anything in the knowledge base that answers this question."
+
+# --- CHAINS ---
+# Prompt templates are parsed once at import; chains are assembled once per
+# (stage, prompt, chat model) and reused by every request.
+
+GENERATE_PROMPTS = {
+    "A": ChatPromptTemplate.from_template(PROMPT_A),
+    "B": ChatPromptTemplate.from_template(PROMPT_B),
+}
+# Variants are checked against GENERATE_PROMPT_NAMES when settings load
+if set(GENERATE_PROMPTS) != set(GENERATE_PROMPT_NAMES):
+    raise RuntimeError("GENERATE_PROMPTS and config.GENERATE_PROMPT_NAMES are out of sync")
+
+GRADE_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", GRADE_SYSTEM_PROMPT),
+        ("human", "Retrieved document: \n\n {document} \n\n User question: {question}"),
+    ]
+)
+
+REWRITE_TEMPLATE = ChatPromptTemplate.from_template(REWRITE_PROMPT)
+
+SUMMARIZE_TEMPLATE = ChatPromptTemplate.from_template(SUMMARIZE_PROMPT)
+
+CHAIN_BUILDERS: Dict[str, Callable[[Any, str], Runnable]] = {
+    "generate": lambda llm, prompt: GENERATE_PROMPTS[prompt] | llm | StrOutputParser(),
+    # Use Pydantic model for structured output
+    "grade_documents": lambda llm, prompt: GRADE_PROMPT | llm.with_structured_output(Grade),
+    "rewrite_query": lambda llm, prompt: REWRITE_TEMPLATE | llm | StrOutputParser(),
+    "summarize": lambda llm, prompt: SUMMARIZE_TEMPLATE | llm | StrOutputParser(),
+}
+
+_chains: Dict[Tuple[str, str, Optional[str]], Tuple[Any, Runnable]] = {}
+
+def get_chain(stage: str, config: RunnableConfig, prompt: str = "A", model: Optional[str] = None) -> Runnable:
+    """
+    The compiled chain for a stage, built on the stage's chat model (or `model`)
+    from the run's dependencies.
+    """
+    llm = get_deps(config).llm_for(stage, model)
+    key = (stage, prompt, model)
+    compiled = _chains.get(key)
+    # Rebuilt only when the model changes (e.g. a run with other dependencies)
+    if compiled is None or compiled[0] is not llm:
+        compiled = _chains[key] = (llm, CHAIN_BUILDERS[stage](llm, prompt))
+    return compiled[1]
+
+# --- HELPERS ---
+
+def score_decision(doc: Document) -> Optional[bool]:
+    """
+    Relevance decided by score alone: True (keep) or False (drop) for a confident
+    score, None when the LLM grader has to decide. Reranked chunks use the
+    RERANK_* thresholds, others their vector similarity and the ROUTING_* ones.
+    """
+    score = doc.metadata.get("rerank_score")
+    if score is not None:
+        accept, reject = settings.RERANK_ACCEPT_SCORE, settings.RERANK_REJECT_SCORE
+    else:
+        score = hit_similarity(doc)
+        accept, reject = settings.ROUTING_ACCEPT_SIMILARITY, settings.ROUTING_REJECT_SIMILARITY
+    if score is None:
+        return None
+    if score >= accept:
+        return True
+    if score < reject:
+        return False
+    return None
+
+def is_degraded(config: Optional[RunnableConfig]) -> bool:
+    """True for requests admitted near capacity (`configurable.degraded`, see DEGRADED_UTILIZATION)."""
+    return bool(((config or {}).get("configurable") or {}).get("degraded"))
+
+def format_turns(turns: List[Dict[str, str]]) -> str:
+    return "\n".join(f"User: {t['question']}\nAssistant: {t['answer']}" for t in turns)
+
+def history_block(state: AgentState) -> str:
+    """The conversation so far, as a prompt prefix ("" outside sessions or on a thread's first turn)."""
+    summary, turns = state.get("summary"), state.get("history") or []
+    if not summary and not turns:
+        return ""
+    lines = ["Conversation so far:"]
+    if summary:
+        lines.append(f"(Summary of earlier turns: {summary})")
+    if turns:
+        lines.append(format_turns(turns))
+    return "\n".join(lines) + "\n\n"
+
 # --- NODES ---
 
-def retrieve(state: AgentState) -> Dict[str, Any]:
+@timed_stage("node.retrieve")
+async def retrieve(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
     """
     Node: Retrieves documents based on the question.
     """
-    print("---RETRIEVE---")
+    logger.debug("retrieve")
     question = state["question"]
+    # After a rewrite, search with the rewritten query (the precomputed vector is for the original)
+    search_query = state.get("search_query")
+    if not search_query and state.get("retrieved") is not None:
+        # Batch jobs search for all their questions at once (see src.agent.batch)
+        return {"documents": state["retrieved"], "question": question, "route": ["retrieve"]}
     # In a real scenario, we would use the vector store retriever here
     # For now, we invoke the tool directly
-    documents = [retriever_tool.invoke(question)]
-    return {"documents": documents, "question": question}
+    documents = await retriever_tool.ainvoke(
+        {"query": search_query or question, "query_vector": None if search_query else state.get("query_vector")},
+        config=config,
+    )
+    return {"documents": documents, "question": question, "route": ["retrieve"]}
+
+@timed_stage("node.rerank")
+async def rerank(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+    """
+    Node: Rescores the retrieved candidates with the reranker and packs the best
+    into the context budget (CONTEXT_MAX_*), dropping near-duplicates.
+    """
+    deps = get_deps(config)
+    candidates = state["documents"]
+    query = state.get("search_query") or state["question"]
 
-def generate(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+    reranker = deps.reranker
+    if reranker is not None and candidates:
+        if reranker.blocking:
+            scores = await asyncio.to_thread(reranker.score, query, candidates)
+        else:
+            scores = reranker.score(query, candidates)
+        for doc, score in zip(candidates, scores):
+            doc.metadata["rerank_score"] = score
+        candidates = sorted(candidates, key=lambda d: d.metadata["rerank_score"], reverse=True)
+
+    documents, tokens = pack_context(
+        candidates, deps.embeddings.count_tokens, format_document, max_documents=get_variant(config).top_k
+    )
+    CONTEXT_TOKENS.observe(tokens)
+    logger.debug("rerank: packed", extra={"candidates": len(candidates), "packed": len(documents), "tokens": tokens})
+    return {"documents": documents, "route": ["rerank"]}
+
+@timed_stage("node.generate")
+async def generate(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
     """
-    Node: Generates an answer using the retrieved documents and selected Strategy.
+    Node: Generates an answer using the retrieved documents and the experiment variant's prompt and model.
     """
-    print("---GENERATE---")
+    logger.debug("generate")
     question = state["question"]
     documents = state["documents"]
     
-    # Read strategy from config (default to 'A')
-    strategy = config.get("configurable", {}).get("strategy", "A")
-    print(f"--- USING STRATEGY: {strategy} ---")
+    # Read the variant from config (service defaults outside experiments)
+    variant = get_variant(config)
+    logger.debug("generate: variant selected", extra={"strategy": config.get("configurable", {}).get("strategy")})
     
     # Select Template
-    template = PROMPT_B if strategy == "B" else PROMPT_A
-    
-    prompt = ChatPromptTemplate.from_template(template)
-    rag_chain = prompt | llm | StrOutputParser()
+    rag_chain = get_chain("generate", config, variant.prompt, variant.model)
     
-    generation = rag_chain.invoke({"context": documents, "question": question})
-    return {"generation": generation}
+    context = "\n\n".join(format_document(d) for d in documents)
+    generation = await run_with_budget("generate", rag_chain.ainvoke(
+        {"context": context, "question": question, "history": history_block(state)}
+    ))
+    return {"generation": generation, "route": ["generate"]}
 
-def grade_documents(state: AgentState) -> Dict[str, Any]:
+@timed_stage("node.grade_documents")
+async def grade_documents(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
     """
     Node: Determines whether the retrieved documents are relevant to the question.
+    Only hits whose score is between the reject and accept thresholds (or that have
+    no score) go to the LLM grader, see `score_decision`. In degraded mode, or when
+    the grader exceeds its budget, those hits are kept ungraded.
     """
-    print("---CHECK RELEVANCE---")
+    logger.debug("grade_documents")
     question = state["question"]
     documents = state["documents"]
     
-    # Score each doc
-    filtered_docs = []
-    
-    # Prompt for grading
-    system = """You are a grader assessing relevance of a retrieved document to a user question. \n 
-    If the document contains keyword(s) or semantic meaning related to the question, grade it as relevant. \n
-    Give a binary score 'yes' or 'no' score to indicate whether the document is relevant to the question."""
-    
-    grade_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", system),
-            ("human", "Retrieved document: \n\n {document} \n\n User question: {question}"),
-        ]
-    )
+    # Confident hits are decided by score alone
+    keep: Dict[int, bool] = {}
+    uncertain = []
+    for i, d in enumerate(documents):
+        decision = score_decision(d)
+        if decision is None:
+            uncertain.append(i)
+        else:
+            keep[i] = decision
+    logger.debug("grade_documents: split by score", extra={"decided_by_score": len(keep), "sent_to_grader": len(uncertain)})
     
-    # Use Pydantic model for structured output
-    grader_llm = llm.with_structured_output(Grade)
+    if uncertain and is_degraded(config):
+        # Overload: keep what the score didn't reject rather than queue more LLM calls
+        logger.debug("grade_documents: degraded, grader skipped")
+        keep.update((i, True) for i in uncertain)
+    elif uncertain:
+        grader_chain = get_chain("grade_documents", config)
+        # Grade every chunk concurrently: latency is one LLM round-trip, not one per chunk
+        try:
+            grade_results = await run_with_budget("grade_documents", grader_chain.abatch(
+                [{"question": question, "document": documents[i].page_content} for i in uncertain],
+                config={"max_concurrency": settings.GRADER_MAX_CONCURRENCY},
+            ))
+        except DeadlineExceeded:
+            raise
+        except asyncio.TimeoutError:
+            # A saturated grader degrades the answer instead of failing the request
+            logger.warning("Grader over budget, keeping ungraded chunks", extra={"chunks": len(uncertain)})
+            DEGRADED_REQUESTS.labels("grader_timeout").inc()
+            keep.update((i, True) for i in uncertain)
+        else:
+            for i, grade_result in zip(uncertain, grade_results):
+                # grader_chain now returns a Grade object (Pydantic model)
+                keep[i] = grade_result.score == "yes"
     
-    grader_chain = grade_prompt | grader_llm
+    # Score each doc
+    filtered_docs = []
     
-    for d in documents:
-        # grader_chain now returns a Grade object (Pydantic model)
-        grade_result = grader_chain.invoke({"question": question, "document": d})
-        score = grade_result.score
-        
-        if score == "yes":
-            print("---GRADE: DOCUMENT RELEVANT---")
+    for i, d in enumerate(documents):
+        if keep[i]:
             filtered_docs.append(d)
-        else:
-            print("---GRADE: DOCUMENT NOT RELEVANT---")
+        logger.debug("grade_documents: graded", extra={"chunk_id": d.metadata.get("id"), "relevant": keep[i]})
             
-    return {"documents": filtered_docs, "question": question}
\ No newline at end of file
+    return {"documents": filtered_docs, "question": question, "route": ["grade_documents"]}
+
+@timed_stage("node.rewrite_query")
+async def rewrite_query(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+    """
+    Node: Rewrites the search query after a retrieval that found nothing relevant.
+    The original question is kept for answering.
+    """
+    logger.debug("rewrite_query")
+    question = state["question"]
+    
+    rewrite_chain = get_chain("rewrite_query", config)
+    search_query = await run_with_budget("rewrite_query", rewrite_chain.ainvoke(
+        {"question": question, "query": state.get("search_query") or question}
+    ))
+    logger.debug("rewrite_query: rewritten", extra={"search_query": search_query})
+    return {
+        "search_query": search_query.strip(),
+        "rewrites": state.get("rewrites", 0) + 1,
+        "route": ["rewrite_query"],
+    }
+
+@timed_stage("node.recall")
+async def recall(state: AgentState) -> Dict[str, Any]:
+    """
+    Node (sessions): Reuses the chunks already retrieved and graded for an earlier
+    turn of the thread, instead of retrieving and grading again.
+    """
+    logger.debug("recall: reusing session documents", extra={"documents": len(state["session_documents"])})
+    return {"documents": state["session_documents"], "route": ["recall"]}
+
+async def summarize(summary: str, turns: List[Dict[str, str]], config: RunnableConfig) -> str:
+    """Folds `turns` into the running summary. On failure the turns are dropped and the summary kept."""
+    try:
+        folded = await run_with_budget("summarize", get_chain("summarize", config).ainvoke(
+            {"summary": summary or "(none)", "turns": format_turns(turns)}
+        ))
+    except Exception as e:
+        logger.warning("Session summary failed, dropping old turns", extra={"error": str(e)})
+        return summary
+    return folded.strip()[:settings.SESSION_SUMMARY_MAX_CHARS]
+
+@timed_stage("node.remember")
+async def remember(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+    """
+    Node (sessions): Records the turn and bounds the session state: keeps the last
+    SESSION_MAX_TURNS turns verbatim (older ones are summarized) and the graded
+    chunks behind the latest grounded answer. Not part of the route.
+    """
+    turns = (state.get("history") or []) + [
+        {"question": state["question"], "answer": state["generation"][:settings.SESSION_TURN_MAX_CHARS]}
+    ]
+    # The query vector is per turn; only the one that found the session's chunks is kept
+    update: Dict[str, Any] = {"history": turns, "query_vector": None}
+
+    route = state["route"]
+    if route and route[-1] == "generate" and "recall" not in route and state.get("query_vector"):
+        update["session_documents"] = state["documents"][:settings.SESSION_MAX_DOCUMENTS]
+        update["session_vector"] = state["query_vector"]
+
+    if len(turns) > settings.SESSION_MAX_TURNS:
+        # Summarize half a window at a time, so the LLM call happens every few turns, not every turn
+        keep = max(1, settings.SESSION_MAX_TURNS // 2)
+        update["history"] = turns[-keep:]
+        update["summary"] = await summarize(state.get("summary", ""), turns[:-keep], config)
+    return update
+
+@timed_stage("node.no_context")
+async def no_context(state: AgentState) -> Dict[str, Any]:
+    """
+    Node: Answers immediately, without an LLM call, when no relevant context was found.
+    """
+    logger.debug("no_context")
+    return {"generation": NO_CONTEXT_ANSWER, "route": ["no_context"]}
+
+# --- EDGES ---
+
+def route_start(state: AgentState) -> Literal["recall", "retrieve"]:
+    """
+    Sessions: reuses the thread's graded chunks when the question is close enough
+    (SESSION_REUSE_SIMILARITY) to the one that retrieved them; otherwise retrieves.
+    """
+    previous, current = state.get("session_vector"), state.get("query_vector")
+    if not state.get("session_documents") or previous is None or current is None:
+        return "retrieve"
+    a, b = np.asarray(previous), np.asarray(current)
+    similarity = float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) or 1.0))
+    if similarity >= settings.SESSION_REUSE_SIMILARITY:
+        logger.debug("route: follow-up, reusing session documents", extra={"similarity": round(similarity, 3)})
+        return "recall"
+    return "retrieve"
+
+def route_after_retrieve(state: AgentState) -> Literal["grade_documents", "generate"]:
+    """
+    Skips grading when every hit (after reranking, when enabled) is accepted by score.
+    """
+    decisions = [score_decision(d) for d in state["documents"]]
+    if decisions and all(decisions):
+        logger.debug("route: high confidence, skipping grader")
+        return "generate"
+    return "grade_documents"
+
+def route_after_grade(state: AgentState, config: RunnableConfig) -> Literal["generate", "rewrite_query", "no_context"]:
+    """
+    Generates when anything relevant is left; otherwise rewrites the query
+    (up to ROUTING_MAX_REWRITES times, never in degraded mode) or answers that there is no context.
+    """
+    if state["documents"]:
+        return "generate"
+    if state.get("rewrites", 0) < settings.ROUTING_MAX_REWRITES and not is_degraded(config):
+        logger.debug("route: nothing relevant, rewriting query")
+        return "rewrite_query"
+    logger.debug("route: nothing relevant, no context answer")
+    return "no_context"
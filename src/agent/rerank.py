@@ -0,0 +1,178 @@
+import importlib
+import importlib.util
+import logging
+import math
+import re
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional, Sequence, Set, Tuple
+from langchain_core.documents import Document
+from src.core.config import settings
+from src.ingestion.bm25 import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Reranking and context packing between retrieval and generation.
+# The retriever returns RERANK_CANDIDATES hits in ANN order; a reranker rescores
+# them against the query, and `pack_context` keeps the best ones that fit the
+# prompt's context budget, skipping near-duplicates.
+
+
+def hit_similarity(doc: Document) -> Optional[float]:
+    """Cosine similarity of a retrieved chunk to the query (None if it has no vector score, e.g. BM25-only)."""
+    distance = doc.metadata.get("distance")
+    if distance is None:
+        return None
+    return settings.index_profile.similarity(distance)
+
+
+class Reranker(ABC):
+    """
+    Scores retrieved chunks against a query. Implement this to plug in another model.
+    Scores are in [0, 1], higher is more relevant, so RERANK_ACCEPT_SCORE and
+    RERANK_REJECT_SCORE apply to any reranker.
+    """
+    # True when scoring is CPU-heavy (a model) and must be run off the event loop
+    blocking: bool = False
+
+    @abstractmethod
+    def score(self, query: str, documents: Sequence[Document]) -> List[float]:
+        """One score per document, in input order."""
+
+
+class LexicalReranker(Reranker):
+    """
+    No model: the IDF-weighted share of the query's terms found in each chunk
+    (IDF over the candidate set, counting the terms found in any candidate), blended with the chunk's vector similarity
+    (RERANK_LEXICAL_WEIGHT). Catches exact identifiers the embedding misses.
+    """
+
+    def __init__(self, lexical_weight: Optional[float] = None):
+        self.lexical_weight = settings.RERANK_LEXICAL_WEIGHT if lexical_weight is None else lexical_weight
+
+    def score(self, query: str, documents: Sequence[Document]) -> List[float]:
+        query_terms = set(tokenize(query))
+        pattern = self._terms_pattern(query_terms)
+        doc_terms = [self._matched_terms(pattern, query_terms, d.page_content) for d in documents]
+        n = len(documents)
+        idf = {}
+        for term in query_terms:
+            df = sum(term in terms for terms in doc_terms)
+            # Terms no candidate contains ("explain", "about") can't tell candidates apart
+            if df:
+                idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        total = sum(idf.values())
+
+        scores = []
+        for doc, terms in zip(documents, doc_terms):
+            coverage = sum(w for term, w in idf.items() if term in terms) / total if total else 0.0
+            similarity = hit_similarity(doc)
+            if similarity is None:
+                # BM25-only hit (hybrid mode): no vector score to blend with
+                scores.append(coverage)
+            else:
+                scores.append(self.lexical_weight * coverage + (1 - self.lexical_weight) * max(similarity, 0.0))
+        return scores
+
+    @staticmethod
+    def _terms_pattern(query_terms: Set[str]) -> Optional[re.Pattern]:
+        if not query_terms:
+            return None
+        alternatives = "|".join(re.escape(t) for t in sorted(query_terms, key=len, reverse=True))
+        return re.compile(rf"(?<![a-z0-9])(?:{alternatives})(?![a-z0-9])")
+
+    @staticmethod
+    def _matched_terms(pattern: Optional[re.Pattern], query_terms: Set[str], text: str) -> Set[str]:
+        """
+        The query terms found in `text` as whole words or identifier parts.
+        One regex scan per chunk: much cheaper than tokenizing every candidate.
+        """
+        if pattern is None:
+            return set()
+        # A matched identifier also contains its parts (milvus_uri -> milvus, uri)
+        return {t for term in set(pattern.findall(text.lower())) for t in tokenize(term)} & query_terms
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    A sentence-transformers cross-encoder (RERANK_MODEL) on CPU: reads query and
+    chunk together, so it ranks better than either score alone. Single-label
+    models return sigmoid scores in [0, 1].
+    """
+    blocking = True
+
+    def __init__(self, model_name: Optional[str] = None):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name or settings.RERANK_MODEL, device="cpu")
+
+    def score(self, query: str, documents: Sequence[Document]) -> List[float]:
+        if not documents:
+            return []
+        scores = self.model.predict([(query, d.page_content) for d in documents], batch_size=settings.RERANK_BATCH_SIZE)
+        return [float(s) for s in scores]
+
+
+def build_reranker() -> Optional[Reranker]:
+    """Builds the reranker selected by RERANKER (None for "none": retrieval order is kept)."""
+    name = settings.RERANKER
+    if name == "none":
+        return None
+    if name == "lexical":
+        return LexicalReranker()
+    if name == "cross_encoder":
+        if importlib.util.find_spec("sentence_transformers") is None:
+            logger.warning("RERANKER=cross_encoder needs 'sentence-transformers'; using the lexical reranker "
+                           "(pip install 'rag-ops-system[rerank]')")
+            return LexicalReranker()
+        return CrossEncoderReranker()
+    if ":" in name:
+        module, _, factory = name.partition(":")
+        return getattr(importlib.import_module(module), factory)()
+    raise ValueError(f"Unknown RERANKER '{name}'")
+
+
+def _shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    terms = tokenize(text)
+    if len(terms) < size:
+        return {tuple(terms)}
+    return {tuple(terms[i:i + size]) for i in range(len(terms) - size + 1)}
+
+
+def _jaccard(a: Set, b: Set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def pack_context(
+    documents: Sequence[Document],
+    count_tokens: Callable[[str], int],
+    render: Callable[[Document], str],
+    max_documents: Optional[int] = None,
+) -> Tuple[List[Document], int]:
+    """
+    Takes documents best first (they must already be sorted) until `max_documents`
+    (default CONTEXT_MAX_DOCUMENTS) or CONTEXT_MAX_TOKENS of rendered context. Skips chunks below RERANK_REJECT_SCORE
+    and near-duplicates (word-shingle Jaccard >= CONTEXT_DEDUP_SIMILARITY) of a packed one;
+    a chunk that doesn't fit is skipped, and a smaller one after it may still be packed.
+    The best chunk is always packed, even over budget. Returns (packed, tokens).
+    """
+    max_documents = max_documents or settings.CONTEXT_MAX_DOCUMENTS
+    packed: List[Document] = []
+    packed_shingles: List[Set] = []
+    tokens = 0
+    for doc in documents:
+        if len(packed) >= max_documents:
+            break
+        score = doc.metadata.get("rerank_score")
+        if score is not None and score < settings.RERANK_REJECT_SCORE:
+            # Sorted best first: everything after this one would be rejected too
+            break
+        shingles = _shingles(doc.page_content)
+        if any(_jaccard(shingles, s) >= settings.CONTEXT_DEDUP_SIMILARITY for s in packed_shingles):
+            continue
+        size = count_tokens(render(doc))
+        if packed and tokens + size > settings.CONTEXT_MAX_TOKENS:
+            continue
+        packed.append(doc)
+        packed_shingles.append(shingles)
+        tokens += size
+    return packed, tokens
@@ -0,0 +1,146 @@
+import asyncio
+import importlib
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, Optional
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from src.core.config import settings
+
+if TYPE_CHECKING:
+    from src.core.container import Container
+
+logger = logging.getLogger(__name__)
+
+# Checkpoint storage for conversation sessions. The session graph (see
+# src.agent.graph.build_graph) saves its state once per turn under the request's
+# thread_id; the next turn of the thread resumes from it. Threads keep only their
+# latest checkpoint in stores that can be pruned (see prune_thread), and threads idle
+# for SESSION_TTL_SECONDS are deleted.
+
+def build_checkpointer() -> BaseCheckpointSaver:
+    """Builds the checkpointer selected by SESSION_STORE. Connections are opened on first use."""
+    store = settings.SESSION_STORE
+    if store == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        return InMemorySaver()
+    if store == "sqlite":
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        # Not awaited here: the saver connects on first use, from the serving event loop
+        return AsyncSqliteSaver(aiosqlite.connect(settings.SESSION_DB_PATH, check_same_thread=False))
+    if ":" in store:
+        module, _, factory = store.partition(":")
+        return getattr(importlib.import_module(module), factory)()
+    raise ValueError(f"Unknown SESSION_STORE '{store}'")
+
+# Last activity per thread, kept next to the SQLite checkpoints so expiry is one indexed query
+_ACTIVITY_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS session_activity (thread_id TEXT PRIMARY KEY, last_active REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS session_activity_last_active ON session_activity (last_active)",
+)
+
+def _sqlite_saver(checkpointer: BaseCheckpointSaver):
+    """The checkpointer if it is an AsyncSqliteSaver, else None."""
+    try:
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError:
+        return None
+    return checkpointer if isinstance(checkpointer, AsyncSqliteSaver) else None
+
+async def prune_thread(checkpointer: BaseCheckpointSaver, thread_id: str):
+    """
+    Keeps only the latest checkpoint of a thread, which is all the next turn needs,
+    so stored sessions grow with the number of threads, not turns.
+    With SQLite, the older checkpoints and their writes are deleted, and the thread's
+    last activity recorded, in one transaction: a crash or a concurrent turn of the
+    thread never loses the latest checkpoint. Other stores are pruned by their own
+    `aprune` where they have one; the rest keep their history until the thread
+    expires (the state itself stays bounded by SESSION_MAX_TURNS).
+    """
+    sqlite = _sqlite_saver(checkpointer)
+    if sqlite is None:
+        try:
+            await checkpointer.aprune([thread_id], strategy="keep_latest")
+        except NotImplementedError:
+            pass
+        return
+    await sqlite.setup()
+    async with sqlite.lock, sqlite.conn.cursor() as cur:
+        for statement in _ACTIVITY_SCHEMA:
+            await cur.execute(statement)
+        # Checkpoint IDs are time-ordered (the saver itself reads the latest as the greatest)
+        await cur.execute(
+            "SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ''", (thread_id,)
+        )
+        (latest,) = await cur.fetchone()
+        if latest is not None:
+            for table in ("checkpoints", "writes"):
+                await cur.execute(f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_id < ?", (thread_id, latest))
+        await cur.execute(
+            "INSERT OR REPLACE INTO session_activity (thread_id, last_active) VALUES (?, ?)", (thread_id, time.time())
+        )
+        await sqlite.conn.commit()
+
+async def _expire_sqlite(checkpointer, cutoff: float) -> int:
+    """Deletes the SQLite threads last active before `cutoff`, in one transaction."""
+    await checkpointer.setup()
+    async with checkpointer.lock, checkpointer.conn.cursor() as cur:
+        for statement in _ACTIVITY_SCHEMA:
+            await cur.execute(statement)
+        for table in ("checkpoints", "writes"):
+            await cur.execute(
+                f"DELETE FROM {table} WHERE thread_id IN "
+                "(SELECT thread_id FROM session_activity WHERE last_active < ?)",
+                (cutoff,),
+            )
+        await cur.execute("DELETE FROM session_activity WHERE last_active < ?", (cutoff,))
+        expired = cur.rowcount
+        await checkpointer.conn.commit()
+    return expired
+
+async def expire_sessions(checkpointer: BaseCheckpointSaver, ttl_seconds: Optional[float] = None) -> int:
+    """
+    Deletes the threads idle for longer than SESSION_TTL_SECONDS, in any store.
+    Returns the number of threads deleted. With SQLite this reads only the threads'
+    recorded last activity (see prune_thread); other stores are scanned.
+    """
+    ttl_seconds = settings.SESSION_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    sqlite = _sqlite_saver(checkpointer)
+    if sqlite is not None:
+        expired = await _expire_sqlite(sqlite, time.time() - ttl_seconds)
+        if expired:
+            logger.info("Expired sessions deleted", extra={"threads": expired})
+        return expired
+
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ttl_seconds)
+    last_active: Dict[str, datetime] = {}
+    async for item in checkpointer.alist(None):
+        thread_id = item.config["configurable"]["thread_id"]
+        ts = datetime.fromisoformat(item.checkpoint["ts"])
+        if thread_id not in last_active or ts > last_active[thread_id]:
+            last_active[thread_id] = ts
+    expired = [thread_id for thread_id, ts in last_active.items() if ts < cutoff]
+    for thread_id in expired:
+        await checkpointer.adelete_thread(thread_id)
+    if expired:
+        logger.info("Expired sessions deleted", extra={"threads": len(expired), "remaining": len(last_active) - len(expired)})
+    return len(expired)
+
+async def run_session_expiry(deps: "Container", interval: Optional[float] = None):
+    """Expires sessions every SESSION_EXPIRY_INTERVAL_SECONDS until cancelled (API lifespan)."""
+    interval = settings.SESSION_EXPIRY_INTERVAL_SECONDS if interval is None else interval
+    if settings.SESSION_TTL_SECONDS <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await expire_sessions(deps.checkpointer)
+        except Exception as e:
+            logger.warning("Session expiry failed", extra={"error": str(e)})
+
+async def close_checkpointer(checkpointer: BaseCheckpointSaver):
+    """Closes the SQLite connection (a no-op if it was never opened)."""
+    sqlite = _sqlite_saver(checkpointer)
+    if sqlite is not None:
+        await sqlite.conn.close()
@@ -1,4 +1,6 @@
-from typing import TypedDict, List
+import operator
+from typing import Annotated, Dict, TypedDict, List, Optional
+from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage
 
 class AgentState(TypedDict):
@@ -8,8 +10,28 @@ class AgentState(TypedDict):
     Attributes:
         question (str): The user's input question.
         generation (str): The LLM's generated response.
-        documents (List[str]): Retrieved documents context.
+        documents (List[Document]): Retrieved chunks, one per search hit.
+        query_vector (Optional[List[float]]): Question embedding, if the caller already computed it.
+        retrieved (Optional[List[Document]]): Hits for the question, if the caller already searched (batch jobs).
+        search_query (Optional[str]): Rewritten query used for retrieval after a failed attempt.
+        rewrites (int): Number of query rewrites so far.
+        route (List[str]): Nodes visited, in order (appended to by each node).
+
+    Session fields, kept across the turns of a thread (session graph only):
+        history (List[Dict[str, str]]): Recent turns, {"question", "answer"}, oldest first.
+        summary (str): Summary of the turns trimmed from `history`.
+        session_documents (List[Document]): Relevant chunks behind the last grounded answer.
+        session_vector (Optional[List[float]]): Embedding of the question that retrieved them.
     """
     question: str
     generation: str
-    documents: List[str]
\ No newline at end of file
+    documents: List[Document]
+    query_vector: Optional[List[float]]
+    retrieved: Optional[List[Document]]
+    search_query: Optional[str]
+    rewrites: int
+    route: Annotated[List[str], operator.add]
+    history: List[Dict[str, str]]
+    summary: str
+    session_documents: List[Document]
+    session_vector: Optional[List[float]]
@@ -1,50 +1,133 @@
-from langchain_core.tools import tool
-from src.ingestion.milvus_client import MilvusHandler
-from src.ingestion.embeddings import EmbeddingService
+import asyncio
+from typing import Annotated, List, Optional, Sequence, Tuple
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import InjectedToolArg, tool
+from src.core.config import Variant, settings
+from src.core.container import get_deps
+from src.core.experiments import get_variant
+from src.core.metrics import track_stage
+from src.ingestion.bm25 import reciprocal_rank_fusion
 
-# Initialize singletons outside the function to avoid reconnecting on every call
-milvus_handler = MilvusHandler()
-embedding_service = EmbeddingService()
+def format_document(doc: Document) -> str:
+    """Renders a retrieved chunk the way it is shown to the LLM and returned to clients."""
+    return f"Content: {doc.page_content}\nSource: {doc.metadata.get('source')}"
+
+def fuse_hits(dense_hits: Sequence, sparse_hits: Sequence[Tuple[str, str, str, float]], limit: int) -> List[Document]:
+    """
+    Merges dense (Milvus) and sparse (BM25) hit lists with weighted reciprocal-rank
+    fusion. Ranks, not raw scores, are fused: cosine/L2 distances and BM25 scores
+    live on incomparable scales.
+    """
+    fused = reciprocal_rank_fusion(
+        [
+            ([hit.id for hit in dense_hits], settings.HYBRID_DENSE_WEIGHT),
+            ([chunk_id for chunk_id, _, _, _ in sparse_hits], settings.HYBRID_SPARSE_WEIGHT),
+        ],
+        k=settings.HYBRID_RRF_K,
+    )
+
+    documents = {}
+    for hit in dense_hits:
+        documents[hit.id] = Document(
+            page_content=hit.entity.get("text"),
+            metadata={"id": hit.id, "source": hit.entity.get("source"), "distance": hit.distance},
+        )
+    for chunk_id, text, source, score in sparse_hits:
+        doc = documents.setdefault(chunk_id, Document(page_content=text, metadata={"id": chunk_id, "source": source}))
+        doc.metadata["bm25_score"] = score
+
+    ranked = sorted(fused, key=fused.get, reverse=True)[:limit]
+    for chunk_id in ranked:
+        documents[chunk_id].metadata["rrf_score"] = fused[chunk_id]
+    return [documents[chunk_id] for chunk_id in ranked]
+
+def search_limits(variant: Variant) -> Tuple[int, int]:
+    """(chunks returned, dense search limit) for a variant."""
+    # With a reranker, a wide candidate set: the rerank node picks what reaches the prompt
+    if settings.RERANKER == "none":
+        top_k = variant.top_k or settings.RETRIEVER_TOP_K
+    else:
+        top_k = settings.RERANK_CANDIDATES
+    limit = max(settings.HYBRID_CANDIDATES, top_k) if settings.RETRIEVAL_MODE == "hybrid" else top_k
+    return top_k, limit
+
+def hit_documents(hits: Sequence) -> List[Document]:
+    """Milvus hits as Documents, one per hit, so each chunk can be graded (and dropped) on its own."""
+    return [
+        Document(
+            page_content=hit.entity.get("text"),
+            metadata={"id": hit.id, "source": hit.entity.get("source"), "distance": hit.distance},
+        )
+        for hit in hits
+    ]
 
 @tool
-def retriever_tool(query: str) -> str:
+async def retriever_tool(
+    query: str,
+    query_vector: Annotated[Optional[List[float]], InjectedToolArg] = None,
+    config: RunnableConfig = None,
+) -> List[Document]:
     """
     Search the knowledge base for documents relevant to the query.
-    Returns the top 3 most relevant text chunks.
+    Returns the most relevant text chunks, one Document per hit.
     """
-    try:
-        # 1. Embed Query
-        query_vector = embedding_service.embed_query(query)
-        
-        # 2. Search Milvus
-        collection = milvus_handler.get_collection()
-        
-        search_params = {
-            "metric_type": "L2",
-            "params": {"nprobe": 10}, 
-        }
-        
-        results = collection.search(
-            data=[query_vector],
-            anns_field="vector",
-            param=search_params,
-            limit=3,
+    # Embedding and search errors propagate: the request fails with a status that says why,
+    # rather than the error text being handed to the LLM as a "document"
+    # Clients come from the run's config (or the process-wide container)
+    deps = get_deps(config)
+    # Experiment variants may change top-k and the index search params
+    variant = get_variant(config)
+    top_k, limit = search_limits(variant)
+
+    async def dense_search():
+        # 1. Embed Query (skipped when the caller already embedded it)
+        vector = query_vector
+        if vector is None:
+            vector = await deps.embeddings.aembed_query(query)
+
+        # 2. Search Milvus (off the event loop) with the active index profile
+        # (micro-batched with concurrent requests into one multi-vector search)
+        return await deps.milvus.asearch_one(
+            vector,
+            param=deps.milvus.search_params(variant.search_params),
+            limit=limit,
             output_fields=["text", "source"]
         )
-        
-        # 3. Format Results
-        # Milvus returns a 2D list (one list of hits per query)
-        hits = results[0]
-        
-        if not hits:
-            return "No relevant documents found in the database."
-            
-        formatted_docs = []
-        for hit in hits:
-            # hit.entity.get("text") retrieves the scalar field
-            formatted_docs.append(f"Content: {hit.entity.get('text')}\nSource: {hit.entity.get('source')}")
-            
-        return "\n\n".join(formatted_docs)
-        
-    except Exception as e:
-        return f"Error connecting to vector database: {str(e)}"
\ No newline at end of file
+
+    async def sparse_search():
+        with track_stage("bm25_search"):
+            return await asyncio.to_thread(deps.bm25.search, query, max(settings.HYBRID_CANDIDATES, top_k))
+
+    if settings.RETRIEVAL_MODE == "hybrid":
+        # BM25 doesn't need the embedding, so it runs alongside embed + vector search
+        hits, sparse_hits = await asyncio.gather(dense_search(), sparse_search())
+        return fuse_hits(hits, sparse_hits, top_k)
+
+    # 3. Format Results
+    return hit_documents(await dense_search())
+
+async def retrieve_many(queries: Sequence[str], vectors: Sequence[List[float]], config: RunnableConfig) -> List[List[Document]]:
+    """
+    `retriever_tool` for many queries at once (batch jobs), with their embeddings:
+    one multi-vector Milvus search per BATCH_SEARCH_SIZE queries. Returns one
+    document list per query, in order.
+    """
+    deps = get_deps(config)
+    variant = get_variant(config)
+    top_k, limit = search_limits(variant)
+    param = deps.milvus.search_params(variant.search_params)
+    size = settings.BATCH_SEARCH_SIZE
+    results = await asyncio.gather(*(
+        deps.milvus.asearch(list(vectors[i:i + size]), param=param, limit=limit, output_fields=["text", "source"])
+        for i in range(0, len(vectors), size)
+    ))
+    dense = [hits for result in results for hits in result]
+
+    if settings.RETRIEVAL_MODE == "hybrid":
+        with track_stage("bm25_search"):
+            sparse = await asyncio.to_thread(
+                lambda: [deps.bm25.search(q, max(settings.HYBRID_CANDIDATES, top_k)) for q in queries]
+            )
+        return [fuse_hits(hits, sparse_hits, top_k) for hits, sparse_hits in zip(dense, sparse)]
+    return [hit_documents(hits) for hits in dense]
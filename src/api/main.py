@@ -1,17 +1,86 @@
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 from src.core.config import settings
+from src.core.log import setup_logging
+from src.core.metrics import RequestMetricsMiddleware, StatsCollector
 from src.api.routes import router
 from src.core.monitoring import setup_monitoring
+from src.core.telemetry import telemetry
+from src.core.experiments import variant_stats
+from src.core.admission import admission
+from src.core.container import container
+from src.agent.sessions import run_session_expiry
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+def _stats(name: str, stats_fn):
+    """Reads a component's stats at scrape time, if it has been built (scrapes never build clients)."""
+    def collect():
+        component = container.built(name)
+        return stats_fn(component) if component is not None else None
+    return collect
+
+# Cache and batching counters are read from the components at scrape time
+REGISTRY.register(StatsCollector(
+    "rag_semantic_cache", _stats("semantic_cache", lambda cache: cache.stats()),
+    counter_keys=("hits", "misses"),
+))
+REGISTRY.register(StatsCollector(
+    "rag_embedding_cache",
+    _stats("embeddings", lambda service: service.cache.stats() if service.cache is not None else None),
+    counter_keys=("memory_hits", "disk_hits", "misses"),
+))
+REGISTRY.register(StatsCollector(
+    "rag_embedding_batching", _stats("embeddings", lambda service: service.query_batcher.stats()),
+    counter_keys=("batches", "items", "coalesced"),
+))
+REGISTRY.register(StatsCollector(
+    "rag_search_batching", _stats("milvus", lambda handler: handler.batching_stats()),
+    counter_keys=("batches", "items", "coalesced"),
+))
+
+# Admission control: in-flight and queued requests, and requests turned away (429/503)
+REGISTRY.register(StatsCollector(
+    "rag_admission", admission.stats,
+    counter_keys=("admitted", "queued", "degraded", "rejected_queue_full", "rejected_queue_timeout"),
+))
+
+async def _warm_up(app: FastAPI):
+    # MLflow setup (mostly the mlflow import) runs off the loop, next to the client warm-up
+    try:
+        await asyncio.gather(asyncio.to_thread(setup_monitoring), container.warm_up())
+    except Exception as e:
+        logger.error("MLflow monitoring setup failed", extra={"error": str(e)})
+    app.state.warmed_up = True
 
 # Lifespan context manager for startup/shutdown logic
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    setup_monitoring()
+    app.state.warmed_up = False
+    telemetry.start()
+    # Warm up in the background: the server (and /health) comes up immediately,
+    # /ready reports 503 until monitoring is set up, the collection is loaded and the clients are ready
+    warm_up = asyncio.create_task(_warm_up(app))
+    # Per-variant experiment aggregates, handed to the telemetry exporter periodically
+    experiment_flusher = asyncio.create_task(variant_stats.run())
+    # Deletes conversation sessions idle for SESSION_TTL_SECONDS
+    session_expiry = asyncio.create_task(run_session_expiry(container))
     yield
-    # Shutdown (if needed)
+    # Shutdown: flush the last aggregates and queued telemetry (spilling what cannot be sent in time),
+    # close pooled connections
+    warm_up.cancel()
+    session_expiry.cancel()
+    experiment_flusher.cancel()
+    await asyncio.gather(experiment_flusher, return_exceptions=True)
+    await asyncio.to_thread(telemetry.stop)
+    await container.aclose()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -27,8 +96,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(RequestMetricsMiddleware)
+
 app.include_router(router, prefix=settings.API_V1_STR)
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "environment": settings.ENVIRONMENT}
\ No newline at end of file
+    return {"status": "ok", "environment": settings.ENVIRONMENT}
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe: warm-up has finished and the Milvus collection is loaded and searchable.
+    """
+    ready = getattr(app.state, "warmed_up", False) and await asyncio.to_thread(lambda: container.milvus.is_ready())
+    if not ready:
+        return JSONResponse(status_code=503, content={"status": "not_ready"})
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms, token/cost counters
+    per A/B strategy, cache and batching counters.
+    """
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -1,47 +1,317 @@
-import random
-import mlflow
-from fastapi import APIRouter, HTTPException
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from langchain_core.runnables import RunnableConfig
-from src.api.schemas import QueryRequest, QueryResponse
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.types import Overwrite
+from src.api.schemas import BatchRequest, QueryRequest, QueryResponse
+from src.api.streaming import ReleasingStreamingResponse, agent_events, sse, until_disconnected
+from src.agent.batch import BatchItem, answer_batch
 from src.agent.graph import app as agent_app
+from src.agent.sessions import prune_thread
+from src.agent.tools import format_document
+from src.core.admission import admission
+from src.core.concurrency import deadline_scope, new_deadline
+from src.core.config import settings
+from src.core.container import Container, container
+from src.core.errors import error_response
+from src.core.experiments import experiments, variant_stats
+from src.core.metrics import DEGRADED_REQUESTS, GRAPH_ROUTES, llm_metrics, track_stage
+from src.core.semantic_cache import CachedAnswer
+from src.core.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def get_container() -> Container:
+    """FastAPI dependency for the shared clients (override with `app.dependency_overrides`)."""
+    return container
+
+def _http_error(e: Exception, request_id: str) -> HTTPException:
+    """
+    Maps a failed request to its status: 429/503 when overloaded, 504 past a deadline
+    or stage budget, 502/503 for upstream (OpenAI, Milvus) failures, 500 otherwise.
+    """
+    status, detail, headers = error_response(e)
+    if status in (500, 502):
+        logger.exception("Chat request failed", extra={"request_id": request_id})
+    else:
+        # Expected under overload: no stack trace per request
+        logger.warning("Chat request not served", extra={"request_id": request_id, "status": status, "error": repr(e)})
+    return HTTPException(status_code=status, detail=detail, headers={**headers, "X-Request-ID": request_id})
+
+async def _prepare_chat(
+    request: QueryRequest, tags: Dict[str, str], deps: Container, degraded: bool = False
+) -> Tuple[str, Dict[str, Any], Optional[CachedAnswer]]:
+    """
+    Shared front half of /chat and /chat/stream.
+    Returns (strategy, initial graph state, cached answer or None); MLflow tags go into `tags`.
+    Degraded requests accept looser semantic cache matches (DEGRADED_CACHE_THRESHOLD).
+    """
+    question = request.question
+    # 1. Experiment assignment (EXPERIMENT_VARIANTS weights)
+    # Sticky: hashed from the user ID, else the conversation, so a user keeps their variant
+    strategy = experiments.assign(request.user_id or request.thread_id)
+    
+    # 2. Set MLflow Tags for Analysis
+    # This allows you to filter runs by 'strategy=A' vs 'strategy=B' in the dashboard
+    tags["ab_test_strategy"] = strategy
+    tags["experiment_salt"] = experiments.salt
+    if degraded:
+        tags["degraded"] = "true"
+        DEGRADED_REQUESTS.labels("overload").inc()
+    
+    initial_state = {"question": question, "documents": []}
+    if request.thread_id:
+        # Session turn: reset the per-turn fields of the thread's saved state
+        tags["thread_id"] = request.thread_id
+        initial_state.update(generation="", search_query=None, rewrites=0, route=Overwrite([]))
+        # Needed to decide whether the thread's graded chunks still apply (see route_start)
+        initial_state["query_vector"] = await deps.embeddings.aembed_query(question)
+        # Answers in a session depend on the conversation, so the semantic cache is skipped
+        return strategy, initial_state, None
+
+    # 3. Semantic Cache Lookup
+    # The query embedding is computed once here and reused by the retriever on a miss
+    cached = None
+    semantic_cache = deps.semantic_cache
+    if semantic_cache is not None:
+        query_vector = await deps.embeddings.aembed_query(question)
+        with track_stage("semantic_cache_lookup"):
+            threshold = settings.DEGRADED_CACHE_THRESHOLD if degraded else None
+            cached = await semantic_cache.alookup(strategy, query_vector, threshold)
+        tags["semantic_cache"] = "hit" if cached else "miss"
+        initial_state["query_vector"] = query_vector
+    return strategy, initial_state, cached
+
+def _graph_config(
+    strategy: str, deps: Container, thread_id: Optional[str] = None, degraded: bool = False
+) -> RunnableConfig:
+    """
+    Per-request graph config: the variant, clients, session and degraded flag,
+    plus LLM metrics labelled by variant.
+    """
+    configurable = {"strategy": strategy, "variant": experiments.variants[strategy], "deps": deps}
+    if thread_id:
+        configurable["thread_id"] = thread_id
+    if degraded:
+        configurable["degraded"] = True
+    return RunnableConfig(
+        configurable=configurable,
+        metadata={"strategy": strategy},
+        callbacks=[llm_metrics],
+    )
+
+def _graph(thread_id: Optional[str], deps: Container) -> CompiledStateGraph:
+    """The session graph (checkpointed per thread) for requests with a thread_id, else the stateless one."""
+    return deps.session_graph if thread_id else agent_app
+
+def _record_request(request_id: str, strategy: str, route: List[str], tags: Dict[str, str], started: float):
+    """
+    Counts the path taken through the graph, to compare latency and cost per route,
+    adds the request to its variant's aggregates, and queues the request's MLflow
+    run (exported in the background).
+    """
+    path = "->".join(route)
+    latency = time.perf_counter() - started
+    GRAPH_ROUTES.labels(path, strategy).inc()
+    variant_stats.record_request(request_id, strategy, latency, cached=route == ["semantic_cache"])
+    telemetry.record_request(request_id, {**tags, "graph_route": path}, {"latency_seconds": latency})
+    logger.info("Chat answered", extra={"request_id": request_id, "strategy": strategy, "route": path})
+
 @router.post("/chat", response_model=QueryResponse)
-async def chat_endpoint(request: QueryRequest):
+async def chat_endpoint(request: QueryRequest, deps: Container = Depends(get_container)):
     """
     Endpoint with A/B Testing Logic.
+    Admission-controlled (429/503 with Retry-After when overloaded) and bounded by
+    REQUEST_DEADLINE_SECONDS (504); requests admitted near capacity run degraded.
     """
+    started = time.perf_counter()
+    request_id = uuid.uuid4().hex
+    tags: Dict[str, str] = {}
     try:
-        # 1. Traffic Split (50/50)
-        # In production, hash the user_id to ensure consistency (Sticky Sessions)
-        strategy = "B" if random.random() > 0.5 else "A"
-        
-        # 2. Set MLflow Tags for Analysis
-        # This allows you to filter runs by 'strategy=A' vs 'strategy=B' in the dashboard
-        mlflow.set_tag("ab_test_strategy", strategy)
-        
-        # 3. Invoke Graph with Config
-        initial_state = {"question": request.question, "documents": []}
-        config = RunnableConfig(configurable={"strategy": strategy})
-        
-        result = await agent_app.ainvoke(initial_state, config=config)
-        
-        return QueryResponse(
-            answer=result["generation"],
-            documents=result["documents"]
-        )
+        # The deadline starts on arrival: time spent queued for admission counts
+        async with deadline_scope(new_deadline()), admission.admit() as degraded:
+            strategy, initial_state, cached = await _prepare_chat(request, tags, deps, degraded)
+            if cached:
+                _record_request(request_id, strategy, ["semantic_cache"], tags, started)
+                return QueryResponse(
+                    answer=cached.answer, documents=cached.documents, route=["semantic_cache"],
+                    request_id=request_id, degraded=degraded,
+                )
+            
+            # 4. Invoke Graph with Config
+            config = _graph_config(strategy, deps, request.thread_id, degraded)
+            
+            graph = _graph(request.thread_id, deps)
+            # Sessions: the checkpoint is written once, when the turn completes
+            durability = "exit" if graph.checkpointer else None
+            result = await graph.ainvoke(initial_state, config=config, durability=durability)
+            
+            response = QueryResponse(
+                answer=result["generation"],
+                documents=[format_document(d) for d in result["documents"]],
+                route=result["route"],
+                request_id=request_id,
+                thread_id=request.thread_id,
+                degraded=degraded,
+            )
+            _record_request(request_id, strategy, response.route, tags, started)
+            if request.thread_id:
+                await prune_thread(deps.checkpointer, request.thread_id)
+            
+            # "No context" answers are not cached: the knowledge base may gain the answer later.
+            # Neither are degraded ones (ungraded context), which would outlive the overload.
+            if (
+                deps.semantic_cache is not None and not request.thread_id and not degraded
+                and response.route[-1] != "no_context"
+            ):
+                await deps.semantic_cache.astore(strategy, initial_state["query_vector"], response.answer, response.documents)
+            
+            return response
+    except Exception as e:
+        raise _http_error(e, request_id)
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: QueryRequest, http_request: Request, deps: Container = Depends(get_container)):
+    """
+    Streaming variant of /chat (Server-Sent Events).
+    Emits `node` progress frames while retrieving and grading, then the answer as
+    `token` frames while it is generated, then `sources` and `done`.
+    Closing the connection cancels the run, including in-flight LLM calls.
+    Admission and the request deadline work as for /chat; once the stream has
+    started, failures arrive as an `error` frame carrying the status.
+    """
+    started = time.perf_counter()
+    request_id = uuid.uuid4().hex
+    tags: Dict[str, str] = {}
+    deadline = new_deadline()
+    try:
+        async with deadline_scope(deadline):
+            # Held until the response is over (released by the response, see below)
+            degraded = await admission.acquire()
+            try:
+                strategy, initial_state, cached = await _prepare_chat(request, tags, deps, degraded)
+            except BaseException:
+                admission.release()
+                raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _http_error(e, request_id)
+
+    async def frames():
+        if cached:
+            _record_request(request_id, strategy, ["semantic_cache"], tags, started)
+            yield sse("token", {"content": cached.answer})
+            yield sse("sources", {"documents": cached.documents})
+            yield sse("done", {"route": ["semantic_cache"], "request_id": request_id, "degraded": degraded})
+            return
+
+        config = _graph_config(strategy, deps, request.thread_id, degraded)
+        result: Dict[str, Any] = {}
+        graph = _graph(request.thread_id, deps)
+        async for frame in agent_events(initial_state, config, result, request_id, graph=graph, deadline=deadline):
+            yield frame
+        if "documents" in result:
+            _record_request(request_id, strategy, result["route"], tags, started)
+            if request.thread_id:
+                await prune_thread(deps.checkpointer, request.thread_id)
+        # Only complete runs with an answer from context are cached
+        # (not errors, disconnects, "no context", degraded answers or sessions)
+        if (
+            deps.semantic_cache is not None and not request.thread_id and not degraded
+            and "documents" in result and result["route"][-1] != "no_context"
+        ):
+            await deps.semantic_cache.astore(strategy, initial_state["query_vector"], result["answer"], result["documents"])
+
+    return ReleasingStreamingResponse(
+        until_disconnected(frames(), http_request),
+        release=admission.release,
+        media_type="text/event-stream",
+        # Stop proxies (e.g. nginx ingress) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Request-ID": request_id},
+    )
+
+@router.post("/chat/batch")
+async def chat_batch_endpoint(request: BatchRequest, http_request: Request, deps: Container = Depends(get_container)):
+    """
+    Answers many questions in one call, streamed back as NDJSON: one JSON object per
+    question, in completion order, carrying its input `index` and `id` (see src.agent.batch).
+    Embedding and search are shared by the whole batch, so bulk workloads should use
+    this rather than one /chat call per question.
+    Each question in flight holds an admission slot and has the /chat request deadline;
+    questions turned away or past their deadline get error results (429/503/504).
+    """
+    request_id = uuid.uuid4().hex
+    if len(request.questions) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413, detail=f"At most {settings.BATCH_MAX_ITEMS} questions per batch (use the batch job for more)"
+        )
+    items = [
+        BatchItem(index=i, question=q.question, id=q.id, user_id=q.user_id) for i, q in enumerate(request.questions)
+    ]
+
+    async def lines():
+        started = time.perf_counter()
+        failed = 0
+        async for result in answer_batch(items, deps, admission=admission):
+            failed += "error" in result
+            yield json.dumps(result) + "\n"
+        telemetry.record_request(
+            request_id, {"batch": "true"},
+            {"latency_seconds": time.perf_counter() - started, "batch_items": len(items), "batch_errors": failed},
+        )
+        logger.info("Batch answered", extra={"request_id": request_id, "items": len(items), "failed": failed})
+
+    return StreamingResponse(
+        until_disconnected(lines(), http_request),
+        media_type="application/x-ndjson",
+        headers={"X-Request-ID": request_id},
+    )
+
+@router.get("/cache/stats")
+async def cache_stats_endpoint(deps: Container = Depends(get_container)):
+    """
+    Semantic answer cache and embedding cache hit/miss counters for this process,
+    plus query micro-batching counters.
+    """
+    return {
+        "semantic_cache": deps.semantic_cache.stats() if deps.semantic_cache is not None else None,
+        "embedding_cache": deps.embeddings.cache.stats() if deps.embeddings.cache is not None else None,
+        "query_batching": {
+            "embeddings": deps.embeddings.query_batcher.stats(),
+            "search": deps.milvus.batching_stats(),
+        },
+    }
 
 @router.post("/feedback")
-async def feedback_endpoint(run_id: str, score: int):
+async def feedback_endpoint(score: int, run_id: Optional[str] = None, request_id: Optional[str] = None):
     """
     Capture User Feedback (Thumbs Up/Down).
     score: 1 (Like) or 0 (Dislike)
+    Identify the answer by the `request_id` from /chat, or by an MLflow `run_id`.
     """
     # In a real app, write this to Postgres linked to the run_id
-    # For this MVP, we log it to MLflow as a metric
-    with mlflow.start_run(run_id=run_id, nested=True):
-        mlflow.log_metric("user_feedback", score)
-    return {"status": "recorded"}
\ No newline at end of file
+    # For this MVP, we log it to MLflow as a metric (queued, exported in the background)
+    if run_id is None and request_id is None:
+        raise HTTPException(status_code=422, detail="run_id or request_id is required")
+    telemetry.record_feedback(score, run_id=run_id, request_id=request_id)
+    if request_id is not None:
+        variant_stats.record_feedback(request_id, score)
+    return {"status": "queued"}
+
+@router.get("/experiments")
+async def experiments_endpoint():
+    """
+    The experiment's variants and this process's per-variant aggregates since the
+    last flush to MLflow (requests, latency, tokens, cost, feedback).
+    """
+    return {
+        "salt": experiments.salt,
+        "variants": {name: variant.model_dump() for name, variant in experiments.variants.items()},
+        "window": variant_stats.snapshot(),
+    }
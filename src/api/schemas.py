@@ -1,16 +1,37 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
 
 class QueryRequest(BaseModel):
     """
     Request model for the chat endpoint.
     """
     question: str
-    thread_id: Optional[str] = None # For future session management
+    # Conversation session: turns with the same thread_id share history and retrieved context
+    thread_id: Optional[str] = None
+    # Experiment assignment key: a user always gets the same variant (thread_id if absent)
+    user_id: Optional[str] = None
 
 class QueryResponse(BaseModel):
     """
     Response model returning the answer and used sources.
     """
     answer: str
-    documents: List[str]
\ No newline at end of file
+    documents: List[str]
+    request_id: Optional[str] = None # Pass to /feedback to rate this answer
+    thread_id: Optional[str] = None
+    route: List[str] = [] # Graph nodes visited, e.g. ["retrieve", "rerank", "generate"] when grading was skipped
+    degraded: bool = False # Answered under overload: ungraded context, no rewrite, looser cache match
+
+class BatchQuestion(BaseModel):
+    """
+    One question of a /chat/batch request.
+    """
+    question: str
+    id: Optional[Union[str, int]] = None # Echoed back: results arrive in completion order
+    user_id: Optional[str] = None # Experiment assignment key, as for /chat
+
+class BatchRequest(BaseModel):
+    """
+    Request model for the batch endpoint (at most BATCH_MAX_ITEMS questions).
+    """
+    questions: List[BatchQuestion]
@@ -0,0 +1,141 @@
+import asyncio
+import contextlib
+import json
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import CompiledStateGraph
+from src.agent.graph import app as agent_app
+from src.agent.tools import format_document
+from src.core.concurrency import deadline_scope
+from src.core.config import settings
+from src.core.errors import error_response
+
+logger = logging.getLogger(__name__)
+
+# Server-Sent Events for POST /chat/stream.
+# Frames: `node` (graph progress), `token` (answer text as generated),
+# `sources` (final documents), `error` (with the HTTP status the failure maps to),
+# and a closing `done` carrying the route taken.
+
+GRAPH_NODES = ("recall", "retrieve", "rerank", "grade_documents", "rewrite_query", "generate", "no_context")
+
+def sse(event: str, data: Any) -> str:
+    """One SSE frame with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def agent_events(
+    initial_state: Dict[str, Any],
+    config: RunnableConfig,
+    result: Dict[str, Any],
+    request_id: Optional[str] = None,
+    graph: CompiledStateGraph = agent_app,
+    deadline: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """
+    Runs the graph (by default the stateless one) and translates its events into SSE frames.
+    The final answer, documents and route are also written to `result` for the caller.
+    With a `deadline` (time.monotonic()), the run is cut short there with an `error` frame.
+    """
+    documents = []
+    route = result["route"] = []
+    streamed = False
+    try:
+        # Sessions: the checkpoint is written once, when the turn completes
+        durability = "exit" if graph.checkpointer else None
+        async with deadline_scope(deadline) if deadline is not None else contextlib.nullcontext():
+            async for event in graph.astream_events(initial_state, config=config, version="v2", durability=durability):
+                kind, name = event["event"], event["name"]
+                node = event.get("metadata", {}).get("langgraph_node")
+
+                if kind == "on_chat_model_stream" and node == "generate":
+                    content = event["data"]["chunk"].content
+                    if content:
+                        streamed = True
+                        yield sse("token", {"content": content})
+                elif name in GRAPH_NODES and node == name:
+                    if kind == "on_chain_start":
+                        yield sse("node", {"node": name, "status": "started"})
+                    elif kind == "on_chain_end":
+                        output = event["data"].get("output") or {}
+                        route.append(name)
+                        progress = {"node": name, "status": "completed"}
+                        if "documents" in output:
+                            documents = output["documents"]
+                            progress["documents"] = len(documents)
+                        if "generation" in output:
+                            result["answer"] = output["generation"]
+                            if not streamed:
+                                # Model did not stream: send the whole answer as one token frame
+                                yield sse("token", {"content": output["generation"]})
+                        yield sse("node", progress)
+    except Exception as e:
+        status, detail, _ = error_response(e)
+        if status in (500, 502):
+            logger.exception("Chat stream failed", extra={"request_id": request_id})
+        else:
+            logger.warning("Chat stream not completed", extra={"request_id": request_id, "status": status, "error": repr(e)})
+        yield sse("error", {"detail": detail, "status": status, "request_id": request_id})
+        return
+
+    result["documents"] = [format_document(d) for d in documents]
+    yield sse("sources", {"documents": result["documents"]})
+    degraded = bool(config.get("configurable", {}).get("degraded"))
+    yield sse("done", {"route": route, "request_id": request_id, "degraded": degraded})
+
+async def until_disconnected(frames: AsyncIterator[str], request: Request) -> AsyncIterator[str]:
+    """
+    Relays `frames` through a bounded buffer and cancels the producer (and with
+    it the graph run and any in-flight LLM call) as soon as the client goes away.
+
+    The buffer gives backpressure: a slow reader stalls the producer after
+    STREAM_BUFFER_SIZE frames instead of queueing the whole answer in memory.
+    Disconnects are polled because the server only reports them on the next
+    send, which can be seconds away while retrieval and grading run silently.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.STREAM_BUFFER_SIZE)
+    end: Optional[str] = None  # sentinel
+
+    async def produce():
+        try:
+            async for frame in frames:
+                await queue.put(frame)
+        finally:
+            with contextlib.suppress(asyncio.QueueFull):
+                queue.put_nowait(end)
+
+    async def watch():
+        while not await request.is_disconnected():
+            await asyncio.sleep(settings.STREAM_DISCONNECT_POLL_SECONDS)
+        logger.info("Client disconnected, cancelling stream")
+        producer.cancel()
+        with contextlib.suppress(asyncio.QueueFull):
+            queue.put_nowait(end)
+
+    producer = asyncio.create_task(produce())
+    watcher = asyncio.create_task(watch())
+    try:
+        while (frame := await queue.get()) is not end:
+            yield frame
+    finally:
+        producer.cancel()
+        watcher.cancel()
+        await asyncio.gather(producer, watcher, return_exceptions=True)
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that calls `release` once the response is over, however it
+    ended (completed, client gone, send failed), e.g. to free an admission slot.
+    """
+
+    def __init__(self, content: AsyncIterator[str], release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
@@ -0,0 +1 @@
+# Marker file for bench package
@@ -0,0 +1,122 @@
+"""
+Bulk answering benchmark: POST /api/v1/chat/batch against one /api/v1/chat call
+per question, with stubbed LLM, embedding and Milvus backends.
+
+The same number of (distinct) questions is answered three ways:
+
+    chat c=1    one /chat call at a time, as a client looping over its questions
+    chat c=N    N concurrent /chat calls (--concurrency)
+    batch       one /chat/batch call, BATCH_MAX_CONCURRENCY=N questions in flight
+
+and the questions per second, plus the embedding API calls and Milvus searches
+each way made, are reported. The batch path embeds and searches a whole chunk of
+questions (BATCH_CHUNK_SIZE) in a few calls ahead of the graph, so fewer backend
+calls sit on each question's path.
+
+Usage:
+    python -m src.bench.batch_load --questions 512 --concurrency 32
+    python -m src.bench.batch_load --embed-latency 0.2 --search-latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import List
+from unittest.mock import patch
+
+
+def _calls(stage: str) -> float:
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value("rag_stage_duration_seconds_count", {"stage": stage}) or 0.0
+
+
+async def _chat(client, questions: List[str], concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request(question: str):
+        async with semaphore:
+            response = await client.post("/api/v1/chat", json={"question": question})
+            response.raise_for_status()
+
+    await asyncio.gather(*(one_request(q) for q in questions))
+
+
+async def _batch(client, questions: List[str]) -> None:
+    async with client.stream("POST", "/api/v1/chat/batch", json={"questions": [{"question": q} for q in questions]}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line and "error" in json.loads(line):
+                raise RuntimeError(f"batch question failed: {line}")
+
+
+async def run_benchmark(args: argparse.Namespace) -> List[dict]:
+    import httpx
+    from src.bench.fakes import StubChatModel, StubCollection, StubEmbeddings
+    from src.core.config import settings
+    from src.ingestion.milvus_client import MilvusHandler
+
+    collection = StubCollection(latency=args.search_latency, distances=args.hit_distances)
+
+    with patch.object(MilvusHandler, "_connect", lambda self: None), \
+         patch.object(MilvusHandler, "get_collection", lambda self: collection):
+        from src.api.main import app
+        from src.core.container import container
+
+        container.override(llm=StubChatModel(latency=args.llm_latency))
+        container.embeddings.model = StubEmbeddings(latency=args.embed_latency)
+
+        runs = [
+            ("chat c=1", lambda client, qs: _chat(client, qs, 1), args.sequential_questions),
+            (f"chat c={args.concurrency}", lambda client, qs: _chat(client, qs, args.concurrency), args.questions),
+            ("batch", _batch, args.questions),
+        ]
+        results = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            with patch.multiple(settings, BATCH_MAX_CONCURRENCY=args.concurrency, BATCH_MAX_ITEMS=args.questions):
+                for name, run, count in runs:
+                    # Distinct questions per run: nothing is served from an earlier run's caches
+                    questions = [f"batch benchmark question {name} {i}" for i in range(count)]
+                    embeddings, searches = _calls("embedding"), _calls("milvus_search")
+                    start = time.perf_counter()
+                    await run(client, questions)
+                    elapsed = time.perf_counter() - start
+                    results.append({
+                        "mode": name,
+                        "questions": count,
+                        "questions_per_s": count / elapsed,
+                        "embedding_calls": _calls("embedding") - embeddings,
+                        "milvus_searches": _calls("milvus_search") - searches,
+                    })
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=512, help="Questions per concurrent run")
+    parser.add_argument("--sequential-questions", type=int, default=64, help="Questions for the one-at-a-time run")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per stub LLM call")
+    parser.add_argument("--embed-latency", type=float, default=0.1, help="Seconds per stub embedding call")
+    parser.add_argument("--search-latency", type=float, default=0.02, help="Seconds per stub Milvus search")
+    parser.add_argument("--hit-distances", type=lambda s: [float(x) for x in s.split(",")], default=None,
+                        help="Comma-separated stub search scores per hit rank (default: 0,1,2,...)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+    os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # --hit-distances steer routing directly (see chat_load)
+    os.environ.setdefault("RERANKER", "none")
+
+    results = asyncio.run(run_benchmark(args))
+
+    print(f"{'mode':>10} {'questions':>9} {'q/s':>8} {'embed calls':>11} {'searches':>9}")
+    for row in results:
+        print(f"{row['mode']:>10} {row['questions']:>9} {row['questions_per_s']:>8.1f} "
+              f"{row['embedding_calls']:>11.0f} {row['milvus_searches']:>9.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Load benchmark for POST /api/v1/chat against stubbed LLM, embedding and Milvus backends.
+
+Sends a fixed number of requests at increasing concurrency levels and reports
+throughput and latency per level. With a non-blocking graph, throughput should
+grow roughly linearly with in-flight requests until the Milvus executor
+(MILVUS_SEARCH_MAX_WORKERS) becomes the bottleneck.
+
+Latency is also broken down by the route the graph took (see ROUTING_* settings);
+--hit-distances sets the stub search scores to steer requests onto a route.
+
+With --stream the requests go to POST /api/v1/chat/stream instead, and the
+time to the first answer token (TTFT) is reported next to the full latency.
+
+Usage:
+    python -m src.bench.chat_load --concurrency 1,4,16,64 --requests 128
+    python -m src.bench.chat_load --stream --token-latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import threading
+import time
+from typing import Dict, List
+from unittest.mock import patch
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _run_level(client, concurrency: int, total: int, stream: bool = False, questions: List[str] = None) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    by_route: Dict[str, List[float]] = {}
+
+    async def one_request(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            # Unique per level, so no level is served from the semantic cache filled by another
+            question = questions[i % len(questions)] if questions else f"benchmark question {concurrency}-{i}"
+            if stream:
+                async with client.stream("POST", "/api/v1/chat/stream", json={"question": question}) as response:
+                    response.raise_for_status()
+                    first_token = None
+                    async for line in response.aiter_lines():
+                        if line == "event: token" and first_token is None:
+                            first_token = time.perf_counter() - start
+                            ttfts.append(first_token)
+                        elif line == "event: error":
+                            raise RuntimeError("stream returned an error event")
+            else:
+                response = await client.post("/api/v1/chat", json={"question": question})
+                response.raise_for_status()
+                route = "->".join(response.json()["route"])
+                by_route.setdefault(route, []).append(time.perf_counter() - start)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "throughput_rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "ttft_p50_ms": statistics.median(ttfts) * 1000 if ttfts else None,
+        "ttft_p95_ms": _percentile(ttfts, 95) * 1000 if ttfts else None,
+        "routes": {route: (len(values), statistics.median(values) * 1000) for route, values in by_route.items()},
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> List[dict]:
+    import httpx
+    from src.bench.fakes import StubChatModel, StubCollection, StubEmbeddings
+    from src.ingestion.milvus_client import MilvusHandler
+
+    collection = StubCollection(latency=args.search_latency, distances=args.hit_distances)
+
+    # Milvus: skip the network connection and serve searches from the stub collection
+    with patch.object(MilvusHandler, "_connect", lambda self: None), \
+         patch.object(MilvusHandler, "get_collection", lambda self: collection):
+        from src.api.main import app
+        from src.core.container import container
+
+        container.override(llm=StubChatModel(
+            latency=args.llm_latency, token_latency=args.token_latency, structured_response={"score": args.grade}
+        ))
+        container.embeddings.model = StubEmbeddings(latency=args.embed_latency)
+
+        if args.stream:
+            # ASGITransport buffers whole responses, so streaming runs against a real server
+            import uvicorn
+
+            port = _free_port()
+            server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+            threading.Thread(target=server.run, daemon=True).start()
+            while not server.started:
+                await asyncio.sleep(0.05)
+            client_kwargs = {"base_url": f"http://127.0.0.1:{port}", "limits": httpx.Limits(max_connections=None)}
+        else:
+            server = None
+            client_kwargs = {"transport": httpx.ASGITransport(app=app), "base_url": "http://bench"}
+
+        results = []
+        stats = {}
+        try:
+            async with httpx.AsyncClient(timeout=None, **client_kwargs) as client:
+                for concurrency in args.concurrency:
+                    results.append(await _run_level(client, concurrency, args.requests, args.stream))
+            stats = {
+                "embedding batches": container.embeddings.query_batcher.stats(),
+                "search batches": container.milvus.batching_stats(),
+            }
+        finally:
+            if server is not None:
+                server.should_exit = True
+        return results, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=64, help="Requests sent per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per stub LLM call")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds between streamed stub tokens")
+    parser.add_argument("--stream", action="store_true", help="Benchmark /chat/stream and report time to first token")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per stub embedding call")
+    parser.add_argument("--hit-distances", type=lambda s: [float(x) for x in s.split(",")], default=None,
+                        help="Comma-separated stub search scores per hit rank (default: 0,1,2,...)")
+    parser.add_argument("--grade", choices=["yes", "no"], default="yes", help="Stub grader verdict")
+    parser.add_argument("--search-latency", type=float, default=0.01, help="Seconds per stub Milvus search")
+    args = parser.parse_args()
+
+    # The embedding service is built before its model is swapped for the stub and needs a key,
+    # even though no request leaves the process
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # Measure the backends, not the persistent embedding cache
+    os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+    # One log line per request would bury the results
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Stub chunks share no words with the question: without this the lexical reranker
+    # would halve every --hit-distances score
+    os.environ.setdefault("RERANKER", "none")
+
+    results, stats = asyncio.run(run_benchmark(args))
+
+    header = f"{'concurrency':>11} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9}"
+    print(header + (f" {'TTFT p50':>9} {'TTFT p95':>9}" if args.stream else ""))
+    for row in results:
+        line = f"{row['concurrency']:>11} {row['throughput_rps']:>9.1f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f}"
+        if args.stream:
+            line += f" {row['ttft_p50_ms']:>9.1f} {row['ttft_p95_ms']:>9.1f}"
+        print(line)
+
+    routes: Dict[str, List] = {}
+    for row in results:
+        for route, (count, p50) in row["routes"].items():
+            routes.setdefault(route, []).append(f"c={row['concurrency']}: {count} req, p50 {p50:.1f} ms")
+    for route, summaries in routes.items():
+        print(f"route {route}: " + "; ".join(summaries))
+    for name, counters in stats.items():
+        if counters["batches"]:
+            print(f"{name}: {counters['batches']} for {counters['items']} queries "
+                  f"(avg size {counters['avg_batch_size']:.1f}, {counters['coalesced']} coalesced)")
+
+if __name__ == "__main__":
+    main()
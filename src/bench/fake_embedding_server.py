@@ -0,0 +1,120 @@
+"""
+Local OpenAI-compatible embeddings server for exercising EmbeddingService
+without network access or API spend.
+
+It returns deterministic vectors, enforces its own requests/tokens-per-minute
+budget and answers 429 with a Retry-After header when that budget is exceeded,
+like the real API.
+
+Usage:
+    python -m src.bench.fake_embedding_server --port 8001 --rpm 600 --tpm 500000
+    OPENAI_BASE_URL=http://localhost:8001/v1 python -m src.ingestion.pipeline
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import time
+from typing import List, Union
+import numpy as np
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+class EmbeddingRequest(BaseModel):
+    input: Union[str, List[str], List[int], List[List[int]]]
+    model: str
+    encoding_format: str = "float"
+    dimensions: Union[int, None] = None
+
+
+class _Budget:
+    """Per-minute request/token budget refilled continuously."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests, self.tokens = float(rpm), float(tpm)
+        self.updated_at = time.monotonic()
+
+    def try_consume(self, tokens: int) -> float:
+        """Returns 0 if the request fits, otherwise the seconds to wait."""
+        now = time.monotonic()
+        elapsed, self.updated_at = now - self.updated_at, now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+        if self.requests >= 1 and self.tokens >= tokens:
+            self.requests -= 1
+            self.tokens -= tokens
+            return 0.0
+        return max((1 - self.requests) * 60 / self.rpm, (tokens - self.tokens) * 60 / self.tpm)
+
+
+def embed_input(item, dim: int) -> np.ndarray:
+    """Deterministic unit vector for a string or a list of token ids."""
+    key = item if isinstance(item, str) else ",".join(map(str, item))
+    seed = int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_app(dim: int = 1536, rpm: int = 10_000, tpm: int = 10_000_000, latency: float = 0.05) -> FastAPI:
+    app = FastAPI(title="Fake Embeddings")
+    budget = _Budget(rpm, tpm)
+    app.state.stats = {"requests": 0, "rate_limited": 0, "inputs": 0}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: EmbeddingRequest):
+        items = request.input
+        if isinstance(items, str) or (items and isinstance(items[0], int)):
+            items = [items]
+        tokens = sum(len(i) // 4 + 1 if isinstance(i, str) else len(i) for i in items)
+
+        wait = budget.try_consume(tokens)
+        if wait:
+            app.state.stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": f"{wait:.3f}"},
+                content={"error": {"message": "Rate limit reached", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+            )
+
+        await asyncio.sleep(latency)
+        app.state.stats["requests"] += 1
+        app.state.stats["inputs"] += len(items)
+
+        data = []
+        for index, item in enumerate(items):
+            vector = embed_input(item, request.dimensions or dim)
+            if request.encoding_format == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+
+        return {
+            "object": "list",
+            "data": data,
+            "model": request.model,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--rpm", type=int, default=10_000)
+    parser.add_argument("--tpm", type=int, default=10_000_000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per successful request")
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args.dim, args.rpm, args.tpm, args.latency), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from unittest.mock import patch
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import PrivateAttr
+from pymilvus import DataType
+from src.ingestion.bm25 import tokenize
+
+# Stand-ins for OpenAI and Milvus used by the benchmarks.
+# Each one sleeps for a configurable latency so the measured numbers
+# reflect how the service overlaps I/O, not how fast the backends are.
+
+class StubChatModel(BaseChatModel):
+    """
+    Chat model that answers after a fixed delay. When streamed, the first word
+    arrives after `latency` and each following word after `token_latency`.
+    With a `script`, successive calls return its entries in turn (cycling);
+    otherwise every call returns `response`. With a `capacity`, at most that many
+    async calls are served at once and the rest queue, like a saturated backend.
+    """
+    latency: float = 0.05
+    token_latency: float = 0.0
+    response: str = "This is a stubbed answer."
+    script: List[str] = []
+    structured_response: Dict[str, Any] = {"score": "yes"}
+    capacity: int = 0  # 0: unlimited
+    _turn: Iterator[int] = PrivateAttr(default_factory=itertools.count)
+    _slots: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def _next_response(self) -> str:
+        return self.script[next(self._turn) % len(self.script)] if self.script else self.response
+
+    @asynccontextmanager
+    async def _serving(self):
+        if not self.capacity:
+            yield
+            return
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.capacity)
+        async with self._slots:
+            yield
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._next_response()))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        async with self._serving():
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._next_response()))])
+
+    async def _astream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        async with self._serving():
+            await asyncio.sleep(self.latency)
+        for i, word in enumerate(self._next_response().split(" ")):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            text = word if i == 0 else " " + word
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+    def with_structured_output(self, schema, **kwargs):
+        """Returns a runnable producing `schema(**structured_response)` after the same delay."""
+        def _parse(_: Any):
+            time.sleep(self.latency)
+            return schema(**self.structured_response)
+
+        async def _aparse(_: Any):
+            async with self._serving():
+                await asyncio.sleep(self.latency)
+            return schema(**self.structured_response)
+
+        return RunnableLambda(_parse, afunc=_aparse)
+
+
+class StubEmbeddings(Embeddings):
+    """
+    Embedding model returning a deterministic pseudo-random unit vector per text,
+    so distinct texts get (nearly) orthogonal vectors and identical texts match.
+    """
+
+    def __init__(self, dim: int = 1536, latency: float = 0.02):
+        self.dim = dim
+        self.latency = latency
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dim)]
+        norm = math.sqrt(sum(x * x for x in vector))
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return self._vector(text)
+
+
+class HashEmbeddings(StubEmbeddings):
+    """
+    Feature-hashing embeddings: each token adds +-1 to a hashed dimension, and the
+    sum is unit-normalized. Deterministic, and texts sharing words get similar
+    vectors, so retrieval over a fake corpus returns meaningful hits.
+    """
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "big") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = float(np.linalg.norm(vector))
+        return (vector / norm if norm else vector).tolist()
+
+
+class _StubEntity:
+    def __init__(self, fields: Dict[str, Any]):
+        self._fields = fields
+
+    def get(self, key: str, default: Optional[Any] = None) -> Any:
+        return self._fields.get(key, default)
+
+
+class StubHit:
+    def __init__(self, id: Any, distance: float, fields: Dict[str, Any]):
+        self.id = id
+        self.distance = distance
+        self.entity = _StubEntity(fields)
+
+
+class StubCollection:
+    """
+    Mimics pymilvus.Collection.search, including the fact that it blocks the calling thread.
+    """
+
+    def __init__(self, latency: float = 0.01, distances: Optional[List[float]] = None):
+        self.latency = latency
+        # Score of the i-th hit (default: 0, 1, 2, ...)
+        self.distances = distances
+
+    def search(self, data, anns_field, param, limit, output_fields=None, **kwargs):
+        time.sleep(self.latency)
+        return [
+            [
+                StubHit(
+                    id=i,
+                    distance=self.distances[i % len(self.distances)] if self.distances else float(i),
+                    fields={"text": f"Stub chunk {i}", "source": "stub_source.txt"},
+                )
+                for i in range(limit)
+            ]
+            for _ in data
+        ]
+
+    def load(self):
+        pass
+
+
+class InMemoryCollection:
+    """
+    Stand-in for the knowledge-base pymilvus.Collection (id, text, vector, source):
+    upsert, delete by `id in [...]` and exact (brute-force) search, with Milvus'
+    score conventions (similarity for COSINE/IP, squared distance for L2).
+    """
+
+    def __init__(self, name: str, metric_type: str = "COSINE", latency: float = 0.0):
+        self.name = name
+        self.metric_type = metric_type
+        self.latency = latency
+        self.schema = SimpleNamespace(primary_field=SimpleNamespace(name="id", dtype=DataType.VARCHAR))
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._matrix = None  # (ids, stacked vectors), rebuilt after writes
+        self._lock = threading.Lock()
+
+    @property
+    def num_entities(self) -> int:
+        return len(self._rows)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"collection_name": self.name, "collection_id": id(self)}
+
+    def upsert(self, data):
+        ids, texts, vectors, sources = data
+        with self._lock:
+            for id, text, vector, source in zip(ids, texts, vectors, sources):
+                self._rows[id] = {"id": id, "text": text, "source": source}
+                self._vectors[id] = np.asarray(vector, dtype=np.float32)
+            self._matrix = None
+
+    insert = upsert
+
+    def delete(self, expr: str):
+        ids = json.loads(expr.split(" in ", 1)[1])
+        with self._lock:
+            for id in ids:
+                self._rows.pop(id, None)
+                self._vectors.pop(id, None)
+            self._matrix = None
+
+    def search(self, data, anns_field, param, limit, output_fields=None, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            if self._matrix is None:
+                ids = list(self._vectors)
+                self._matrix = (ids, np.stack([self._vectors[i] for i in ids]) if ids else None)
+            ids, matrix = self._matrix
+        if matrix is None:
+            return [[] for _ in data]
+
+        queries = np.asarray(data, dtype=np.float32)
+        if self.metric_type == "L2":
+            scores = (queries ** 2).sum(1)[:, None] - 2 * queries @ matrix.T + (matrix ** 2).sum(1)[None, :]
+            order = np.argsort(scores, axis=1)[:, :limit]
+        else:
+            if self.metric_type == "COSINE":
+                queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+                matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            scores = queries @ matrix.T
+            order = np.argsort(-scores, axis=1)[:, :limit]
+
+        return [
+            [
+                StubHit(
+                    id=ids[j],
+                    distance=float(scores[q, j]),
+                    fields={f: self._rows[ids[j]][f] for f in (output_fields or []) if f in self._rows[ids[j]]},
+                )
+                for j in order[q]
+            ]
+            for q in range(len(queries))
+        ]
+
+    def flush(self):
+        pass
+
+    def load(self):
+        pass
+
+
+@contextmanager
+def in_memory_milvus(latency: float = 0.0):
+    """
+    Serves every MilvusHandler (including the import-time singletons) from
+    InMemoryCollections, one per collection name, instead of connecting to Milvus.
+    Knowledge base generations are kept in memory too. Yields the name -> collection dict.
+    """
+    from src.ingestion.milvus_client import MilvusHandler
+
+    collections: Dict[str, InMemoryCollection] = {}
+    generations: Dict[str, str] = {}
+
+    def get_collection(self):
+        if self.collection_name not in collections:
+            collections[self.collection_name] = InMemoryCollection(
+                self.collection_name, self.index_profile.metric_type, latency
+            )
+        return collections[self.collection_name]
+
+    with patch.object(MilvusHandler, "load_collection", get_collection), \
+         patch.object(MilvusHandler, "get_collection", get_collection), \
+         patch.object(MilvusHandler, "invalidate", lambda self, stale=None: None), \
+         patch.object(MilvusHandler, "is_ready", lambda self: True), \
+         patch.object(MilvusHandler, "write_generation", lambda self, g: generations.__setitem__(self.collection_name, g)), \
+         patch.object(MilvusHandler, "read_generation", lambda self: generations.get(self.collection_name)):
+        yield collections
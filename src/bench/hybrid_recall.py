@@ -0,0 +1,145 @@
+"""
+Retrieval quality benchmark: recall@k and MRR of dense, sparse (BM25) and
+hybrid (RRF-fused) retrieval over a labelled question set, and of dense and
+hybrid candidates (--rerank-candidates of them) reordered by the reranker
+(RERANKER; skipped when it is "none").
+
+The corpus is ingested with the real IngestionPipeline into a scratch Milvus
+Lite collection and a temporary BM25 index. A chunk counts as relevant to a
+question when it covers at least --relevance-threshold of the ground-truth
+answer's terms.
+
+Defaults to the sample documents and the golden dataset. Dense retrieval uses
+real OpenAI embeddings unless --fake-embeddings is given (hash vectors: dense
+scores are then meaningless and the run only checks the plumbing).
+
+Usage:
+    python -m src.bench.hybrid_recall --k 3
+    RERANKER=cross_encoder python -m src.bench.hybrid_recall --k 3
+    python -m src.bench.hybrid_recall --docs corpus.jsonl --dataset questions.jsonl --k 5
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Set
+
+
+def read_jsonl(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_relevant(text: str, ground_truth: str, threshold: float) -> bool:
+    from src.ingestion.bm25 import tokenize
+
+    truth_terms = set(tokenize(ground_truth))
+    return bool(truth_terms) and len(truth_terms & set(tokenize(text))) / len(truth_terms) >= threshold
+
+
+def score(ranked_ids: List[str], relevant: Set[str], k: int) -> Dict[str, float]:
+    top = ranked_ids[:k]
+    recall = len(set(top) & relevant) / len(relevant)
+    reciprocal_rank = next((1.0 / rank for rank, chunk_id in enumerate(top, start=1) if chunk_id in relevant), 0.0)
+    return {"recall": recall, "mrr": reciprocal_rank}
+
+
+async def run(args, documents: List[Dict], dataset: List[Dict]):
+    from src.agent import tools
+    from src.bench.fakes import StubEmbeddings
+    from src.core.config import settings
+    from src.core.container import container
+    from src.ingestion.pipeline import IngestionPipeline
+
+    pipeline = IngestionPipeline()
+    if args.fake_embeddings:
+        # The pipeline and the retriever share the container's embedding service
+        container.embeddings.model = StubEmbeddings(dim=settings.EMBEDDING_DIMENSION, latency=0)
+    await pipeline.arun(documents)
+
+    chunks = list(pipeline.iter_chunks(documents))
+    modes = ["dense", "sparse", "hybrid"]
+    if container.reranker is not None:
+        modes += ["dense+rerank", "hybrid+rerank"]
+    totals = {mode: {"recall": 0.0, "mrr": 0.0} for mode in modes}
+    evaluated = 0
+    for item in dataset:
+        relevant = {cid for cid, text, _ in chunks if is_relevant(text, item["ground_truth"], args.relevance_threshold)}
+        if not relevant:
+            print(f"No relevant chunk for: {item['question']!r} (skipped)")
+            continue
+        evaluated += 1
+
+        rankings = {}
+        for mode in ("dense", "hybrid"):
+            settings.RETRIEVAL_MODE = mode
+            # In candidate order (rank fusion order for hybrid); the first k are what retrieval alone returns
+            candidates = await tools.retriever_tool.ainvoke({"query": item["question"]})
+            rankings[mode] = [d.metadata["id"] for d in candidates]
+            if container.reranker is not None:
+                scores = container.reranker.score(item["question"], candidates)
+                reranked = sorted(zip(scores, candidates), key=lambda pair: pair[0], reverse=True)
+                rankings[f"{mode}+rerank"] = [d.metadata["id"] for _, d in reranked]
+        rankings["sparse"] = [hit[0] for hit in container.bm25.search(item["question"], args.k)]
+
+        for mode, ranked in rankings.items():
+            for metric, value in score(ranked, relevant, args.k).items():
+                totals[mode][metric] += value
+
+    print(f"\n{evaluated} questions, {len(chunks)} chunks, k={args.k}")
+    print(f"{'mode':<14} {'recall@k':>9} {'MRR':>7}")
+    for mode, metrics in totals.items():
+        print(f"{mode:<14} {metrics['recall'] / max(evaluated, 1):>9.3f} {metrics['mrr'] / max(evaluated, 1):>7.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", default=None, help="JSONL of {text, source} (default: sample documents)")
+    parser.add_argument("--dataset", default=None, help="JSONL of {question, ground_truth} (default: golden dataset)")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--candidates", type=int, default=20, help="Hits per retriever before fusion")
+    parser.add_argument("--rerank-candidates", type=int, default=50, help="Hits the reranker reorders")
+    parser.add_argument("--relevance-threshold", type=float, default=0.3)
+    parser.add_argument("--fake-embeddings", action="store_true")
+    args = parser.parse_args()
+
+    # pymilvus reads MILVUS_URI at import time (and rejects a Milvus Lite path there),
+    # so load it before pointing settings at Milvus Lite
+    importlib.import_module("pymilvus")
+
+    workdir = tempfile.mkdtemp(prefix="bench_hybrid_")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.update({
+        "MILVUS_URI": os.path.join(workdir, "milvus.db"),
+        "MILVUS_COLLECTION_NAME": "bench_hybrid",
+        "VECTOR_INDEX_PROFILE": "flat",  # exact dense search isolates the retrieval mode
+        "BM25_INDEX_PATH": os.path.join(workdir, "bm25.sqlite3"),
+        "INGEST_MANIFEST_DIR": os.path.join(workdir, "manifest"),
+        "RETRIEVAL_MODE": "hybrid",
+        "RETRIEVER_TOP_K": str(args.k),
+        "HYBRID_CANDIDATES": str(args.candidates),
+        "RERANK_CANDIDATES": str(args.rerank_candidates),
+        "SEMANTIC_CACHE_ENABLED": "false",
+    })
+    if args.fake_embeddings:
+        os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+
+    from src.ingestion.pipeline import SAMPLE_DOCUMENTS
+    documents = read_jsonl(args.docs) if args.docs else SAMPLE_DOCUMENTS
+    if args.dataset:
+        dataset = read_jsonl(args.dataset)
+    else:
+        from tests.golden_dataset import GOLDEN_DATASET
+        dataset = GOLDEN_DATASET
+
+    try:
+        asyncio.run(run(args, documents, dataset))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
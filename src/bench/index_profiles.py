@@ -0,0 +1,175 @@
+"""
+Recall/latency benchmark for the vector index profiles in Settings.VECTOR_INDEX_PROFILES.
+
+For each profile it builds a scratch collection over the same corpus, then
+reports build time, recall@k against exact (brute-force) search, single-query
+p50/p99 search latency and index memory.
+
+The corpus is either synthetic (clustered unit vectors) or sampled from the
+live knowledge-base collection. Runs against any Milvus URI, including a Milvus
+Lite file (the default); profiles the server does not support are reported as
+skipped.
+
+Usage:
+    python -m src.bench.index_profiles --n 20000 --dim 256 --k 10
+    python -m src.bench.index_profiles --uri http://localhost:19530 --corpus sampled
+"""
+import argparse
+import os
+import time
+from typing import Dict, List
+import numpy as np
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random centroids, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centroids[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def sampled_corpus(n: int) -> np.ndarray:
+    """Vectors read back from the configured knowledge-base collection."""
+    from pymilvus import Collection
+    from src.core.config import settings
+
+    collection = Collection(settings.MILVUS_COLLECTION_NAME)
+    collection.load()
+    rows = collection.query(expr="", output_fields=["vector"], limit=n)
+    return np.asarray([row["vector"] for row in rows], dtype=np.float32)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Brute-force neighbours. For unit vectors, COSINE, IP and L2 give the same ranking."""
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def estimate_memory_mb(profile, n: int, dim: int) -> float:
+    """Rough in-memory index size, used when the server does not report segment sizes."""
+    raw = n * dim * 4
+    params = profile.build_params
+    if profile.index_type == "HNSW":
+        size = raw + n * params.get("M", 16) * 2 * 8
+    elif profile.index_type == "IVF_PQ":
+        size = n * params.get("m", 64) * params.get("nbits", 8) / 8 + params.get("nlist", 1024) * dim * 4
+    elif profile.index_type == "DISKANN":
+        size = n * 64  # PQ codes cached in memory; the graph and raw vectors stay on disk
+    else:
+        size = raw
+    return size / 1e6
+
+
+def percentile(values: List[float], pct: float) -> float:
+    return float(np.percentile(np.asarray(values), pct))
+
+
+def bench_profile(name: str, profile, corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> Dict:
+    from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, utility
+
+    collection_name = f"bench_index_{name}"
+    if utility.has_collection(collection_name):
+        utility.drop_collection(collection_name)
+
+    n, dim = corpus.shape
+    schema = CollectionSchema([
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=dim),
+    ])
+    collection = Collection(collection_name, schema)
+    try:
+        for start in range(0, n, 5000):
+            batch = corpus[start:start + 5000]
+            collection.insert([list(range(start, start + len(batch))), batch])
+        collection.flush()
+
+        build_start = time.perf_counter()
+        collection.create_index(
+            field_name="vector",
+            index_params={
+                "metric_type": profile.metric_type,
+                "index_type": profile.index_type,
+                "params": profile.build_params,
+            },
+        )
+        collection.load()
+        build_seconds = time.perf_counter() - build_start
+
+        search_params = {"metric_type": profile.metric_type, "params": profile.search_params}
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            hits = collection.search(data=[query], anns_field="vector", param=search_params, limit=k)[0]
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(set(hit.id for hit in hits) & set(expected.tolist())) / k)
+
+        try:
+            segments = utility.get_query_segment_info(collection_name)
+            memory_mb = sum(s.mem_size for s in segments) / 1e6
+            memory_source = "measured"
+        except Exception:
+            memory_mb, memory_source = estimate_memory_mb(profile, n, dim), "estimated"
+
+        return {
+            "profile": name,
+            "index": profile.index_type,
+            "metric": profile.metric_type,
+            "build_s": build_seconds,
+            "recall": float(np.mean(recalls)),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "memory_mb": memory_mb,
+            "memory_source": memory_source,
+        }
+    finally:
+        utility.drop_collection(collection_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="./bench_milvus.db", help="Milvus URI or Milvus Lite file")
+    parser.add_argument("--corpus", choices=["synthetic", "sampled"], default="synthetic")
+    parser.add_argument("--n", type=int, default=20_000, help="Corpus size")
+    parser.add_argument("--dim", type=int, default=256, help="Dimension of the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--profiles", default=None, help="Comma-separated profile names (default: all)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    from pymilvus import connections
+    from src.core.config import settings
+
+    connections.connect(alias="default", uri=args.uri)
+
+    if args.corpus == "sampled":
+        corpus = sampled_corpus(args.n + args.queries)
+        corpus, queries = corpus[args.queries:], corpus[:args.queries]
+    else:
+        corpus = synthetic_corpus(args.n, args.dim)
+        queries = synthetic_corpus(args.queries, args.dim, seed=1)
+    truth = exact_top_k(corpus, queries, args.k)
+    print(f"Corpus: {corpus.shape[0]} x {corpus.shape[1]} ({args.corpus}), {len(queries)} queries, k={args.k}")
+
+    names = args.profiles.split(",") if args.profiles else list(settings.VECTOR_INDEX_PROFILES)
+    rows = []
+    for name in names:
+        try:
+            rows.append(bench_profile(name, settings.VECTOR_INDEX_PROFILES[name], corpus, queries, truth, args.k))
+        except Exception as e:
+            print(f"Skipping profile '{name}': {e}")
+
+    print(f"\n{'profile':<10} {'index':<9} {'metric':<7} {'build s':>8} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'mem MB':>8}")
+    for r in rows:
+        memory = f"{r['memory_mb']:.1f}" + ("*" if r["memory_source"] == "estimated" else "")
+        print(
+            f"{r['profile']:<10} {r['index']:<9} {r['metric']:<7} {r['build_s']:>8.2f} {r['recall']:>7.3f} "
+            f"{r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {memory:>8}"
+        )
+    if any(r["memory_source"] == "estimated" for r in rows):
+        print("* estimated from index parameters (server did not report segment memory)")
+
+
+if __name__ == "__main__":
+    main()
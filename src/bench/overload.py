@@ -0,0 +1,161 @@
+"""
+Overload benchmark for POST /api/v1/chat: admission control, deadlines and degraded mode.
+
+Requests arrive at a fixed rate (open loop: arrivals don't wait for answers,
+as with real users) above what a slow, capacity-limited stub LLM can serve.
+The same load is replayed in four modes:
+
+    unbounded   no admission control, no effective deadline (the old behavior)
+    deadline    REQUEST_DEADLINE_SECONDS only
+    admission   bounded in-flight requests and queue (fast 429/503) + deadline
+    degraded    admission + degraded mode near capacity (no LLM grading or rewrites)
+
+For each mode: answers (200) per second, their p50/p95/p99 latency, how many
+requests were shed (429/503) or timed out (504), and how fast the rejections came.
+Stable tail latency under overload means admission and degraded keep p99 of
+answered requests near the deadline-free, unloaded latency while unbounded grows
+with the backlog for as long as the overload lasts.
+
+Usage:
+    python -m src.bench.overload --rate 30 --duration 10
+    python -m src.bench.overload --modes admission,degraded --llm-capacity 16
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+from typing import Dict, List
+from unittest.mock import patch
+
+from src.bench.chat_load import _percentile
+
+MODES = ("unbounded", "deadline", "admission", "degraded")
+
+
+async def _run_mode(client, mode: str, rate: float, duration: float) -> dict:
+    statuses: Counter = Counter()
+    answered: List[float] = []
+    rejected: List[float] = []
+    degraded = 0
+
+    async def one_request(i: int):
+        nonlocal degraded
+        start = time.perf_counter()
+        # Unique questions: nothing is answered from the semantic cache
+        response = await client.post("/api/v1/chat", json={"question": f"overload question {mode}-{i}"})
+        latency = time.perf_counter() - start
+        statuses[response.status_code] += 1
+        if response.status_code == 200:
+            answered.append(latency)
+            degraded += response.json()["degraded"]
+        else:
+            rejected.append(latency)
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(int(rate * duration)):
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one_request(i)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "requests": len(tasks),
+        "statuses": dict(statuses),
+        "goodput_rps": len(answered) / elapsed,
+        "p50_ms": _percentile(answered, 50) * 1000 if answered else None,
+        "p95_ms": _percentile(answered, 95) * 1000 if answered else None,
+        "p99_ms": _percentile(answered, 99) * 1000 if answered else None,
+        "rejected_p99_ms": _percentile(rejected, 99) * 1000 if rejected else None,
+        "degraded": degraded,
+        "elapsed_s": elapsed,
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> List[dict]:
+    import httpx
+    from src.bench.fakes import StubChatModel, StubCollection, StubEmbeddings
+    from src.core.admission import AdmissionController
+    from src.core.config import settings
+    from src.ingestion.milvus_client import MilvusHandler
+
+    collection = StubCollection(latency=args.search_latency, distances=args.hit_distances)
+
+    with patch.object(MilvusHandler, "_connect", lambda self: None), \
+         patch.object(MilvusHandler, "get_collection", lambda self: collection):
+        from src.api.main import app
+        from src.core.container import container
+
+        container.override(llm=StubChatModel(latency=args.llm_latency, capacity=args.llm_capacity))
+        container.embeddings.model = StubEmbeddings(latency=args.embed_latency)
+
+        results = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for mode in args.modes:
+                admission = AdmissionController(
+                    max_in_flight=args.max_in_flight if mode in ("admission", "degraded") else 0,
+                    queue_size=args.queue_size,
+                    queue_timeout=args.queue_timeout,
+                )
+                overrides = {
+                    "REQUEST_DEADLINE_SECONDS": 3600.0 if mode == "unbounded" else args.deadline,
+                    # Above 1: never degraded
+                    "DEGRADED_UTILIZATION": args.degraded_utilization if mode == "degraded" else 2.0,
+                }
+                with patch("src.api.routes.admission", admission), patch.multiple(settings, **overrides):
+                    results.append(await _run_mode(client, mode, args.rate, args.duration))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", type=lambda s: s.split(","), default=list(MODES), help=f"Comma-separated, of {MODES}")
+    parser.add_argument("--rate", type=float, default=30.0, help="Requests per second offered")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of offered load per mode")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per stub LLM call")
+    parser.add_argument("--llm-capacity", type=int, default=8, help="Stub LLM calls served at once (others queue)")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per stub embedding call")
+    parser.add_argument("--search-latency", type=float, default=0.01, help="Seconds per stub Milvus search")
+    # L2 distance 1.2 is cosine similarity 0.4: between the ROUTING_* thresholds, so every hit is graded
+    parser.add_argument("--hit-distances", type=lambda s: [float(x) for x in s.split(",")], default=[1.2],
+                        help="Comma-separated stub search scores per hit rank")
+    parser.add_argument("--deadline", type=float, default=5.0, help="REQUEST_DEADLINE_SECONDS")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="ADMISSION_MAX_IN_FLIGHT")
+    parser.add_argument("--queue-size", type=int, default=8, help="ADMISSION_QUEUE_SIZE")
+    parser.add_argument("--queue-timeout", type=float, default=1.0, help="ADMISSION_QUEUE_TIMEOUT_SECONDS")
+    parser.add_argument("--degraded-utilization", type=float, default=0.75, help="DEGRADED_UTILIZATION")
+    args = parser.parse_args()
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes {sorted(unknown)}; choose from {MODES}")
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+    # Every request is a new question; a semantic cache lookup per request is all it would add
+    os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+    # Shed requests are logged as warnings: thousands of lines would bury the results
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    # --hit-distances steer routing directly (see chat_load)
+    os.environ.setdefault("RERANKER", "none")
+
+    results = asyncio.run(run_benchmark(args))
+
+    def ms(value):
+        return f"{value:>8.0f}" if value is not None else f"{'-':>8}"
+
+    print(f"{'mode':>10} {'sent':>5} {'200':>5} {'429':>5} {'503':>5} {'504':>5} {'other':>5} {'ok/s':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rej p99':>8} {'degraded':>8}")
+    for row in results:
+        statuses: Dict[int, int] = row["statuses"]
+        other = sum(n for code, n in statuses.items() if code not in (200, 429, 503, 504))
+        print(f"{row['mode']:>10} {row['requests']:>5} " + " ".join(f"{statuses.get(c, 0):>5}" for c in (200, 429, 503, 504))
+              + f" {other:>5} {row['goodput_rps']:>6.1f} {ms(row['p50_ms'])} {ms(row['p95_ms'])} {ms(row['p99_ms'])}"
+              f" {ms(row['rejected_p99_ms'])} {row['degraded']:>8}")
+
+if __name__ == "__main__":
+    main()
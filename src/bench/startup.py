@@ -0,0 +1,135 @@
+"""
+Startup benchmark for the API: time to import `src.api.main`, and time from the
+start of the lifespan until /ready answers 200 (warm-up done, collection loaded).
+
+Each run is a fresh interpreter, so import caches and client state never carry
+over between runs; medians over --runs are reported. Milvus, the LLM and the
+embedding model are replaced by the fakes from src.bench.fakes after the import.
+
+--degraded instead starts the API with no OPENAI_API_KEY and an unreachable
+MILVUS_URI: the import and /health must still succeed, and /ready must report 503.
+
+Usage:
+    python -m src.bench.startup --runs 5
+    python -m src.bench.startup --degraded
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+async def _wait_ready(app, timeout: float) -> float:
+    import httpx
+
+    start = time.perf_counter()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        while time.perf_counter() - start < timeout:
+            if (await client.get("/ready")).status_code == 200:
+                return time.perf_counter() - start
+            await asyncio.sleep(0.005)
+    raise TimeoutError(f"/ready did not answer 200 within {timeout}s")
+
+
+async def _child_ready(timeout: float) -> dict:
+    start = time.perf_counter()
+    from src.api.main import app
+    import_s = time.perf_counter() - start
+
+    from src.bench.fakes import HashEmbeddings, StubChatModel, in_memory_milvus
+    from src.core.config import settings
+    from src.core.container import container
+
+    with in_memory_milvus():
+        container.override(llm=StubChatModel(latency=0))
+        container.embeddings.model = HashEmbeddings(dim=settings.EMBEDDING_DIMENSION, latency=0)
+        # No tiktoken download offline; batching falls back to ~4 chars per token
+        container.embeddings._encoding = False
+
+        start = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            lifespan_s = time.perf_counter() - start
+            ready_s = lifespan_s + await _wait_ready(app, timeout)
+    return {"import_s": import_s, "lifespan_s": lifespan_s, "ready_s": ready_s}
+
+
+async def _child_degraded() -> dict:
+    import httpx
+
+    start = time.perf_counter()
+    from src.api.main import app
+    import_s = time.perf_counter() - start
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            health = (await client.get("/health")).status_code
+            ready = (await client.get("/ready")).status_code
+    return {"import_s": import_s, "health": health, "ready": ready}
+
+
+def _child(args):
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    result = asyncio.run(_child_degraded() if args.degraded else _child_ready(args.timeout))
+    print(json.dumps(result), flush=True)
+    # Skip interpreter shutdown: a warm-up thread may still be waiting on an unreachable Milvus
+    os._exit(0)
+
+
+def _spawn(args) -> dict:
+    env = dict(os.environ)
+    # The telemetry exporter and the persistent caches are not part of what is measured
+    env.setdefault("MLFLOW_TRACKING_URI", "file:///tmp/rag-bench-mlruns")
+    env.setdefault("MLFLOW_ALLOW_FILE_STORE", "true")
+    env.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+    env.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+    if args.degraded:
+        env.pop("OPENAI_API_KEY", None)
+        env["MILVUS_URI"] = "http://127.0.0.1:9"
+    else:
+        # The embedding service is built before its model is swapped for the fake and needs a key
+        env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    command = [sys.executable, "-m", "src.bench.startup", "--child", "--timeout", str(args.timeout)]
+    if args.degraded:
+        command.append("--degraded")
+    completed = subprocess.run(command, env=env, capture_output=True, text=True, timeout=args.timeout + 60)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Startup run failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for /ready")
+    parser.add_argument("--degraded", action="store_true",
+                        help="Start without an API key and with Milvus unreachable; check /health and /ready")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args)
+        return
+
+    if args.degraded:
+        result = _spawn(args)
+        print(f"import {result['import_s'] * 1000:.0f} ms, /health {result['health']}, /ready {result['ready']}")
+        if result["health"] != 200 or result["ready"] != 503:
+            print("Expected /health 200 and /ready 503")
+            sys.exit(1)
+        return
+
+    runs = [_spawn(args) for _ in range(args.runs)]
+    for key, label in (("import_s", "import src.api.main"), ("lifespan_s", "lifespan startup"),
+                       ("ready_s", "lifespan start to /ready")):
+        values = [run[key] * 1000 for run in runs]
+        print(f"{label:<26} median {statistics.median(values):>7.0f} ms  (min {min(values):.0f}, max {max(values):.0f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Offline benchmark suite: ingestion throughput, end-to-end /api/v1/chat latency
+and throughput, and per-node overhead, against deterministic fakes:
+hash-based embeddings, a scripted chat model and an in-memory vector store
+(see src.bench.fakes). Needs no API key, network or Milvus, so graph, API and
+ingestion changes can be compared commit to commit.
+
+The corpus is synthetic: each document is about one "topic" of made-up words,
+and each question uses words of one topic, so retrieval returns real hits and
+requests take the same routes through the graph on every run.
+
+Phases:
+  ingestion  full ingestion of the corpus, then an unchanged re-run (manifest skip path)
+  chat       /chat throughput and latency per concurrency level, with backend latencies
+  sessions   multi-turn conversations (a question, then close follow-ups), with and
+             without a thread_id: follow-ups in a session reuse the graded chunks
+  overhead   sequential /chat requests with zero-latency fakes; the time left per graph
+             node (and per request) is this service's own overhead
+
+Usage:
+    python -m src.bench.suite --output bench.json
+    python -m src.bench.suite --compare bench.json --max-regression 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+TOPICS = 40
+WORDS_PER_TOPIC = 30
+COMMON_WORDS = 300
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice("bcdfghjklmnprstvz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+
+
+def make_corpus(documents: int, words_per_document: int = 450, seed: int = 0) -> Tuple[List[Dict], List[str]]:
+    """Synthetic documents (one topic each, padded with common words) and one question per topic."""
+    rng = random.Random(seed)
+    common = [_word(rng) for _ in range(COMMON_WORDS)]
+    topics = [[_word(rng) for _ in range(WORDS_PER_TOPIC)] for _ in range(TOPICS)]
+
+    corpus = []
+    for i in range(documents):
+        topic = topics[i % TOPICS]
+        words = [rng.choice(topic) if rng.random() < 0.4 else rng.choice(common) for _ in range(words_per_document)]
+        sentences = [" ".join(words[j:j + 15]).capitalize() + "." for j in range(0, len(words), 15)]
+        corpus.append({"text": " ".join(sentences), "source": f"bench_doc_{i:05d}.txt"})
+    questions = [f"What about {' '.join(rng.sample(topic, 6))}?" for topic in topics]
+    return corpus, questions
+
+
+def make_conversations(questions: List[str], turns: int, seed: int = 1) -> List[List[str]]:
+    """One conversation per question: the question, then follow-ups reusing most of its words."""
+    rng = random.Random(seed)
+    conversations = []
+    for question in questions:
+        words = question[len("What about "):-1].split()
+        followups = [f"And {' '.join(rng.sample(words, len(words) - 1))}?" for _ in range(turns - 1)]
+        conversations.append([question] + followups)
+    return conversations
+
+
+def _stage_totals() -> Dict[str, List[float]]:
+    """stage -> [seconds, count] from the rag_stage_duration_seconds histogram."""
+    from src.core.metrics import STAGE_LATENCY
+
+    totals: Dict[str, List[float]] = {}
+    for metric in STAGE_LATENCY.collect():
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                totals.setdefault(stage, [0.0, 0])[0] = sample.value
+            elif sample.name.endswith("_count"):
+                totals.setdefault(stage, [0.0, 0])[1] = sample.value
+    return totals
+
+
+def _set_latencies(llm: float, embed: float, search: float, collections: Dict[str, Any]):
+    from src.core.container import container
+
+    container.llm.latency = llm
+    container.embeddings.model.latency = embed
+    for collection in collections.values():
+        collection.latency = search
+
+
+async def bench_ingestion(args, documents: List[Dict]) -> Dict[str, float]:
+    from src.ingestion.pipeline import IngestionPipeline
+
+    pipeline = IngestionPipeline()
+    start = time.perf_counter()
+    await pipeline.arun(documents)
+    seconds = time.perf_counter() - start
+    chunks = pipeline.milvus.get_collection().num_entities
+
+    start = time.perf_counter()
+    await pipeline.arun(documents)
+    rerun_seconds = time.perf_counter() - start
+
+    return {
+        "documents": len(documents),
+        "chunks": chunks,
+        "seconds": seconds,
+        "chunks_per_s": chunks / seconds,
+        "unchanged_rerun_seconds": rerun_seconds,
+    }
+
+
+async def bench_chat(args, client, questions: List[str]) -> List[Dict[str, Any]]:
+    from src.bench.chat_load import _run_level
+
+    levels = []
+    for concurrency in args.concurrency:
+        level = await _run_level(client, concurrency, args.requests, questions=questions)
+        level["routes"] = {route: {"requests": n, "p50_ms": p50} for route, (n, p50) in level["routes"].items()}
+        levels.append(level)
+    return levels
+
+
+async def bench_sessions(args, client, questions: List[str]) -> Dict[str, float]:
+    from src.bench.chat_load import _percentile
+
+    conversations = make_conversations(questions[:args.conversations], args.turns)
+    results: Dict[str, float] = {}
+    for mode in ("stateless", "session"):
+        followups: List[float] = []
+        recalled = 0
+
+        async def converse(i: int, conversation: List[str]):
+            nonlocal recalled
+            body = {"thread_id": f"bench-{mode}-{i}"} if mode == "session" else {}
+            for turn, question in enumerate(conversation):
+                start = time.perf_counter()
+                response = await client.post("/api/v1/chat", json={"question": question, **body})
+                response.raise_for_status()
+                if turn:
+                    followups.append((time.perf_counter() - start) * 1000)
+                    recalled += response.json()["route"][0] == "recall"
+
+        # Conversations run side by side; the turns of one conversation one after another
+        await asyncio.gather(*(converse(i, c) for i, c in enumerate(conversations)))
+        results[f"{mode}_followup_p50_ms"] = _percentile(followups, 50)
+        results[f"{mode}_followup_p95_ms"] = _percentile(followups, 95)
+        results[f"{mode}_recall_rate"] = recalled / len(followups)
+    return results
+
+
+async def bench_overhead(args, client, questions: List[str]) -> Dict[str, float]:
+    before = _stage_totals()
+    start = time.perf_counter()
+    for i in range(args.overhead_requests):
+        response = await client.post("/api/v1/chat", json={"question": questions[i % len(questions)]})
+        response.raise_for_status()
+    elapsed = time.perf_counter() - start
+
+    overhead = {"request_ms": elapsed / args.overhead_requests * 1000}
+    for stage, (seconds, count) in sorted(_stage_totals().items()):
+        seconds_before, count_before = before.get(stage, (0.0, 0))
+        if count > count_before:
+            overhead[f"{stage}_ms"] = (seconds - seconds_before) / (count - count_before) * 1000
+    return overhead
+
+
+async def run_suite(args) -> Dict[str, Any]:
+    import httpx
+    from src.bench.fakes import HashEmbeddings, StubChatModel, in_memory_milvus
+    from src.core.config import settings
+
+    random.seed(0)  # A/B strategy split
+    documents, questions = make_corpus(args.documents)
+    embeddings = HashEmbeddings(dim=settings.EMBEDDING_DIMENSION, latency=args.embed_latency)
+
+    with in_memory_milvus(latency=args.search_latency) as collections:
+        from src.api.main import app
+        from src.core.container import container
+
+        container.override(llm=StubChatModel(
+            latency=args.llm_latency,
+            script=["Scripted answer built from the retrieved context.", "What about the same topic, in other words?"],
+        ))
+        # Shared by the API and the ingestion pipeline
+        container.embeddings.model = embeddings
+        # No tiktoken download offline; batching falls back to ~4 chars per token
+        container.embeddings._encoding = False
+
+        results: Dict[str, Any] = {"ingestion": await bench_ingestion(args, documents)}
+        print(f"ingestion: {results['ingestion']['chunks']} chunks in {results['ingestion']['seconds']:.2f}s")
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            results["chat"] = await bench_chat(args, client, questions)
+            results["sessions"] = await bench_sessions(args, client, questions)
+            _set_latencies(0.0, 0.0, 0.0, collections)
+            results["overhead"] = await bench_overhead(args, client, questions)
+        # No lifespan runs under ASGITransport: close the session store here (its thread blocks exit)
+        await container.aclose()
+    return results
+
+
+def flatten(results: Dict[str, Any]) -> Dict[str, float]:
+    """Comparable scalar metrics: name -> value."""
+    flat = {f"ingestion.{k}": v for k, v in results["ingestion"].items() if k in ("chunks_per_s", "unchanged_rerun_seconds")}
+    for level in results["chat"]:
+        for key in ("throughput_rps", "p50_ms", "p95_ms"):
+            flat[f"chat.c{level['concurrency']}.{key}"] = level[key]
+    flat.update({f"sessions.{k}": v for k, v in results.get("sessions", {}).items() if k.endswith("_ms")})
+    flat.update({f"overhead.{k}": v for k, v in results["overhead"].items()})
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Prints per-metric changes against a baseline run; returns the metrics that regressed too much."""
+    if current.get("config") != baseline.get("config"):
+        print("\nWarning: baseline was run with different options; changes are not like for like")
+    now, before = flatten(current), flatten(baseline)
+    regressions = []
+    print(f"\n{'metric':<42} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name in sorted(now.keys() & before.keys()):
+        if not before[name]:
+            continue
+        change = now[name] / before[name] - 1
+        higher_is_better = name.endswith(("_per_s", "_rps"))
+        worse = -change if higher_is_better else change
+        flag = " REGRESSION" if worse > max_regression else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<42} {before[name]:>10.2f} {now[name]:>10.2f} {change:>+7.0%}{flag}")
+    return regressions
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=400, help="Synthetic documents to ingest")
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--conversations", type=int, default=16, help="Multi-turn conversations per mode")
+    parser.add_argument("--turns", type=int, default=4, help="Turns per conversation")
+    parser.add_argument("--overhead-requests", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per scripted LLM call")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per embedding call")
+    parser.add_argument("--search-latency", type=float, default=0.005, help="Seconds per vector search")
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    parser.add_argument("--compare", default=None, help="Baseline JSON from an earlier run")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="With --compare: exit 1 if a metric is this much worse (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    # The embedding service is built before its model is swapped for the fake and needs a key,
+    # even though no request leaves the process
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # Measure the pipeline, not the caches; keep local state out of the working tree
+    os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+    os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+    os.environ["INGEST_MANIFEST_DIR"] = os.path.join(workdir, "manifests")
+    os.environ["BM25_INDEX_PATH"] = os.path.join(workdir, "bm25.sqlite3")
+    os.environ["SESSION_DB_PATH"] = os.path.join(workdir, "sessions.sqlite3")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    results = asyncio.run(run_suite(args))
+    results["commit"] = _git_commit()
+    results["config"] = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+
+    print(f"\n{'concurrency':>11} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for level in results["chat"]:
+        print(f"{level['concurrency']:>11} {level['throughput_rps']:>9.1f} {level['p50_ms']:>9.1f} {level['p95_ms']:>9.1f}")
+    sessions = results["sessions"]
+    print(f"\nfollow-up turns, p50: {sessions['stateless_followup_p50_ms']:.1f} ms stateless, "
+          f"{sessions['session_followup_p50_ms']:.1f} ms in a session "
+          f"({sessions['session_recall_rate']:.0%} reused the session's chunks)")
+    print("\nper-request overhead with zero-latency backends:")
+    for name, value in results["overhead"].items():
+        print(f"  {name:<36} {value:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.max_regression:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from src.core.concurrency import time_left
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Admission control for the chat endpoints. Past capacity, queueing more work
+# only makes every request slower; instead a bounded number of requests run,
+# a bounded number wait, and the rest are turned away at once with a status the
+# client (or load balancer) can retry on. Requests admitted close to capacity
+# run in degraded mode (see DEGRADED_UTILIZATION).
+
+class Overloaded(Exception):
+    """A request turned away by admission control: 429 (queue full) or 503 (queued too long)."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = settings.ADMISSION_RETRY_AFTER_SECONDS
+
+class AdmissionController:
+    """
+    At most `max_in_flight` admitted requests (0: unlimited) and `queue_size` waiting
+    ones, per process. Waiting is bounded by `queue_timeout` and the request's deadline.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+    ):
+        self.max_in_flight = settings.ADMISSION_MAX_IN_FLIGHT if max_in_flight is None else max_in_flight
+        self.queue_size = settings.ADMISSION_QUEUE_SIZE if queue_size is None else queue_size
+        self.queue_timeout = settings.ADMISSION_QUEUE_TIMEOUT_SECONDS if queue_timeout is None else queue_timeout
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.degraded = 0
+        self.rejected_queue_full = 0
+        self.rejected_queue_timeout = 0
+
+    def _degraded(self) -> bool:
+        return self.max_in_flight > 0 and self.in_flight >= settings.DEGRADED_UTILIZATION * self.max_in_flight
+
+    async def acquire(self) -> bool:
+        """
+        Waits for a slot; raises Overloaded when the request is turned away.
+        Returns True when the request should run in degraded mode.
+        Every successful acquire must be paired with a `release`.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # A semaphore belongs to one event loop; start over when used from another
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_in_flight) if self.max_in_flight > 0 else None
+        if self._slots is not None and self._slots.locked():
+            if self.waiting >= self.queue_size:
+                self.rejected_queue_full += 1
+                raise Overloaded(429, "Server busy: admission queue full")
+            timeout = self.queue_timeout
+            left = time_left()
+            if left is not None:
+                timeout = min(timeout, max(left, 0.0))
+            self.waiting += 1
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.rejected_queue_timeout += 1
+                raise Overloaded(503, "Server busy: timed out in the admission queue") from None
+            finally:
+                self.waiting -= 1
+        elif self._slots is not None:
+            await self._slots.acquire()
+
+        self.in_flight += 1
+        self.admitted += 1
+        degraded = self._degraded()
+        self.degraded += degraded
+        return degraded
+
+    def release(self):
+        self.in_flight -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[bool]:
+        """`acquire` ... `release` around the enclosed block, which receives the degraded flag."""
+        degraded = await self.acquire()
+        try:
+            yield degraded
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "degraded": self.degraded,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_queue_timeout": self.rejected_queue_timeout,
+        }
+
+admission = AdmissionController()
@@ -0,0 +1,117 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Set, Tuple, TypeVar
+from src.core.concurrency import shared_context
+
+# Micro-batching for the per-request retrieval calls (query embedding, vector search).
+# Concurrent requests each need one embedding and one search; the embeddings API
+# and Milvus both take batches, so calls arriving within a short window are sent
+# as one request and the results are fanned back out to the callers.
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects items submitted within `max_wait` seconds (or until `max_batch_size`
+    are queued) and resolves them with a single `batch_fn(items)` call, which must
+    return one result per item, in order. When no batch is in flight the window
+    is a single event-loop tick, so an idle service adds no latency.
+
+    Items with the same key are coalesced: while one is queued or in flight, later
+    submissions with that key wait for its result instead of adding a duplicate.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[T]], Awaitable[List[R]]],
+        max_batch_size: int,
+        max_wait: float,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self.coalesced = 0
+        self._reset(None)
+
+    def _reset(self, loop: Optional[asyncio.AbstractEventLoop]):
+        # Futures and timers belong to one event loop; start over when used from another
+        self._loop = loop
+        self._queued: Dict[Hashable, Tuple[T, asyncio.Future]] = {}
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._timer: Optional[asyncio.Handle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, item: T, key: Optional[Hashable] = None) -> R:
+        """Queues `item` (deduplicated by `key`, default the item itself) and waits for its result."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._reset(loop)
+        key = item if key is None else key
+
+        future = self._in_flight.get(key)
+        if future is None and key in self._queued:
+            future = self._queued[key][1]
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = loop.create_future()
+            self._queued[key] = (item, future)
+            if len(self._queued) >= self.max_batch_size:
+                self._flush()
+            elif self._timer is None:
+                if self._tasks:
+                    # A batch is already in flight: hold the window open to gather more
+                    self._timer = loop.call_later(self.max_wait, self._flush)
+                else:
+                    # Idle: don't add latency, just gather whatever arrives in this loop tick
+                    self._timer = loop.call_soon(self._flush)
+
+        # Shielded: one caller giving up must not cancel the result others are waiting for
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._queued:
+            return
+        batch, self._queued = self._queued, {}
+        self._in_flight.update((key, future) for key, (_, future) in batch.items())
+        # The batch serves several requests: it runs without the deadline of the one that triggered it
+        task = self._loop.create_task(self._run(batch), context=shared_context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[Hashable, Tuple[T, asyncio.Future]]):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.batch_fn([item for item, _ in batch.values()])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch function returned {len(results)} results for {len(batch)} items")
+        except BaseException as e:
+            for _, future in batch.values():
+                if not future.done():
+                    if isinstance(e, asyncio.CancelledError):
+                        future.cancel()
+                    else:
+                        future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            for (_, future), result in zip(batch.values(), results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            for key in batch:
+                self._in_flight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "coalesced": self.coalesced,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,86 @@
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Coroutine, Optional, TypeVar
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Deadline of the request being served, as a time.monotonic() value (None outside requests).
+# A context variable, so it follows the request into graph nodes and the tasks they start.
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The request ran out of its end-to-end time (REQUEST_DEADLINE_SECONDS)."""
+
+def run_sync(coro: Coroutine):
+    """Runs a coroutine to completion from sync code, even if this thread already has a running loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+def new_deadline() -> float:
+    """The deadline of a request arriving now."""
+    return time.monotonic() + settings.REQUEST_DEADLINE_SECONDS
+
+def time_left() -> Optional[float]:
+    """Seconds until the current request's deadline (negative once passed), None outside a deadline scope."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def shared_context() -> contextvars.Context:
+    """
+    A copy of the current context without the request deadline, for work shared by
+    several requests (micro-batches): one caller's deadline must not cut it short.
+    """
+    context = contextvars.copy_context()
+    context.run(_deadline.set, None)
+    return context
+
+@asynccontextmanager
+async def deadline_scope(deadline: float) -> AsyncIterator[None]:
+    """
+    Runs the enclosed block under a request deadline: stage budgets inside it are
+    capped by the time left (see run_with_budget), and the block is cancelled with
+    DeadlineExceeded when the deadline passes.
+    """
+    token = _deadline.set(deadline)
+    try:
+        async with asyncio.timeout(deadline - time.monotonic()) as scope:
+            yield
+    except asyncio.TimeoutError as e:
+        if scope.expired() and not isinstance(e, DeadlineExceeded):
+            logger.warning("Request deadline exceeded", extra={"deadline_s": settings.REQUEST_DEADLINE_SECONDS})
+            raise DeadlineExceeded() from None
+        raise
+    finally:
+        _deadline.reset(token)
+
+async def run_with_budget(stage: str, awaitable: Awaitable[T]) -> T:
+    """
+    Awaits a request-path stage within its STAGE_TIMEOUT_SECONDS budget (retries included),
+    or the time left before the request's deadline if that is shorter.
+    Raises asyncio.TimeoutError when the stage budget runs out, DeadlineExceeded when the deadline does.
+    """
+    budget = settings.STAGE_TIMEOUT_SECONDS[stage]
+    left = time_left()
+    if left is not None and left < budget:
+        try:
+            # A non-positive timeout cancels the awaitable straight away
+            return await asyncio.wait_for(awaitable, max(left, 0.0))
+        except asyncio.TimeoutError:
+            logger.warning("Request deadline exceeded", extra={"stage": stage, "left_s": round(left, 3)})
+            raise DeadlineExceeded() from None
+    try:
+        return await asyncio.wait_for(awaitable, budget)
+    except asyncio.TimeoutError:
+        logger.warning("Stage budget exceeded", extra={"stage": stage, "budget_s": budget})
+        raise
@@ -1,21 +1,313 @@
 import os
+from typing import Any, Dict, Optional, Tuple
+from pydantic import BaseModel, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+class IndexProfile(BaseModel):
+    """
+    A named vector index configuration: how the index is built and searched.
+    The metric must be the same at build and search time.
+    """
+    index_type: str
+    metric_type: str = "COSINE"
+    build_params: Dict[str, Any] = {}
+    search_params: Dict[str, Any] = {}
+
+    @property
+    def higher_is_better(self) -> bool:
+        """COSINE/IP return similarities; L2 returns distances."""
+        return self.metric_type in ("COSINE", "IP")
+
+    def similarity(self, score: float) -> float:
+        """
+        Converts a search score to cosine similarity, assuming unit-normalized vectors.
+        Milvus L2 scores are squared Euclidean distances, so cos = 1 - d / 2.
+        """
+        return 1 - score / 2 if self.metric_type == "L2" else score
+
+# OpenAI embeddings are unit-normalized, so COSINE/IP and L2 rank identically;
+# COSINE is preferred for new profiles because its scores are easy to threshold.
+DEFAULT_INDEX_PROFILES: Dict[str, IndexProfile] = {
+    # Exact search; the recall baseline
+    "flat": IndexProfile(index_type="FLAT"),
+    # Original configuration (kept as default so existing collections keep working)
+    "ivf_flat": IndexProfile(
+        index_type="IVF_FLAT", metric_type="L2",
+        build_params={"nlist": 128}, search_params={"nprobe": 10},
+    ),
+    "hnsw": IndexProfile(
+        index_type="HNSW",
+        build_params={"M": 16, "efConstruction": 200}, search_params={"ef": 64},
+    ),
+    # Compressed: ~1/48 of IVF_FLAT memory at 1536 dims, lower recall
+    "ivf_pq": IndexProfile(
+        index_type="IVF_PQ",
+        build_params={"nlist": 1024, "m": 64, "nbits": 8}, search_params={"nprobe": 32},
+    ),
+    # Graph index served mostly from disk (Milvus standalone/distributed only)
+    "diskann": IndexProfile(
+        index_type="DISKANN", search_params={"search_list": 100},
+    ),
+}
+
+# Answer prompts a variant can use: the keys of src.agent.nodes.GENERATE_PROMPTS
+GENERATE_PROMPT_NAMES = ("A", "B")
+
+class Variant(BaseModel):
+    """
+    One arm of the experiment (EXPERIMENT_VARIANTS): its share of traffic and what it
+    changes. Unset fields keep the service's own settings.
+    """
+    weight: float = 1.0                 # Relative share of traffic (0 takes the variant out)
+    prompt: str = "A"                   # Answer prompt template (src.agent.nodes.GENERATE_PROMPTS)
+    model: Optional[str] = None         # Chat model of the generate stage (default LLM_MODEL)
+    top_k: Optional[int] = None         # Chunks in the prompt (CONTEXT_MAX_DOCUMENTS; RETRIEVER_TOP_K with RERANKER=none)
+    search_params: Dict[str, Any] = {}  # Over the index profile's search params, e.g. {"nprobe": 32}
+
 class Settings(BaseSettings):
     PROJECT_NAME: str = "RAG Ops System"
     API_V1_STR: str = "/api/v1"
     ENVIRONMENT: str = "development"
     
-    OPENAI_API_KEY: str
+    # Only needed once an OpenAI client is used (clients are built lazily, see src.core.container)
+    OPENAI_API_KEY: Optional[str] = None
+    # Point at an OpenAI-compatible server (e.g. src.bench.fake_embedding_server)
+    OPENAI_BASE_URL: Optional[str] = None
+    LLM_MODEL: str = "gpt-4o-mini"
+
+    # One pooled HTTP client (keep-alive, HTTP/2 when the `h2` package is installed) is shared
+    # by every OpenAI-compatible client in the process. They all call one host (OPENAI_BASE_URL),
+    # so these limits are effectively per host.
+    HTTP2_ENABLED: bool = True
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    # Per-stage budgets on the request path: total seconds for a stage (all attempts
+    # included) and retries of a failed call within it, so one slow grader or
+    # rewrite call cannot use up the time the answer needs
+    STAGE_TIMEOUT_SECONDS: Dict[str, float] = {
+        "query_embedding": 5.0,
+        "grade_documents": 8.0,
+        "rewrite_query": 8.0,
+        "generate": 30.0,
+        "summarize": 10.0,
+    }
+    STAGE_MAX_RETRIES: Dict[str, int] = {
+        "query_embedding": 2,
+        "grade_documents": 1,
+        "rewrite_query": 1,
+        "generate": 2,
+        "summarize": 1,
+    }
+    # End-to-end budget of a chat request, admission queueing included. Stage budgets are
+    # capped by the time left, and the request fails with 504 when it runs out.
+    REQUEST_DEADLINE_SECONDS: float = 30.0
+
+    # Admission control for /chat and /chat/stream (per process). Requests beyond
+    # ADMISSION_MAX_IN_FLIGHT wait in a queue of ADMISSION_QUEUE_SIZE: a request finding
+    # it full gets 429 at once, one still queued after ADMISSION_QUEUE_TIMEOUT_SECONDS gets 503.
+    ADMISSION_MAX_IN_FLIGHT: int = 64  # 0 disables admission control
+    ADMISSION_QUEUE_SIZE: int = 64
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 2.0
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1  # Retry-After header of 429/503 responses
+    # Degraded mode, for requests admitted while this share of ADMISSION_MAX_IN_FLIGHT is busy:
+    # borderline chunks are kept without the LLM grader, queries are not rewritten,
+    # and semantic cache matches down to DEGRADED_CACHE_THRESHOLD are served
+    DEGRADED_UTILIZATION: float = 0.75  # Above 1 disables degraded mode
+    DEGRADED_CACHE_THRESHOLD: float = 0.85
+
+    # Startup: build clients, load the collection and open connections before /ready reports OK
+    WARMUP_ENABLED: bool = True
 
     # Milvus
     MILVUS_URI: str = "http://localhost:19530"
     MILVUS_COLLECTION_NAME: str = "rag_knowledge_base"
     EMBEDDING_DIMENSION: int = 1536 
+    # Vector index: name of an entry in VECTOR_INDEX_PROFILES.
+    # Changing the profile of an existing collection requires re-creating it.
+    VECTOR_INDEX_PROFILE: str = "ivf_flat"
+    VECTOR_INDEX_PROFILES: Dict[str, IndexProfile] = DEFAULT_INDEX_PROFILES
+    RETRIEVER_TOP_K: int = 3
+    # Retrieval: "dense" (vectors only) or "hybrid" (vectors + BM25 fused with RRF)
+    RETRIEVAL_MODE: str = "dense"
+    # Local BM25 index, written by ingestion in hybrid mode only; API replicas need this file.
+    # Switching an ingested knowledge base to hybrid needs a full re-ingestion (clear INGEST_MANIFEST_DIR).
+    BM25_INDEX_PATH: str = ".bm25_index.sqlite3"
+    HYBRID_CANDIDATES: int = 20       # Hits taken from each retriever before fusion
+    HYBRID_DENSE_WEIGHT: float = 1.0
+    HYBRID_SPARSE_WEIGHT: float = 1.0
+    HYBRID_RRF_K: int = 60
+    # pymilvus is synchronous; searches run on a bounded thread pool
+    # so they never block the event loop.
+    MILVUS_SEARCH_MAX_WORKERS: int = 8
+    # gRPC connections (aliases) per worker process, used round-robin for searches
+    MILVUS_CONNECTION_POOL_SIZE: int = 2
+    # Micro-batching: concurrent requests' query embeddings and searches are sent
+    # as one API call / one multi-vector search; identical in-flight queries run once
+    QUERY_BATCHING_ENABLED: bool = True
+    QUERY_BATCH_MAX_SIZE: int = 32
+    QUERY_BATCH_MAX_WAIT_MS: float = 2.0
+
+    # Embeddings
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_BATCH_MAX_TOKENS: int = 100_000  # Per request (API limit is 300k)
+    EMBEDDING_BATCH_MAX_TEXTS: int = 512       # Per request (API limit is 2048)
+    EMBEDDING_MAX_IN_FLIGHT: int = 8
+    EMBEDDING_RPM_LIMIT: int = 3_000           # Match your OpenAI tier
+    EMBEDDING_TPM_LIMIT: int = 1_000_000
+    EMBEDDING_MAX_RETRIES: int = 6             # Ingestion batches (queries: STAGE_MAX_RETRIES)
+    EMBEDDING_REQUEST_TIMEOUT_SECONDS: float = 60.0
+    # Persistent cache keyed by (model, text hash); float32 BLOBs in SQLite + in-memory LRU
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = ".embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 200_000    # ~1.2 GB on disk at 1536 dims
+    EMBEDDING_CACHE_MEMORY_ENTRIES: int = 10_000  # ~60 MB
+
+    # Ingestion (streaming: chunker -> embedder -> inserter)
+    INGEST_CHUNK_BATCH_SIZE: int = 256    # Chunks handed to one embedding call
+    INGEST_INSERT_BATCH_SIZE: int = 1000  # Rows per Milvus insert
+    INGEST_QUEUE_SIZE: int = 2            # Batches buffered between stages
+    INGEST_MANIFEST_DIR: str = ".ingest_manifest"  # Per-source record of ingested chunk IDs
+    # A run is the whole corpus: chunks of sources it no longer contains are deleted
+    INGEST_PRUNE_MISSING_SOURCES: bool = True
+
+    # Bulk answering (POST /chat/batch, python -m src.agent.batch): questions are embedded
+    # and searched BATCH_CHUNK_SIZE at a time, BATCH_SEARCH_SIZE query vectors per Milvus
+    # search, then run through the graph with at most BATCH_MAX_CONCURRENCY in flight
+    BATCH_MAX_ITEMS: int = 1000  # Per /chat/batch call (the CLI job streams any number)
+    BATCH_CHUNK_SIZE: int = 256
+    BATCH_SEARCH_SIZE: int = 64
+    BATCH_MAX_CONCURRENCY: int = 32
+
+    # Agent
+    # Upper bound on grader LLM calls issued at once for a single request
+    GRADER_MAX_CONCURRENCY: int = 8
+    # Adaptive routing, thresholds in cosine similarity of each hit to the query:
+    # hits at/above ACCEPT skip the LLM grader, hits below REJECT are dropped without it
+    ROUTING_ACCEPT_SIMILARITY: float = 0.6
+    ROUTING_REJECT_SIMILARITY: float = 0.2
+    # Query rewrites (each followed by a new retrieval) before answering "no context"
+    ROUTING_MAX_REWRITES: int = 1
+    # Reranking: retrieval returns RERANK_CANDIDATES hits (instead of RETRIEVER_TOP_K), the reranker
+    # rescores them and the best are packed into the prompt. RERANKER is "lexical" (query-term
+    # coverage blended with the vector score, no model), "cross_encoder" (RERANK_MODEL on CPU, needs
+    # the `rerank` extra), "none" (top RETRIEVER_TOP_K hits in retrieval order, no rerank node) or
+    # "package.module:factory" returning a src.agent.rerank.Reranker
+    RERANKER: str = "lexical"
+    RERANK_CANDIDATES: int = 50
+    RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_BATCH_SIZE: int = 32
+    RERANK_LEXICAL_WEIGHT: float = 0.5
+    # Rerank scores (0-1) replace the similarity thresholds above: chunks at/above ACCEPT skip the
+    # LLM grader, chunks below REJECT are never packed
+    RERANK_ACCEPT_SCORE: float = 0.5
+    RERANK_REJECT_SCORE: float = 0.15
+    # Context packing, best chunks first: at most this many chunks and tokens of context per prompt;
+    # a chunk sharing CONTEXT_DEDUP_SIMILARITY of its word 3-grams (Jaccard) with a packed one is skipped
+    CONTEXT_MAX_DOCUMENTS: int = 4
+    CONTEXT_MAX_TOKENS: int = 1000
+    CONTEXT_DEDUP_SIMILARITY: float = 0.8
+    # Conversation sessions (requests with a thread_id): the graph state is checkpointed per thread.
+    # SESSION_STORE is "sqlite", "memory" (per process) or "package.module:factory" returning any
+    # LangGraph checkpointer, e.g. a Postgres saver shared by all replicas.
+    SESSION_STORE: str = "sqlite"
+    SESSION_DB_PATH: str = ".sessions.sqlite3"
+    # Threads idle for longer are deleted (any store), checked at this interval; 0 keeps them forever
+    SESSION_TTL_SECONDS: float = 7 * 24 * 3600
+    SESSION_EXPIRY_INTERVAL_SECONDS: float = 600.0
+    SESSION_MAX_TURNS: int = 6            # Turns kept verbatim; older ones are folded into a summary
+    SESSION_TURN_MAX_CHARS: int = 2000    # Per stored answer
+    SESSION_SUMMARY_MAX_CHARS: int = 2000
+    SESSION_MAX_DOCUMENTS: int = 8        # Graded chunks kept for follow-ups
+    # A follow-up whose embedding is at least this similar to the question that found the
+    # session's chunks reuses them, skipping retrieval and grading
+    SESSION_REUSE_SIMILARITY: float = 0.75
+    # Experiments: each request gets a variant by hashing EXPERIMENT_SALT with its user_id (else
+    # thread_id), so users keep their variant; requests with neither are assigned at random.
+    # Weights are relative and buckets follow the declaration order, so raising the weight of
+    # the last variant only moves users into it (gradual roll-out). A new salt reshuffles everyone.
+    # The variant's name is the `strategy` label in metrics, MLflow tags and the semantic cache.
+    EXPERIMENT_SALT: str = "prompt-ab-v1"
+    EXPERIMENT_VARIANTS: Dict[str, Variant] = {"A": Variant(prompt="A"), "B": Variant(prompt="B")}
+    # Per-variant aggregates (requests, latency, tokens, cost, feedback) are kept in memory
+    # and sent to MLflow at this interval, one long-lived run per variant
+    EXPERIMENT_FLUSH_INTERVAL_SECONDS: float = 60.0
+    # /chat/stream: frames buffered ahead of a slow client, and disconnect polling interval
+    STREAM_BUFFER_SIZE: int = 64
+    STREAM_DISCONNECT_POLL_SECONDS: float = 0.25
+
+    # Semantic answer cache ("memory" is per-process, "milvus" is shared by all replicas)
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_BACKEND: str = "memory"
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95  # Minimum cosine similarity for a hit
+    SEMANTIC_CACHE_TTL_SECONDS: int = 3600
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1000  # Per strategy
+    SEMANTIC_CACHE_COLLECTION_NAME: str = "rag_semantic_cache"
+    # How often a "memory" cache checks whether ingestion (in any process) changed the knowledge base
+    SEMANTIC_CACHE_GENERATION_CHECK_SECONDS: float = 5.0
 
     # MLflow
     MLFLOW_TRACKING_URI: str = "http://localhost:5000"
     MLFLOW_EXPERIMENT_NAME: str = "agentic_rag_v1"
+    MLFLOW_TRACE_SAMPLING_RATIO: float = 1.0  # Fraction of requests traced by LangChain autolog
+
+    # Evaluation runner (src/eval/evaluate.py)
+    EVAL_CONCURRENCY: int = 8            # Agent runs in flight
+    EVAL_SCORE_CHUNK_SIZE: int = 50      # Items per judge call (scores are checkpointed per chunk)
+    EVAL_CACHE_PATH: str = ".eval_cache.sqlite3"
+    EVAL_JUDGE_MODEL: str = "gpt-4o-mini"
+    EVAL_MIN_FAITHFULNESS: float = 0.6
+    EVAL_MIN_RELEVANCY: float = 0.6
+    EVAL_MAX_P95_LATENCY_SECONDS: Optional[float] = None  # Latency gate (off by default)
+
+    # Telemetry exporter: request tags/metrics and feedback are queued and sent
+    # to MLflow in batches by a background thread, off the request path
+    TELEMETRY_QUEUE_SIZE: int = 10000
+    TELEMETRY_BATCH_SIZE: int = 200
+    TELEMETRY_FLUSH_INTERVAL_SECONDS: float = 2.0
+    TELEMETRY_EXPORT_CONCURRENCY: int = 8  # Request runs exported in parallel (each takes several MLflow calls)
+    TELEMETRY_DRAIN_TIMEOUT_SECONDS: float = 10.0  # On shutdown; the rest is spilled
+    TELEMETRY_OVERFLOW_POLICY: str = "spill"  # "spill" (to TELEMETRY_SPILL_PATH) or "drop"
+    TELEMETRY_SPILL_PATH: str = ".telemetry_spill.jsonl"
+    TELEMETRY_SPILL_MAX_BYTES: int = 50 * 1024 * 1024
+
+    # Logging & metrics
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" (one object per line) or "text"
+    # USD per 1M tokens (input, output), for the cost counters on /metrics;
+    # versioned model names match by prefix
+    MODEL_PRICING: Dict[str, Tuple[float, float]] = {
+        "gpt-4o-mini": (0.15, 0.60),
+        "gpt-4o": (2.50, 10.00),
+        "text-embedding-3-small": (0.02, 0.0),
+        "text-embedding-3-large": (0.13, 0.0),
+    }
+
+    @model_validator(mode="after")
+    def _check_index_profile(self):
+        if self.VECTOR_INDEX_PROFILE not in self.VECTOR_INDEX_PROFILES:
+            raise ValueError(
+                f"VECTOR_INDEX_PROFILE '{self.VECTOR_INDEX_PROFILE}' is not one of "
+                f"{sorted(self.VECTOR_INDEX_PROFILES)}"
+            )
+        return self
+
+    @model_validator(mode="after")
+    def _check_experiment(self):
+        if any(v.weight < 0 for v in self.EXPERIMENT_VARIANTS.values()):
+            raise ValueError("EXPERIMENT_VARIANTS weights must not be negative")
+        if not any(v.weight > 0 for v in self.EXPERIMENT_VARIANTS.values()):
+            raise ValueError("EXPERIMENT_VARIANTS needs at least one variant with a positive weight")
+        unknown = {name: v.prompt for name, v in self.EXPERIMENT_VARIANTS.items() if v.prompt not in GENERATE_PROMPT_NAMES}
+        if unknown:
+            raise ValueError(f"EXPERIMENT_VARIANTS use unknown prompts {unknown} (one of {list(GENERATE_PROMPT_NAMES)})")
+        return self
+
+    @property
+    def index_profile(self) -> IndexProfile:
+        """The active vector index profile."""
+        return self.VECTOR_INDEX_PROFILES[self.VECTOR_INDEX_PROFILE]
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+from langchain_core.runnables import RunnableConfig
+from src.core.config import settings
+
+if TYPE_CHECKING:
+    import httpx
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langgraph.checkpoint.base import BaseCheckpointSaver
+    from langgraph.graph.state import CompiledStateGraph
+    from src.agent.rerank import Reranker
+    from src.core.semantic_cache import SemanticCache
+    from src.ingestion.bm25 import BM25Index
+    from src.ingestion.embeddings import EmbeddingService
+    from src.ingestion.milvus_client import MilvusHandler
+
+logger = logging.getLogger(__name__)
+
+# Dependency container for the clients shared by the API, the agent graph and
+# the ingestion pipeline. Nothing is built (or connects) at import time: each
+# client, and the heavy module behind it (langchain_openai, pymilvus), is loaded
+# on first access, or ahead of the first request by `warm_up()` in the API lifespan.
+# Graph nodes take the container from `config["configurable"]["deps"]` (see
+# `get_deps`), so a run can be given other clients; benchmarks swap in fakes
+# with `container.override(...)`.
+
+# Graph stages with their own chat model (timeout and retries from STAGE_* settings)
+LLM_STAGES = ("grade_documents", "rewrite_query", "generate", "summarize")
+
+def _build_http(deps: "Container") -> "httpx.Client":
+    from src.core.http import build_http_client
+    return build_http_client()
+
+def _build_async_http(deps: "Container") -> "httpx.AsyncClient":
+    from src.core.http import build_async_http_client
+    return build_async_http_client()
+
+def _build_llm(deps: "Container", stage: str, model: Optional[str] = None) -> "BaseChatModel":
+    from langchain_openai import ChatOpenAI
+    from src.core.http import request_timeout
+
+    # We use temperature=0 for deterministic outputs in logic nodes (grading)
+    return ChatOpenAI(
+        model=model or settings.LLM_MODEL,
+        temperature=0,
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+        # Report token usage for streamed calls too (used by the cost metrics)
+        stream_usage=True,
+        # Per-attempt timeout and SDK retries for this stage; the stage's total budget
+        # is enforced by the node (see run_with_budget)
+        timeout=request_timeout(settings.STAGE_TIMEOUT_SECONDS[stage]),
+        max_retries=settings.STAGE_MAX_RETRIES[stage],
+        http_client=deps.http,
+        http_async_client=deps.async_http,
+    )
+
+def _build_milvus(deps: "Container") -> "MilvusHandler":
+    from src.ingestion.milvus_client import MilvusHandler
+    return MilvusHandler()
+
+def _build_embeddings(deps: "Container") -> "EmbeddingService":
+    from src.ingestion.embeddings import EmbeddingService
+    return EmbeddingService(http_client=deps.http, http_async_client=deps.async_http)
+
+def _build_bm25(deps: "Container") -> "BM25Index":
+    from src.ingestion.bm25 import BM25Index
+    return BM25Index()
+
+def _build_semantic_cache(deps: "Container") -> Optional["SemanticCache"]:
+    from src.core.semantic_cache import build_semantic_cache
+    # Per-process caches follow the knowledge base generation written by ingestion
+    return build_semantic_cache(generation=deps.milvus.read_generation)
+
+def _build_checkpointer(deps: "Container") -> "BaseCheckpointSaver":
+    from src.agent.sessions import build_checkpointer
+    return build_checkpointer()
+
+def _build_reranker(deps: "Container") -> Optional["Reranker"]:
+    from src.agent.rerank import build_reranker
+    return build_reranker()
+
+def _build_session_graph(deps: "Container") -> "CompiledStateGraph":
+    from src.agent.graph import build_graph
+    return build_graph(deps.checkpointer)
+
+class Container:
+    """
+    Lazily built, process-wide clients. Each property builds its client once
+    (thread-safe) and returns the same instance afterwards.
+    """
+
+    FACTORIES: Dict[str, Callable[["Container"], Any]] = {
+        "http": _build_http,
+        "async_http": _build_async_http,
+        "milvus": _build_milvus,
+        "embeddings": _build_embeddings,
+        "bm25": _build_bm25,
+        "semantic_cache": _build_semantic_cache,
+        "reranker": _build_reranker,
+        "checkpointer": _build_checkpointer,
+        "session_graph": _build_session_graph,
+    }
+
+    def __init__(self):
+        self._instances: Dict[str, Any] = {}
+        # Reentrant: factories resolve their own dependencies (e.g. the HTTP pool) through the container
+        self._lock = threading.RLock()
+
+    def _get(self, name: str, factory: Optional[Callable[["Container"], Any]] = None) -> Any:
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = (factory or self.FACTORIES[name])(self)
+            return self._instances[name]
+
+    @property
+    def http(self) -> "httpx.Client":
+        """Pooled sync HTTP client shared by the OpenAI clients (thread-safe)."""
+        return self._get("http")
+
+    @property
+    def async_http(self) -> "httpx.AsyncClient":
+        """Pooled async HTTP client shared by the OpenAI clients (on the API's event loop)."""
+        return self._get("async_http")
+
+    @property
+    def llm(self) -> "BaseChatModel":
+        """The chat model of the answer-generating stage."""
+        return self.llm_for("generate")
+
+    def llm_for(self, stage: str, model: Optional[str] = None) -> "BaseChatModel":
+        """
+        The chat model for a graph stage, with that stage's timeout and retries
+        (`model` instead of LLM_MODEL, e.g. for an experiment variant).
+        All stages share one HTTP pool; `override(llm=...)` replaces every stage's model.
+        """
+        override = self._instances.get("llm")
+        if override is not None:
+            return override
+        name = f"llm.{stage}" if model is None else f"llm.{stage}.{model}"
+        return self._get(name, lambda deps: _build_llm(deps, stage, model))
+
+    @property
+    def milvus(self) -> "MilvusHandler":
+        return self._get("milvus")
+
+    @property
+    def embeddings(self) -> "EmbeddingService":
+        return self._get("embeddings")
+
+    @property
+    def bm25(self) -> "BM25Index":
+        """Sparse index for hybrid retrieval (only opened when RETRIEVAL_MODE=hybrid uses it)."""
+        return self._get("bm25")
+
+    @property
+    def semantic_cache(self) -> Optional["SemanticCache"]:
+        """None when SEMANTIC_CACHE_ENABLED is off."""
+        return self._get("semantic_cache")
+
+    @property
+    def reranker(self) -> Optional["Reranker"]:
+        """Rescores retrieved candidates (None when RERANKER is "none")."""
+        return self._get("reranker")
+
+    @property
+    def checkpointer(self) -> "BaseCheckpointSaver":
+        """Session state store (SESSION_STORE)."""
+        return self._get("checkpointer")
+
+    @property
+    def session_graph(self) -> "CompiledStateGraph":
+        """The agent graph compiled with the checkpointer, for requests with a thread_id."""
+        return self._get("session_graph")
+
+    def built(self, name: str) -> Optional[Any]:
+        """The instance if it was already built, without building it (e.g. for metrics scrapes)."""
+        return self._instances.get(name)
+
+    def override(self, **instances: Any):
+        """Replaces clients, e.g. `container.override(llm=StubChatModel())` in benchmarks."""
+        unknown = set(instances) - set(self.FACTORIES) - {"llm"}
+        if unknown:
+            raise ValueError(f"Unknown dependencies: {sorted(unknown)}")
+        with self._lock:
+            self._instances.update(instances)
+
+    async def aclose(self):
+        """Closes the pooled HTTP connections and the session store (API shutdown)."""
+        checkpointer = self.built("checkpointer")
+        if checkpointer is not None:
+            from src.agent.sessions import close_checkpointer
+            await close_checkpointer(checkpointer)
+        async_http, http = self.built("async_http"), self.built("http")
+        if async_http is not None:
+            await async_http.aclose()
+        if http is not None:
+            http.close()
+
+    async def warm_up(self):
+        """
+        Prepares everything the first request would otherwise pay for: loads the
+        Milvus collection, builds the clients and (with WARMUP_ENABLED) opens the
+        OpenAI connections. Failures are logged, not raised: the service still
+        starts, and the first request retries.
+        """
+        start = time.perf_counter()
+        # Connect and load the collection once, so requests only pay for the search itself.
+        # If Milvus is down, start anyway: /ready reports 503 and the first search retries.
+        try:
+            await asyncio.to_thread(lambda: self.milvus.load_collection())
+        except Exception as e:
+            logger.warning("Milvus not available at startup", extra={"error": str(e)})
+
+        if settings.WARMUP_ENABLED:
+            await self._warm_clients()
+
+        logger.info("Warm-up done", extra={"seconds": round(time.perf_counter() - start, 3)})
+
+    async def _warm_clients(self):
+        # Building a client imports its SDK and loads the tokenizer: keep that off the loop
+        try:
+            await asyncio.to_thread(lambda: (
+                [self.llm_for(stage) for stage in LLM_STAGES],
+                # Experiment variants answering with another model
+                [self.llm_for("generate", v.model) for v in settings.EXPERIMENT_VARIANTS.values() if v.model],
+                self.semantic_cache,
+                # Loads the cross-encoder model, if one is configured
+                self.reranker,
+                self.embeddings.count_tokens("warm-up"),
+                self.session_graph,
+            ))
+            if settings.RETRIEVAL_MODE == "hybrid":
+                await asyncio.to_thread(lambda: self.bm25)
+        except Exception as e:
+            logger.warning("Client construction failed during warm-up", extra={"error": str(e)})
+            return
+
+        # A round-trip per client opens pooled HTTPS connections before traffic arrives
+        # (the clients share one pool, so these also warm the grader and rewrite models)
+        async def prime(name: str, call):
+            try:
+                await call()
+            except Exception as e:
+                logger.warning("Connection warm-up failed", extra={"client": name, "error": str(e)})
+
+        calls = [prime("embeddings", lambda: self.embeddings.aembed_query("warm-up"))]
+        # Opens the session store (e.g. the SQLite connection and tables)
+        setup = getattr(self.checkpointer, "setup", None)
+        if asyncio.iscoroutinefunction(setup):
+            calls.append(prime("sessions", setup))
+        root_client = getattr(self.llm, "root_async_client", None)
+        if root_client is not None:
+            calls.append(prime("llm", root_client.models.list))
+        await asyncio.gather(*calls)
+
+container = Container()
+
+def get_deps(config: Optional[RunnableConfig] = None) -> Container:
+    """The container passed in a run's config (`configurable.deps`), or the process-wide one."""
+    return ((config or {}).get("configurable") or {}).get("deps") or container
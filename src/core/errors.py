@@ -0,0 +1,45 @@
+import asyncio
+import sys
+from typing import Dict, Tuple
+from src.core.admission import Overloaded
+from src.core.concurrency import DeadlineExceeded
+from src.core.config import settings
+
+# HTTP status for a failed chat request, shared by /chat (error responses),
+# /chat/stream (`error` frames) and batch answering (error results), so clients
+# can tell "retry later" from "broken".
+
+def _upstream_unavailable(e: BaseException) -> bool:
+    """
+    OpenAI or Milvus down, unreachable or rate limiting, or the Milvus collection missing or
+    not loaded (e.g. while it is re-created); only checked if their client was ever imported.
+    Other Milvus errors (invalid search parameters, schema mismatches) would fail again on retry.
+    """
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(e, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    pymilvus = sys.modules.get("pymilvus")
+    if pymilvus is None or not isinstance(e, pymilvus.MilvusException):
+        return False
+    from src.ingestion.milvus_client import stale_handle
+
+    return stale_handle(e) or e.code == pymilvus.exceptions.ErrorCode.RATE_LIMIT
+
+def _upstream_error(e: BaseException) -> bool:
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(e, openai.APIError)
+
+def error_response(e: BaseException) -> Tuple[int, str, Dict[str, str]]:
+    """(status code, client-facing detail, headers) for an exception raised while answering."""
+    retry_after = {"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)}
+    if isinstance(e, Overloaded):
+        return e.status_code, e.detail, {"Retry-After": str(e.retry_after)}
+    if isinstance(e, DeadlineExceeded):
+        return 504, "Request deadline exceeded", {}
+    if isinstance(e, asyncio.TimeoutError):
+        return 504, "An upstream call exceeded its time budget", {}
+    if _upstream_unavailable(e):
+        return 503, "Upstream service unavailable", retry_after
+    if _upstream_error(e):
+        return 502, "Upstream service error", {}
+    return 500, "Internal error", {}
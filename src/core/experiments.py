@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from langchain_core.runnables import RunnableConfig
+from src.core.config import Variant, settings
+from src.core.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Experiment engine: sticky, weighted assignment of requests to the variants in
+# EXPERIMENT_VARIANTS, and per-variant aggregates for comparing them.
+# The assigned variant travels in the run's config (`configurable.variant`);
+# nodes read it with `get_variant`.
+
+# Latency samples kept per variant and flush window (reservoir sampling beyond that)
+_LATENCY_SAMPLES = 10_000
+# request_id -> variant, so feedback can be attributed (feedback usually follows shortly)
+_MAX_TRACKED_REQUESTS = 10_000
+
+DEFAULT_VARIANT = Variant()
+
+def get_variant(config: Optional[RunnableConfig] = None) -> Variant:
+    """The variant in a run's config (`configurable.variant`), or the service defaults."""
+    return ((config or {}).get("configurable") or {}).get("variant") or DEFAULT_VARIANT
+
+class ExperimentRouter:
+    """
+    Maps an assignment key to a variant: sha256(salt:key) gives a point in [0, 1),
+    and the variants' weights split [0, 1) into consecutive buckets. The same key
+    always lands in the same bucket while the salt and weights are unchanged.
+    """
+
+    def __init__(self, variants: Optional[Dict[str, Variant]] = None, salt: Optional[str] = None):
+        self.variants = variants if variants is not None else settings.EXPERIMENT_VARIANTS
+        self.salt = settings.EXPERIMENT_SALT if salt is None else salt
+        total = sum(v.weight for v in self.variants.values())
+        self._bounds: List[tuple] = []
+        upper = 0.0
+        for name, variant in self.variants.items():
+            if variant.weight > 0:
+                upper += variant.weight / total
+                self._bounds.append((upper, name))
+
+    def _point(self, key: Optional[str]) -> float:
+        if key is None:
+            return random.random()
+        digest = hashlib.sha256(f"{self.salt}:{key}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+    def assign(self, key: Optional[str]) -> str:
+        """The variant name for a user/thread ID (random when there is no key)."""
+        point = self._point(key)
+        for upper, name in self._bounds:
+            if point < upper:
+                return name
+        # Float rounding can leave the last bound a hair below 1.0
+        return self._bounds[-1][1]
+
+@dataclass
+class _Window:
+    """One variant's counters since the last flush."""
+    requests: int = 0
+    cache_hits: int = 0
+    latency_sum: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    feedback_count: int = 0
+    feedback_sum: float = 0.0
+
+    def metrics(self) -> Dict[str, float]:
+        metrics = {
+            "requests": self.requests,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": self.cost_usd,
+            "feedback_count": self.feedback_count,
+        }
+        if self.requests:
+            ordered = sorted(self.latencies)
+            metrics.update(
+                cache_hit_rate=self.cache_hits / self.requests,
+                latency_mean_s=self.latency_sum / self.requests,
+                latency_p50_s=ordered[int(0.50 * (len(ordered) - 1))],
+                latency_p95_s=ordered[int(0.95 * (len(ordered) - 1))],
+                cost_usd_per_request=self.cost_usd / self.requests,
+                prompt_tokens_per_request=self.prompt_tokens / self.requests,
+            )
+        if self.feedback_count:
+            metrics["feedback_mean"] = self.feedback_sum / self.feedback_count
+        return metrics
+
+class VariantStats:
+    """
+    In-memory per-variant aggregates, reset at every flush. Hot-path calls only
+    update counters under a lock; `flush` hands one aggregate event per active
+    variant to the telemetry exporter (an MLflow run per variant and salt).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows: Dict[str, _Window] = {}
+        self._requests: "OrderedDict[str, str]" = OrderedDict()
+
+    def _window(self, variant: str) -> _Window:
+        window = self._windows.get(variant)
+        if window is None:
+            window = self._windows[variant] = _Window()
+        return window
+
+    def record_request(self, request_id: str, variant: str, latency: float, cached: bool = False):
+        with self._lock:
+            window = self._window(variant)
+            window.requests += 1
+            window.cache_hits += cached
+            window.latency_sum += latency
+            if len(window.latencies) < _LATENCY_SAMPLES:
+                window.latencies.append(latency)
+            else:
+                slot = random.randrange(window.requests)
+                if slot < _LATENCY_SAMPLES:
+                    window.latencies[slot] = latency
+            self._requests[request_id] = variant
+            if len(self._requests) > _MAX_TRACKED_REQUESTS:
+                self._requests.popitem(last=False)
+
+    def record_usage(self, variant: str, prompt_tokens: int, completion_tokens: int, cost: float):
+        """One LLM call's tokens and cost (from the LLM metrics callback)."""
+        with self._lock:
+            window = self._window(variant)
+            window.llm_calls += 1
+            window.prompt_tokens += prompt_tokens
+            window.completion_tokens += completion_tokens
+            window.cost_usd += cost
+
+    def record_feedback(self, request_id: str, score: float):
+        """Feedback for a request answered by this process (others are only logged to their MLflow run)."""
+        with self._lock:
+            variant = self._requests.get(request_id)
+            if variant is None:
+                return
+            window = self._window(variant)
+            window.feedback_count += 1
+            window.feedback_sum += score
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Aggregates of the current window per variant (not reset)."""
+        with self._lock:
+            return {variant: window.metrics() for variant, window in self._windows.items()}
+
+    def flush(self):
+        """Queues the current window of every active variant for MLflow and starts a new one."""
+        with self._lock:
+            windows, self._windows = self._windows, {}
+        for variant, window in windows.items():
+            config = settings.EXPERIMENT_VARIANTS.get(variant)
+            telemetry.record_aggregate(
+                f"experiment-{settings.EXPERIMENT_SALT}-{variant}",
+                tags={
+                    "experiment_salt": settings.EXPERIMENT_SALT,
+                    "ab_test_strategy": variant,
+                    "variant_config": json.dumps(config.model_dump() if config else {}, sort_keys=True),
+                },
+                metrics=window.metrics(),
+            )
+
+    async def run(self, interval: Optional[float] = None):
+        """Flushes every EXPERIMENT_FLUSH_INTERVAL_SECONDS until cancelled, then once more (API lifespan)."""
+        interval = settings.EXPERIMENT_FLUSH_INTERVAL_SECONDS if interval is None else interval
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                self.flush()
+        finally:
+            self.flush()
+
+experiments = ExperimentRouter()
+variant_stats = VariantStats()
@@ -0,0 +1,45 @@
+import importlib.util
+import logging
+from functools import lru_cache
+from typing import Any, Dict
+import httpx
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Pooled HTTP clients for the OpenAI-compatible APIs. The process-wide instances
+# live in src.core.container (`http`, `async_http`); the OpenAI SDK sets the
+# timeout of each request, so only connection handling is configured here.
+
+@lru_cache(maxsize=1)
+def _http2_available() -> bool:
+    if not settings.HTTP2_ENABLED:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP2_ENABLED is set but the 'h2' package is missing; using HTTP/1.1 (pip install 'httpx[http2]')")
+        return False
+    return True
+
+def client_options() -> Dict[str, Any]:
+    """Keep-alive pool limits and protocol shared by the sync and async clients."""
+    return {
+        "http2": _http2_available(),
+        "limits": httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        "timeout": httpx.Timeout(None, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+    }
+
+def build_http_client() -> httpx.Client:
+    """Thread-safe: one instance serves every worker thread."""
+    return httpx.Client(**client_options())
+
+def build_async_http_client() -> httpx.AsyncClient:
+    """Bound to the event loop that first uses it: share it only within one loop."""
+    return httpx.AsyncClient(**client_options())
+
+def request_timeout(seconds: float) -> httpx.Timeout:
+    """Per-request timeout for an SDK client: `seconds` overall, with the pool's connect timeout."""
+    return httpx.Timeout(seconds, connect=min(seconds, settings.HTTP_CONNECT_TIMEOUT_SECONDS))
@@ -0,0 +1,54 @@
+import json
+import logging
+import sys
+import time
+from src.core.config import settings
+
+# Leveled, structured logging for the service.
+# Modules log through `logging.getLogger(__name__)` and pass structured fields
+# with `extra={...}`; LOG_FORMAT=json (the default) emits one JSON object per
+# line for the log pipeline, LOG_FORMAT=text is meant for local runs.
+
+# Attributes every LogRecord has; anything else came from `extra`
+_RESERVED = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single-line JSON object, including its `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        payload.update({k: v for k, v in record.__dict__.items() if k not in _RESERVED})
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with `extra` fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = " ".join(f"{k}={v}" for k, v in record.__dict__.items() if k not in _RESERVED)
+        return f"{line} {extra}" if extra else line
+
+def setup_logging():
+    """Configures the root logger from LOG_LEVEL and LOG_FORMAT (idempotent)."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if getattr(existing, "_rag_handler", False):
+            root.removeHandler(existing)
+    handler._rag_handler = True
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    # Per-request HTTP client lines would drown out the service's own logs
+    logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -0,0 +1,184 @@
+import logging
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from src.core.config import settings
+from src.core.experiments import variant_stats
+
+# Prometheus metrics for the hot path, exposed on GET /metrics.
+# Latencies are histograms, so p50/p95/p99 per stage come from
+# histogram_quantile() on the server side rather than from this process.
+
+logger = logging.getLogger(__name__)
+
+# 5 ms (cache hits, searches) up to a minute (long generations)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_LATENCY = Histogram(
+    "rag_http_request_duration_seconds", "HTTP request latency (until the last body byte)",
+    ["method", "path", "status"], buckets=LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "rag_stage_duration_seconds", "Latency per stage: node.<name>, embedding, milvus_search, llm.<node>, ...",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter("rag_stage_errors_total", "Stages that raised", ["stage"])
+GRAPH_ROUTES = Counter("rag_graph_routes_total", "Completed requests by graph route and A/B strategy", ["route", "strategy"])
+LLM_TOKENS = Counter("rag_llm_tokens_total", "LLM tokens by strategy, model, node and kind", ["strategy", "model", "node", "kind"])
+LLM_COST = Counter("rag_llm_cost_usd_total", "Estimated LLM spend from MODEL_PRICING", ["strategy", "model"])
+DEGRADED_REQUESTS = Counter(
+    "rag_degraded_requests_total", "Requests answered in a degraded mode: overload (admitted near capacity), grader_timeout",
+    ["reason"],
+)
+CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens", "Tokens of retrieved context packed into the prompt (RERANKER on)",
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000),
+)
+EMBEDDING_TOKENS = Counter("rag_embedding_tokens_total", "Tokens sent to the embeddings API", ["model"])
+EMBEDDING_COST = Counter("rag_embedding_cost_usd_total", "Estimated embeddings spend from MODEL_PRICING", ["model"])
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int = 0) -> float:
+    """USD cost from MODEL_PRICING, matching versioned names (gpt-4o-mini-2024-07-18) by prefix."""
+    matches = [name for name in settings.MODEL_PRICING if model.startswith(name)]
+    if not matches:
+        return 0.0
+    input_price, output_price = settings.MODEL_PRICING[max(matches, key=len)]
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+@contextmanager
+def track_stage(stage: str):
+    """Records the duration of the enclosed block (and an error count if it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+
+def timed_stage(stage: str):
+    """Decorator form of `track_stage` for async functions (e.g. graph nodes)."""
+    def decorator(func: Callable):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with track_stage(stage):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Times every chat model call and counts its tokens and cost, labelled with the
+    graph node that made it and the A/B strategy from the run's metadata.
+    """
+    # Cheap bookkeeping: run on the event loop, and skip the (many) chain events
+    run_inline = True
+    ignore_chain = True
+    ignore_retriever = True
+    ignore_agent = True
+
+    def __init__(self):
+        self._runs: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs):
+        metadata = metadata or {}
+        self._runs[run_id] = (
+            time.perf_counter(),
+            metadata.get("langgraph_node", "unknown"),
+            metadata.get("strategy", "unknown"),
+            metadata.get("ls_model_name", "unknown"),
+            # Batch jobs are not counted in the experiment aggregates (cost and latency per request)
+            not metadata.get("batch"),
+        )
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        start, node, strategy, model, experiment = run
+        STAGE_LATENCY.labels(f"llm.{node}").observe(time.perf_counter() - start)
+
+        input_tokens, output_tokens = 0, 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        if not (input_tokens or output_tokens):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            input_tokens = usage.get("prompt_tokens", 0)
+            output_tokens = usage.get("completion_tokens", 0)
+
+        LLM_TOKENS.labels(strategy, model, node, "prompt").inc(input_tokens)
+        LLM_TOKENS.labels(strategy, model, node, "completion").inc(output_tokens)
+        cost = estimate_cost(model, input_tokens, output_tokens)
+        LLM_COST.labels(strategy, model).inc(cost)
+        if experiment and strategy in settings.EXPERIMENT_VARIANTS:
+            variant_stats.record_usage(strategy, input_tokens, output_tokens, cost)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            STAGE_ERRORS.labels(f"llm.{run[1]}").inc()
+
+llm_metrics = LLMMetricsCallback()
+
+class StatsCollector:
+    """
+    Exposes a component's `stats()` dict (cache hit/miss counters, batching
+    counters, ...) at scrape time, so hot paths keep their plain integer counters.
+    Keys in `counter_keys` become counters, other numeric values gauges.
+    """
+
+    def __init__(self, prefix: str, stats_fn: Callable[[], Optional[Dict[str, Any]]], counter_keys: Iterable[str] = ()):
+        self.prefix = prefix
+        self.stats_fn = stats_fn
+        self.counter_keys = set(counter_keys)
+
+    def collect(self):
+        try:
+            stats = self.stats_fn()
+        except Exception:
+            logger.exception("Stats collection failed", extra={"collector": self.prefix})
+            return
+        for key, value in (stats or {}).items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{self.prefix}_{key}"
+            if key in self.counter_keys:
+                yield CounterMetricFamily(name, f"{self.prefix} {key}", value=value)
+            else:
+                yield GaugeMetricFamily(name, f"{self.prefix} {key}", value=value)
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording request latency per route template (not raw path, to bound label cardinality)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_LATENCY.labels(scope["method"], path, str(status[0])).observe(time.perf_counter() - start)
@@ -1,21 +1,35 @@
-import mlflow
+import logging
+import os
 from src.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 def setup_monitoring():
     """
     Configures MLflow tracing for LangChain.
+    Nothing here talks to the tracking server: traces are exported by MLflow's
+    async trace logger, request tags/metrics by `src.core.telemetry`.
     """
-    print(f"Setting up MLflow tracking at {settings.MLFLOW_TRACKING_URI}")
-    
+    # Imported here (not at module level): mlflow is the slowest import of the API
+    import mlflow
+
+    logger.info("Setting up MLflow tracking", extra={"tracking_uri": settings.MLFLOW_TRACKING_URI})
+
     # 1. Set the tracking URI to point to the local server
     mlflow.set_tracking_uri(settings.MLFLOW_TRACKING_URI)
-    
-    # 2. Set the experiment
-    mlflow.set_experiment(settings.MLFLOW_EXPERIMENT_NAME)
-    
-    # 3. Enable LangChain Tracing
+
+    # 2. Set the experiment by name; it is resolved (and created) on first export,
+    # so a tracking server that is down does not block startup
+    os.environ["MLFLOW_EXPERIMENT_NAME"] = settings.MLFLOW_EXPERIMENT_NAME
+
+    # 3. Export traces from a background queue instead of at the end of each request,
+    # and optionally trace only a sample of requests
+    os.environ.setdefault("MLFLOW_ENABLE_ASYNC_TRACE_LOGGING", "true")
+    os.environ.setdefault("MLFLOW_TRACE_SAMPLING_RATIO", str(settings.MLFLOW_TRACE_SAMPLING_RATIO))
+
+    # 4. Enable LangChain Tracing
     # We remove 'log_models' and other args that cause the TypeError.
     # calling autolog() without args enables the tracing system by default.
     mlflow.langchain.autolog()
-    
-    print("MLflow monitoring enabled.")
\ No newline at end of file
+
+    logger.info("MLflow monitoring enabled")
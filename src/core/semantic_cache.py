@@ -0,0 +1,379 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Semantic answer cache in front of the agent graph.
+# Entries are keyed by the (L2-normalized) query embedding and partitioned by
+# A/B strategy, since each prompt strategy produces a different answer.
+# Cached answers are dropped when ingestion changes the knowledge base: directly
+# for the shared backend, and through the knowledge base generation marker (see
+# MilvusHandler.write_generation) for per-process ones.
+
+@dataclass
+class CachedAnswer:
+    """A response previously produced by the agent graph."""
+    answer: str
+    documents: List[str]
+    similarity: float = 1.0
+
+
+class CacheBackend(ABC):
+    """
+    Storage for cached answers. Implement this to plug in another shared store.
+    Vectors passed in are already L2-normalized, so cosine similarity is a dot product.
+    """
+    # True when calls do network I/O and must be run off the event loop
+    blocking: bool = False
+    # True when every process sees the same entries (ingestion then clears them for everyone)
+    shared: bool = False
+
+    @abstractmethod
+    def lookup(self, strategy: str, vector: np.ndarray, threshold: float) -> Optional[CachedAnswer]:
+        """Returns the most similar live entry if its similarity is >= threshold."""
+
+    @abstractmethod
+    def store(self, strategy: str, vector: np.ndarray, entry: CachedAnswer) -> None:
+        """Adds an entry, evicting old ones if the backend is full."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Drops every entry (all strategies)."""
+
+    @abstractmethod
+    def size(self) -> int:
+        """Number of stored entries."""
+
+
+class _Partition:
+    """Fixed-capacity slot table for one strategy. Slots are reused in LRU order."""
+
+    def __init__(self, max_entries: int, dim: int, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self.valid = np.zeros(max_entries, dtype=bool)
+        self.expires_at = np.zeros(max_entries, dtype=np.float64)
+        self.entries: List[Optional[CachedAnswer]] = [None] * max_entries
+        self.lru: "OrderedDict[int, None]" = OrderedDict()  # least recently used first
+
+    def _free(self, slot: int):
+        self.valid[slot] = False
+        self.entries[slot] = None
+        self.lru.pop(slot, None)
+
+    def lookup(self, vector: np.ndarray, threshold: float) -> Optional[CachedAnswer]:
+        for slot in np.flatnonzero(self.valid & (self.expires_at <= time.time())):
+            self._free(int(slot))
+        if not self.lru:
+            return None
+
+        scores = self.vectors @ vector
+        scores[~self.valid] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+
+        self.lru.move_to_end(best)
+        entry = self.entries[best]
+        return CachedAnswer(answer=entry.answer, documents=entry.documents, similarity=float(scores[best]))
+
+    def store(self, vector: np.ndarray, entry: CachedAnswer):
+        free_slots = np.flatnonzero(~self.valid)
+        if len(free_slots):
+            slot = int(free_slots[0])
+        else:
+            slot, _ = self.lru.popitem(last=False)
+
+        self.vectors[slot] = vector
+        self.valid[slot] = True
+        self.expires_at[slot] = time.time() + self.ttl_seconds
+        self.entries[slot] = entry
+        self.lru[slot] = None
+        self.lru.move_to_end(slot)
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """
+    Process-local backend with TTL and per-strategy LRU eviction.
+    Lookups are a single matrix-vector product over at most `max_entries` rows.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._partitions: Dict[str, _Partition] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, strategy: str, vector: np.ndarray, threshold: float) -> Optional[CachedAnswer]:
+        with self._lock:
+            partition = self._partitions.get(strategy)
+            return partition.lookup(vector, threshold) if partition else None
+
+    def store(self, strategy: str, vector: np.ndarray, entry: CachedAnswer) -> None:
+        with self._lock:
+            partition = self._partitions.get(strategy)
+            if partition is None:
+                partition = _Partition(self.max_entries, len(vector), self.ttl_seconds)
+                self._partitions[strategy] = partition
+            partition.store(vector, entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._partitions.clear()
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(len(p.lru) for p in self._partitions.values())
+
+
+class MilvusCacheBackend(CacheBackend):
+    """
+    Shared backend stored in its own Milvus collection, so every API replica
+    sees the same entries and ingestion can invalidate them from another process.
+    Eviction is by TTL and, when a strategy is over capacity, oldest-first within it.
+    Relies on the connection opened by MilvusHandler. The collection is never dropped
+    (clearing deletes its rows), so other replicas' handles stay valid; a handle to a
+    collection dropped or re-created out of band is rebuilt on the next call.
+    """
+    blocking = True
+    shared = True
+    # A strategy's entries are trimmed every N stores to it rather than on every write
+    EVICT_EVERY = 100
+
+    def __init__(self, collection_name: str, dim: int, max_entries: int, ttl_seconds: float):
+        self.collection_name = collection_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._collection = None
+        self._stores: Dict[str, int] = {}
+
+    def _get_collection(self):
+        from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, utility
+
+        if self._collection is not None:
+            return self._collection
+
+        if utility.has_collection(self.collection_name):
+            collection = Collection(self.collection_name)
+        else:
+            fields = [
+                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+                FieldSchema(name="strategy", dtype=DataType.VARCHAR, max_length=64),
+                FieldSchema(name="answer", dtype=DataType.VARCHAR, max_length=65535),
+                FieldSchema(name="documents", dtype=DataType.VARCHAR, max_length=65535),
+                FieldSchema(name="created_at", dtype=DataType.INT64),
+                FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=self.dim),
+            ]
+            schema = CollectionSchema(fields, "Semantic answer cache for the RAG Agent")
+            collection = Collection(self.collection_name, schema)
+            collection.create_index(
+                field_name="vector",
+                index_params={"metric_type": "COSINE", "index_type": "FLAT", "params": {}},
+            )
+        collection.load()
+        self._collection = collection
+        return collection
+
+    def _with_collection(self, fn: Callable[[Any], Any]) -> Any:
+        """Calls `fn` with the collection handle, rebuilding the handle once if it went stale."""
+        from pymilvus import MilvusException
+        from src.ingestion.milvus_client import stale_handle
+
+        collection = self._get_collection()
+        try:
+            return fn(collection)
+        except MilvusException as e:
+            if not stale_handle(e):
+                raise
+            logger.warning("Semantic cache collection handle went stale; rebuilding it", extra={"error": str(e)})
+            self._collection = None
+            return fn(self._get_collection())
+
+    def _live_expr(self) -> str:
+        return f"created_at >= {int(time.time() - self.ttl_seconds)}"
+
+    def lookup(self, strategy: str, vector: np.ndarray, threshold: float) -> Optional[CachedAnswer]:
+        results = self._with_collection(lambda collection: collection.search(
+            data=[vector.tolist()],
+            anns_field="vector",
+            param={"metric_type": "COSINE", "params": {}},
+            limit=1,
+            expr=f"strategy == {json.dumps(strategy)} and {self._live_expr()}",
+            output_fields=["answer", "documents"],
+        ))
+        hits = results[0]
+        if not hits or hits[0].distance < threshold:
+            return None
+        hit = hits[0]
+        return CachedAnswer(
+            answer=hit.entity.get("answer"),
+            documents=json.loads(hit.entity.get("documents")),
+            similarity=float(hit.distance),
+        )
+
+    def store(self, strategy: str, vector: np.ndarray, entry: CachedAnswer) -> None:
+        self._with_collection(lambda collection: collection.insert([
+            [strategy],
+            [entry.answer],
+            [json.dumps(entry.documents)],
+            [int(time.time())],
+            [vector.tolist()],
+        ]))
+        self._stores[strategy] = self._stores.get(strategy, 0) + 1
+        if self._stores[strategy] % self.EVICT_EVERY == 0:
+            self._with_collection(lambda collection: self._evict(collection, strategy))
+
+    @staticmethod
+    def _count(collection, expr: str) -> int:
+        return collection.query(expr=expr, output_fields=["count(*)"])[0]["count(*)"]
+
+    def _evict(self, collection, strategy: str):
+        """Deletes expired entries, then the oldest of `strategy`'s beyond max_entries."""
+        collection.delete(f"not ({self._live_expr()})")
+        scope = f"strategy == {json.dumps(strategy)}"
+        if self._count(collection, f"{scope} and {self._live_expr()}") <= self.max_entries:
+            return
+        # Query results can't be sorted (and are capped by the query window): binary search
+        # the oldest creation second that leaves at most max_entries with count queries
+        low, high = int(time.time() - self.ttl_seconds), int(time.time()) + 1
+        while low < high:
+            middle = (low + high) // 2
+            if self._count(collection, f"{scope} and created_at >= {middle}") <= self.max_entries:
+                high = middle
+            else:
+                low = middle + 1
+        collection.delete(f"{scope} and created_at < {low}")
+
+    def clear(self) -> None:
+        self._with_collection(lambda collection: collection.delete("id >= 0"))
+
+    def size(self) -> int:
+        return self._with_collection(lambda collection: self._count(collection, "id >= 0"))
+
+
+class SemanticCache:
+    """
+    Looks up answers by query-embedding similarity. Backend errors are logged and
+    treated as misses: the cache must never fail a request.
+    With a process-local backend, `generation` (a blocking call returning the
+    knowledge base generation) is checked at most every
+    SEMANTIC_CACHE_GENERATION_CHECK_SECONDS, and the cache is cleared when it changes.
+    """
+
+    def __init__(self, backend: CacheBackend, threshold: float, generation: Optional[Callable[[], Optional[str]]] = None):
+        self.backend = backend
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._generation_source = None if backend.shared else generation
+        self._generation: Optional[str] = None
+        self._generation_checked_at = float("-inf")
+        self._generation_failing = False
+        self.generation_clears = 0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    async def _call(self, fn, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def _check_generation(self):
+        """Clears the cache if the knowledge base changed since the last check."""
+        now = time.monotonic()
+        if self._generation_source is None or now - self._generation_checked_at < settings.SEMANTIC_CACHE_GENERATION_CHECK_SECONDS:
+            return
+        self._generation_checked_at = now
+        try:
+            generation = await asyncio.to_thread(self._generation_source)
+        except Exception as e:
+            # Logged once per outage; answers keep being served until their TTL meanwhile
+            if not self._generation_failing:
+                logger.warning("Knowledge base generation check failed", extra={"error": str(e)})
+            self._generation_failing = True
+            return
+        self._generation_failing = False
+        if generation != self._generation:
+            if self.backend.size():
+                self.backend.clear()
+                self.generation_clears += 1
+                logger.info("Semantic answer cache cleared: knowledge base changed", extra={"generation": generation})
+            self._generation = generation
+
+    async def alookup(self, strategy: str, vector: List[float], threshold: Optional[float] = None) -> Optional[CachedAnswer]:
+        """The cached answer closest to `vector` at or above `threshold` (default: the cache's threshold)."""
+        await self._check_generation()
+        try:
+            result = await self._call(
+                self.backend.lookup, strategy, self._normalize(vector), self.threshold if threshold is None else threshold
+            )
+        except Exception as e:
+            logger.warning("Semantic cache lookup failed", extra={"error": str(e)})
+            result = None
+
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    async def astore(self, strategy: str, vector: List[float], answer: str, documents: List[str]):
+        entry = CachedAnswer(answer=answer, documents=documents)
+        try:
+            await self._call(self.backend.store, strategy, self._normalize(vector), entry)
+        except Exception as e:
+            logger.warning("Semantic cache store failed", extra={"error": str(e)})
+
+    def invalidate(self):
+        """Drops all cached answers. Called whenever the knowledge base changes."""
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "generation_clears": self.generation_clears,
+        }
+
+
+def build_semantic_cache(generation: Optional[Callable[[], Optional[str]]] = None) -> Optional[SemanticCache]:
+    """
+    Builds the cache configured in settings, or None when it is disabled.
+    `generation` reads the knowledge base generation (see SemanticCache).
+    """
+    if not settings.SEMANTIC_CACHE_ENABLED:
+        return None
+
+    if settings.SEMANTIC_CACHE_BACKEND == "memory":
+        backend = InMemoryCacheBackend(
+            max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS,
+        )
+    elif settings.SEMANTIC_CACHE_BACKEND == "milvus":
+        backend = MilvusCacheBackend(
+            collection_name=settings.SEMANTIC_CACHE_COLLECTION_NAME,
+            dim=settings.EMBEDDING_DIMENSION,
+            max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.SEMANTIC_CACHE_TTL_SECONDS,
+        )
+    else:
+        raise ValueError(f"Unknown SEMANTIC_CACHE_BACKEND '{settings.SEMANTIC_CACHE_BACKEND}'")
+
+    return SemanticCache(backend, threshold=settings.SEMANTIC_CACHE_THRESHOLD, generation=generation)
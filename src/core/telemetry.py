@@ -0,0 +1,387 @@
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Set
+from prometheus_client import Counter, Gauge
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Background exporter for MLflow tags, metrics and user feedback.
+# Request handlers only enqueue events (never block on the tracking server);
+# a worker thread started by the API lifespan flushes them with `log_batch`,
+# exporting the runs of a batch concurrently.
+# When the queue is full or MLflow is unreachable, events are spilled to a
+# local JSONL file and replayed once the server is back. An event MLflow
+# rejects (unknown run, invalid value) is logged and dropped, not retried.
+
+TELEMETRY_EVENTS = Counter(
+    "rag_telemetry_events_total", "Telemetry events by outcome (queued, exported, spilled, dropped, failed)", ["outcome"]
+)
+TELEMETRY_QUEUE_DEPTH = Gauge("rag_telemetry_queue_depth", "Events waiting to be exported")
+
+# MLflow's per-call limit for metrics in log_batch
+_MAX_METRICS_PER_BATCH = 1000
+
+# Tag values looked up with search_runs. MLflow's filter strings have no escaping,
+# so other values (e.g. a client-supplied request_id with a quote) are never searched for.
+_FILTERABLE = re.compile(r"[\w.:@/-]{1,256}")
+
+# MLflow errors caused by the event itself: retrying it would fail the same way
+_REJECTED_ERROR_CODES = {"RESOURCE_DOES_NOT_EXIST", "INVALID_PARAMETER_VALUE"}
+
+def _rejected(e: Exception) -> bool:
+    from mlflow.exceptions import MlflowException
+    return isinstance(e, MlflowException) and e.error_code in _REJECTED_ERROR_CODES
+
+@dataclass
+class TelemetryEvent:
+    """
+    kind="run": one request, exported as its own MLflow run (tags + metrics).
+    `run_id` is set once the run is created, and `attempted` before, so an event
+    retried after a spill completes its run instead of creating another one.
+    kind="feedback": metrics added to an existing run, found by `run_id` or by
+    the `request_id` tag of a run this exporter created.
+    kind="aggregate": metrics logged to a long-lived run named by the `aggregate`
+    tag (created on first use), e.g. per-variant experiment aggregates.
+    """
+    kind: str
+    tags: Dict[str, str] = field(default_factory=dict)
+    metrics: Dict[str, float] = field(default_factory=dict)
+    run_id: Optional[str] = None
+    request_id: Optional[str] = None
+    timestamp_ms: int = field(default_factory=lambda: int(time.time() * 1000))
+    attempted: bool = False
+
+class TelemetryExporter:
+    """
+    Bounded in-memory queue drained by one worker thread.
+    Overflow policy (TELEMETRY_OVERFLOW_POLICY): "spill" appends to the spill file
+    (up to TELEMETRY_SPILL_MAX_BYTES), "drop" discards and counts the event.
+    """
+
+    def __init__(self, tracking_uri: str = None, experiment_name: str = None, spill_path: str = None):
+        self.tracking_uri = tracking_uri or settings.MLFLOW_TRACKING_URI
+        self.experiment_name = experiment_name or settings.MLFLOW_EXPERIMENT_NAME
+        self.spill_path = spill_path or settings.TELEMETRY_SPILL_PATH
+        self._queue: "queue.Queue[Optional[TelemetryEvent]]" = queue.Queue(maxsize=settings.TELEMETRY_QUEUE_SIZE)
+        self._spill_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # Request runs take several round trips each: they are exported in parallel
+        self._run_pool = ThreadPoolExecutor(
+            max_workers=settings.TELEMETRY_EXPORT_CONCURRENCY, thread_name_prefix="telemetry-run"
+        )
+        self._client = None
+        self._experiment_id: Optional[str] = None
+        # request_id -> run_id for runs created by this process (feedback usually follows shortly)
+        self._run_ids: Dict[str, str] = {}
+        # aggregate name -> run_id
+        self._aggregate_runs: Dict[str, str] = {}
+        self._healthy = True
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- request path ---
+
+    def record_request(self, request_id: str, tags: Dict[str, str], metrics: Dict[str, float]):
+        """Queues one request's tags and metrics (exported as an MLflow run)."""
+        self._submit(TelemetryEvent(kind="run", request_id=request_id, tags={**tags, "request_id": request_id}, metrics=metrics))
+
+    def record_feedback(self, score: float, run_id: str = None, request_id: str = None):
+        """Queues a user_feedback metric for an existing run."""
+        self._submit(TelemetryEvent(kind="feedback", run_id=run_id, request_id=request_id, metrics={"user_feedback": score}))
+
+    def record_aggregate(self, name: str, tags: Dict[str, str], metrics: Dict[str, float]):
+        """Queues periodic aggregates for the long-lived run `name`."""
+        self._submit(TelemetryEvent(kind="aggregate", tags={**tags, "aggregate": name}, metrics=metrics))
+
+    def _submit(self, event: TelemetryEvent):
+        if not self.running:
+            # Not started (e.g. scripts and benchmarks without the API lifespan)
+            TELEMETRY_EVENTS.labels("dropped").inc()
+            return
+        try:
+            self._queue.put_nowait(event)
+            TELEMETRY_EVENTS.labels("queued").inc()
+        except queue.Full:
+            self._overflow([event])
+        TELEMETRY_QUEUE_DEPTH.set(self._queue.qsize())
+
+    # --- lifecycle ---
+
+    def start(self):
+        """Starts the worker thread (called from the API lifespan)."""
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._worker, name="telemetry-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        """
+        Drains the queue and stops the worker. Anything the worker could not
+        export within `timeout` seconds is spilled to disk for the next start.
+        """
+        if not self.running:
+            return
+        timeout = settings.TELEMETRY_DRAIN_TIMEOUT_SECONDS if timeout is None else timeout
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        leftover = []
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is not None:
+                leftover.append(event)
+        if leftover:
+            logger.warning("Telemetry drain timed out; spilling remaining events", extra={"events": len(leftover)})
+            self._spill(leftover)
+        self._thread = None
+
+    # --- worker ---
+
+    def _worker(self):
+        self._replay_spill()
+        stopping = False
+        while not stopping:
+            batch: List[TelemetryEvent] = []
+            deadline = time.monotonic() + settings.TELEMETRY_FLUSH_INTERVAL_SECONDS
+            while len(batch) < settings.TELEMETRY_BATCH_SIZE:
+                try:
+                    event = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if event is None:
+                    stopping = True
+                    # Drain whatever is still queued behind the sentinel
+                    while True:
+                        try:
+                            event = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if event is not None:
+                            batch.append(event)
+                    break
+                batch.append(event)
+            TELEMETRY_QUEUE_DEPTH.set(self._queue.qsize())
+
+            for start in range(0, len(batch), settings.TELEMETRY_BATCH_SIZE):
+                self._flush(batch[start:start + settings.TELEMETRY_BATCH_SIZE])
+
+    def _flush(self, batch: List[TelemetryEvent]):
+        if not batch:
+            return
+        done: Set[int] = set()
+        try:
+            self._export(batch, done)
+        except Exception as e:
+            failed = [event for i, event in enumerate(batch) if i not in done]
+            if self._healthy:
+                logger.warning("MLflow export failed; spilling events to disk", extra={"error": str(e), "events": len(failed)})
+            self._healthy = False
+            TELEMETRY_EVENTS.labels("failed").inc(len(failed))
+            self._spill(failed)
+            return
+        if not self._healthy:
+            self._healthy = True
+            logger.info("MLflow export recovered; replaying spilled events")
+            self._replay_spill()
+
+    def _mlflow(self):
+        if self._client is None:
+            from mlflow.tracking import MlflowClient
+            self._client = MlflowClient(tracking_uri=self.tracking_uri)
+        if self._experiment_id is None:
+            experiment = self._client.get_experiment_by_name(self.experiment_name)
+            self._experiment_id = (
+                experiment.experiment_id if experiment is not None
+                else self._client.create_experiment(self.experiment_name)
+            )
+        return self._client
+
+    def _export(self, batch: List[TelemetryEvent], done: Set[int]):
+        """
+        Request runs first, TELEMETRY_EXPORT_CONCURRENCY at a time (so feedback can find
+        runs of the same batch); then feedback and aggregate metrics, grouped into one
+        log_batch per run. Adds the index of every event exported or dropped to `done`:
+        any error other than a rejected event stops the export, and the rest is spilled.
+        """
+        from mlflow.entities import Metric
+
+        client = self._mlflow()
+        self._export_runs(client, batch, [i for i, event in enumerate(batch) if event.kind == "run"], done)
+        grouped: Dict[str, List[int]] = {}
+
+        for i, event in enumerate(batch):
+            if event.kind == "run":
+                continue
+            try:
+                if event.kind == "aggregate":
+                    run_id = self._aggregate_run_id(client, event)
+                else:
+                    run_id = event.run_id or self._resolve_run_id(client, event.request_id)
+            except Exception as e:
+                if not _rejected(e):
+                    raise
+                self._drop(event, e)
+                done.add(i)
+                continue
+            if run_id is None:
+                logger.warning("Feedback for unknown request dropped", extra={"request_id": event.request_id})
+                TELEMETRY_EVENTS.labels("dropped").inc()
+                done.add(i)
+                continue
+            grouped.setdefault(run_id, []).append(i)
+
+        for run_id, indexes in grouped.items():
+            metrics = [
+                Metric(key, float(value), batch[i].timestamp_ms, 0) for i in indexes for key, value in batch[i].metrics.items()
+            ]
+            try:
+                for start in range(0, len(metrics), _MAX_METRICS_PER_BATCH):
+                    client.log_batch(run_id, metrics=metrics[start:start + _MAX_METRICS_PER_BATCH])
+            except Exception as e:
+                if not _rejected(e):
+                    raise
+                # e.g. feedback for a run_id that doesn't exist
+                for i in indexes:
+                    self._drop(batch[i], e)
+            else:
+                TELEMETRY_EVENTS.labels("exported").inc(len(indexes))
+            done.update(indexes)
+
+    def _export_runs(self, client, batch: List[TelemetryEvent], indexes: List[int], done: Set[int]):
+        """Exports the request runs at `indexes` concurrently; raises the first non-rejection error after all finished."""
+        futures = {self._run_pool.submit(self._export_run, client, batch[i]): i for i in indexes}
+        error: Optional[Exception] = None
+        for future in as_completed(futures):
+            i = futures[future]
+            event = batch[i]
+            try:
+                future.result()
+            except Exception as e:
+                if not _rejected(e):
+                    error = error or e
+                    continue
+                self._drop(event, e)
+            else:
+                self._remember_run(event.request_id, event.run_id)
+                TELEMETRY_EVENTS.labels("exported").inc()
+            done.add(i)
+        if error is not None:
+            raise error
+
+    def _export_run(self, client, event: TelemetryEvent):
+        """create_run, log_batch and set_terminated; safe to repeat for the same event."""
+        from mlflow.entities import Metric
+
+        if event.run_id is None and event.attempted:
+            # An earlier attempt may have created the run before failing (e.g. its response was lost)
+            event.run_id = self._find_run(client, "request_id", event.request_id)
+        if event.run_id is None:
+            event.attempted = True
+            event.run_id = client.create_run(
+                self._experiment_id,
+                start_time=event.timestamp_ms,
+                tags=event.tags,
+                run_name=f"chat-{event.request_id[:8]}",
+            ).info.run_id
+        metrics = [Metric(key, float(value), event.timestamp_ms, 0) for key, value in event.metrics.items()]
+        for start in range(0, len(metrics), _MAX_METRICS_PER_BATCH):
+            client.log_batch(event.run_id, metrics=metrics[start:start + _MAX_METRICS_PER_BATCH])
+        client.set_terminated(event.run_id, end_time=event.timestamp_ms)
+
+    def _drop(self, event: TelemetryEvent, e: Exception):
+        logger.warning(
+            "Telemetry event rejected by MLflow; dropped",
+            extra={"kind": event.kind, "request_id": event.request_id, "run_id": event.run_id, "error": str(e)},
+        )
+        TELEMETRY_EVENTS.labels("dropped").inc()
+
+    def _remember_run(self, request_id: str, run_id: str):
+        self._run_ids[request_id] = run_id
+        if len(self._run_ids) > settings.TELEMETRY_QUEUE_SIZE:
+            self._run_ids.pop(next(iter(self._run_ids)))
+
+    def _aggregate_run_id(self, client, event: TelemetryEvent) -> str:
+        name = event.tags["aggregate"]
+        run_id = self._aggregate_runs.get(name)
+        if run_id is None:
+            run_id = self._find_run(client, "aggregate", name)
+            if run_id is None:
+                run_id = client.create_run(
+                    self._experiment_id, start_time=event.timestamp_ms, tags=event.tags, run_name=name
+                ).info.run_id
+            self._aggregate_runs[name] = run_id
+        return run_id
+
+    def _resolve_run_id(self, client, request_id: Optional[str]) -> Optional[str]:
+        if request_id is None:
+            return None
+        if request_id in self._run_ids:
+            return self._run_ids[request_id]
+        return self._find_run(client, "request_id", request_id)
+
+    def _find_run(self, client, tag: str, value: Optional[str]) -> Optional[str]:
+        """The run whose `tag` is `value`, if any (None for values that can't be put in a filter)."""
+        if value is None or not _FILTERABLE.fullmatch(value):
+            return None
+        runs = client.search_runs(
+            [self._experiment_id], filter_string=f"tags.{tag} = '{value}'", max_results=1
+        )
+        return runs[0].info.run_id if runs else None
+
+    # --- spill file ---
+
+    def _overflow(self, events: List[TelemetryEvent]):
+        if settings.TELEMETRY_OVERFLOW_POLICY == "spill":
+            self._spill(events)
+        else:
+            TELEMETRY_EVENTS.labels("dropped").inc(len(events))
+
+    def _spill(self, events: List[TelemetryEvent]):
+        with self._spill_lock:
+            try:
+                size = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+                if size >= settings.TELEMETRY_SPILL_MAX_BYTES:
+                    TELEMETRY_EVENTS.labels("dropped").inc(len(events))
+                    return
+                with open(self.spill_path, "a", encoding="utf-8") as f:
+                    for event in events:
+                        f.write(json.dumps(asdict(event)) + "\n")
+                TELEMETRY_EVENTS.labels("spilled").inc(len(events))
+            except OSError as e:
+                logger.error("Telemetry spill failed; events dropped", extra={"error": str(e), "events": len(events)})
+                TELEMETRY_EVENTS.labels("dropped").inc(len(events))
+
+    def _replay_spill(self):
+        """Exports events spilled earlier (worker thread only)."""
+        replay_path = self.spill_path + ".replay"
+        with self._spill_lock:
+            if not os.path.exists(self.spill_path):
+                return
+            os.replace(self.spill_path, replay_path)
+        with open(replay_path, encoding="utf-8") as f:
+            events = [TelemetryEvent(**json.loads(line)) for line in f if line.strip()]
+        os.remove(replay_path)
+        logger.info("Replaying spilled telemetry", extra={"events": len(events)})
+        for start in range(0, len(events), settings.TELEMETRY_BATCH_SIZE):
+            self._flush(events[start:start + settings.TELEMETRY_BATCH_SIZE])
+            if not self._healthy:
+                # Still down: the rest goes back to the spill file
+                self._spill(events[start + settings.TELEMETRY_BATCH_SIZE:])
+                break
+
+telemetry = TelemetryExporter()
@@ -0,0 +1,63 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Persistent store for evaluation runs: agent outputs and judge scores, keyed by
+# hashes of (question, strategy, agent config) and (agent key, judge config).
+# Every result is committed as soon as it is produced, so the store doubles as
+# the checkpoint of a run: re-running after a crash only does the missing work.
+
+# SQLite's default limit on bound parameters per statement is 999
+_SQL_BATCH = 500
+
+class EvalCache:
+    """SQLite-backed cache of agent outputs and judge scores (WAL, safe across threads)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outputs (key TEXT PRIMARY KEY, record TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, record TEXT NOT NULL, created REAL NOT NULL)"
+        )
+
+    def _get_many(self, table: str, keys: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                batch = keys[i:i + _SQL_BATCH]
+                marks = ",".join("?" * len(batch))
+                for key, record in self._db.execute(f"SELECT key, record FROM {table} WHERE key IN ({marks})", batch):
+                    found[key] = json.loads(record)
+        return found
+
+    def _put_many(self, table: str, records: Dict[str, Dict[str, Any]]):
+        now = time.time()
+        rows = [(key, json.dumps(record), now) for key, record in records.items()]
+        with self._lock:
+            self._db.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)", rows)
+
+    def get_outputs(self, keys: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Cached agent outputs (answer, contexts, route, latency) by key."""
+        return self._get_many("outputs", keys)
+
+    def put_output(self, key: str, record: Dict[str, Any]):
+        self._put_many("outputs", {key: record})
+
+    def get_scores(self, keys: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Cached judge scores (metric name -> value) by key."""
+        return self._get_many("scores", keys)
+
+    def put_scores(self, records: Dict[str, Dict[str, Any]]):
+        self._put_many("scores", records)
@@ -0,0 +1,161 @@
+import math
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Sequence, Tuple
+from src.core.config import settings
+
+# Local BM25 (sparse) index over the same chunks as the Milvus collection.
+# Dense embeddings are weak on exact identifiers (service names, config keys),
+# so hybrid retrieval fuses this lexical ranking with the vector ranking.
+# Scoring runs inside SQLite, so queries don't load postings into Python.
+
+# Identifiers such as MILVUS_URI, rag-backend or src.api.main stay whole
+_TOKEN_RE = re.compile(r"[a-z0-9_]+(?:[.\-/:][a-z0-9_]+)*")
+_SPLIT_RE = re.compile(r"[.\-/:_]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was "
+    "were what when where which who why will with do does did can you your i we our".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound identifiers are indexed whole and by their parts."""
+    terms = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token not in _STOPWORDS:
+            terms.append(token)
+        parts = [p for p in _SPLIT_RE.split(token) if p]
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p not in _STOPWORDS)
+    return terms
+
+class BM25Index:
+    """
+    Inverted index in SQLite keyed by the content-addressed chunk IDs used in Milvus,
+    so incremental ingestion can add and remove chunks in step with the collection.
+    """
+
+    def __init__(self, path: str = None, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or settings.BM25_INDEX_PATH, check_same_thread=False, isolation_level=None)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS docs (
+                chunk_id TEXT PRIMARY KEY, source TEXT NOT NULL, text TEXT NOT NULL, length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id);
+            -- Corpus size and total length for scoring, maintained by add/remove
+            CREATE TABLE IF NOT EXISTS stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0), n_docs INTEGER NOT NULL, total_length INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats SELECT 0, COUNT(*), COALESCE(SUM(length), 0) FROM docs;
+        """)
+
+    def add(self, chunk_ids: Sequence[str], texts: Sequence[str], sources: Sequence[str]):
+        """Indexes chunks (re-indexing any that already exist)."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._delete(chunk_ids)
+                total_length = 0
+                for chunk_id, text, source in zip(chunk_ids, texts, sources):
+                    terms = tokenize(text)
+                    counts: Dict[str, int] = {}
+                    for term in terms:
+                        counts[term] = counts.get(term, 0) + 1
+                    self._db.execute("INSERT INTO docs VALUES (?, ?, ?, ?)", (chunk_id, source, text, len(terms)))
+                    self._db.executemany(
+                        "INSERT INTO postings VALUES (?, ?, ?)",
+                        [(term, chunk_id, tf) for term, tf in counts.items()],
+                    )
+                    total_length += len(terms)
+                self._db.execute(
+                    "UPDATE stats SET n_docs = n_docs + ?, total_length = total_length + ? WHERE id = 0",
+                    (len(chunk_ids), total_length),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def remove(self, chunk_ids: Sequence[str]):
+        """Drops chunks from the index."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._delete(chunk_ids)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _delete(self, chunk_ids: Sequence[str]):
+        for i in range(0, len(chunk_ids), 500):
+            batch = list(chunk_ids[i:i + 500])
+            marks = ",".join("?" * len(batch))
+            n_docs, total_length = self._db.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs WHERE chunk_id IN ({marks})", batch
+            ).fetchone()
+            self._db.execute(
+                "UPDATE stats SET n_docs = n_docs - ?, total_length = total_length - ? WHERE id = 0",
+                (n_docs, total_length),
+            )
+            self._db.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", batch)
+            self._db.execute(f"DELETE FROM docs WHERE chunk_id IN ({marks})", batch)
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, str, str, float]]:
+        """Top `limit` chunks by BM25 as (chunk_id, text, source, score)."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            n_docs, total_length = self._db.execute("SELECT n_docs, total_length FROM stats WHERE id = 0").fetchone()
+            if not n_docs:
+                return []
+            avg_length = total_length / n_docs
+            marks = ",".join("?" * len(terms))
+            doc_freqs = dict(self._db.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({marks}) GROUP BY term", terms
+            ).fetchall())
+            if not doc_freqs:
+                return []
+
+            # Okapi BM25 with the usual +1 to keep IDF positive
+            weights = [
+                (term, math.log(1 + (n_docs - df + 0.5) / (df + 0.5)))
+                for term, df in doc_freqs.items()
+            ]
+            values = ",".join("(?, ?)" for _ in weights)
+            rows = self._db.execute(
+                f"""
+                WITH q(term, idf) AS (VALUES {values})
+                SELECT d.chunk_id, d.text, d.source,
+                       SUM(q.idf * p.tf * (? + 1) / (p.tf + ? * (1 - ? + ? * d.length / ?))) AS score
+                FROM q
+                JOIN postings p ON p.term = q.term
+                JOIN docs d ON d.chunk_id = p.chunk_id
+                GROUP BY d.chunk_id
+                ORDER BY score DESC
+                LIMIT ?
+                """,
+                [value for weight in weights for value in weight]
+                + [self.k1, self.k1, self.b, self.b, avg_length or 1.0, limit],
+            ).fetchall()
+        return [(chunk_id, text, source, float(score)) for chunk_id, text, source, score in rows]
+
+def reciprocal_rank_fusion(rankings: Iterable[Tuple[List[str], float]], k: int) -> Dict[str, float]:
+    """
+    Fuses ranked ID lists: score(id) = sum(weight / (k + rank)), rank starting at 1.
+    `rankings` is a sequence of (ranked_ids, weight) pairs.
+    """
+    scores: Dict[str, float] = {}
+    for ids, weight in rankings:
+        for rank, chunk_id in enumerate(ids, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + weight / (k + rank)
+    return scores
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Persistent embedding cache shared by ingestion, retrieval and evaluation.
+# Vectors are stored as float32 BLOBs in SQLite keyed by sha256(model, text),
+# with a small in-memory LRU in front for hot query strings.
+
+# SQLite's default limit on bound parameters per statement is 999
+_SQL_BATCH = 500
+
+class EmbeddingCache:
+    """
+    Two-level cache: in-memory LRU -> SQLite file. Safe to share across threads
+    and (thanks to WAL mode) across processes using the same file.
+    If the file cannot be opened, it degrades to the in-memory level only.
+    """
+
+    def __init__(self, path: str, model: str, max_entries: int, memory_entries: int):
+        self.model = model
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)")
+            self._count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning("Embedding cache file unavailable; using memory only", extra={"path": path, "error": str(e)})
+            self._db = None
+            self._count = 0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Cached vectors aligned with `texts`; None where the text is not cached."""
+        keys = [self._key(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            memory_found = len(found)
+
+            missing = [k for k in dict.fromkeys(keys) if k not in found]
+            if self._db is not None and missing:
+                now = time.time()
+                for i in range(0, len(missing), _SQL_BATCH):
+                    batch = missing[i:i + _SQL_BATCH]
+                    marks = ",".join("?" * len(batch))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", batch
+                    ).fetchall()
+                    if rows:
+                        self._db.execute(
+                            f"UPDATE embeddings SET last_access = ? WHERE key IN ({marks})", [now, *batch]
+                        )
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+
+            self.memory_hits += memory_found
+            self.disk_hits += len(found) - memory_found
+            self.misses += len(set(keys)) - len(found)
+
+        return [found[k].tolist() if k in found else None for k in keys]
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[List[float]]):
+        """Stores vectors, evicting the least recently used entries beyond `max_entries`."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self._key(text)
+                array = np.asarray(vector, dtype=np.float32)
+                self._remember(key, array)
+                rows.append((key, array.tobytes(), now))
+
+            if self._db is None:
+                return
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._count += self._db.total_changes - before
+
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+                self._count -= overflow
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": self._count,
+        }
@@ -1,18 +1,263 @@
-from typing import List
+import asyncio
+import logging
+import random
+import time
+from typing import TYPE_CHECKING, List, Optional, Tuple
+import openai
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
+from src.core.batching import MicroBatcher
+from src.core.concurrency import run_sync, run_with_budget
 from src.core.config import settings
+from src.core.http import request_timeout
+from src.core.metrics import EMBEDDING_COST, EMBEDDING_TOKENS, estimate_cost, track_stage
+from src.ingestion.embedding_cache import EmbeddingCache
 
-class EmbeddingService:
-    def __init__(self):
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying: rate limits and transient server/network failures
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+class RateLimiter:
+    """
+    Token buckets for the requests-per-minute and tokens-per-minute budgets.
+    Check-and-consume never awaits, so it is safe without a lock on a single event loop.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def pause(self, seconds: float):
+        """Blocks all acquisitions for `seconds` (used after the server says 429)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, tokens: int):
+        # A single batch larger than the whole budget would otherwise wait forever
+        tokens = min(tokens, self.tpm)
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._requests >= 1 and self._tokens >= tokens:
+                self._requests -= 1
+                self._tokens -= tokens
+                return
+            wait = max(
+                (1 - self._requests) * 60 / self.rpm,
+                (tokens - self._tokens) * 60 / self.tpm,
+            )
+            await asyncio.sleep(max(wait, 0.001))
+
+class EmbeddingService(Embeddings):
+    """
+    OpenAI embeddings with batching, rate limiting and a persistent cache.
+    Implements the LangChain Embeddings interface so it can be handed to
+    third-party code (e.g. Ragas) and share the same cache.
+    """
+
+    def __init__(
+        self,
+        http_client: Optional["httpx.Client"] = None,
+        http_async_client: Optional["httpx.AsyncClient"] = None,
+    ):
+        # Pass the process-wide pooled clients (src.core.container) to share connections
         self.model = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            api_key=settings.OPENAI_API_KEY
+            model=settings.EMBEDDING_MODEL,
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            # Send raw strings: batches are already token-budgeted here, and chunks
+            # are far below the model's context length, so re-tokenizing is wasted work
+            check_embedding_ctx_length=False,
+            request_timeout=request_timeout(settings.EMBEDDING_REQUEST_TIMEOUT_SECONDS),
+            # Retries happen in _embed_batch, which also honours the shared rate budget
+            max_retries=0,
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
+        self.rate_limiter = RateLimiter(
+            rpm=settings.EMBEDDING_RPM_LIMIT,
+            tpm=settings.EMBEDDING_TPM_LIMIT
+        )
+        self.cache = EmbeddingCache(
+            path=settings.EMBEDDING_CACHE_PATH,
+            model=settings.EMBEDDING_MODEL,
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+            memory_entries=settings.EMBEDDING_CACHE_MEMORY_ENTRIES
+        ) if settings.EMBEDDING_CACHE_ENABLED else None
+        # Concurrent query embeddings share one API call (see aembed_query)
+        self.query_batcher = MicroBatcher(
+            self._aembed_query_batch,
+            max_batch_size=settings.QUERY_BATCH_MAX_SIZE,
+            max_wait=settings.QUERY_BATCH_MAX_WAIT_MS / 1000
+        )
+        self._encoding = None
+
+    def count_tokens(self, text: str) -> int:
+        """Token count used for batching and rate limiting (falls back to ~4 chars/token)."""
+        if self._encoding is None:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.encoding_for_model(settings.EMBEDDING_MODEL)
+            except Exception:
+                self._encoding = False
+        if self._encoding:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+    def make_batches(self, texts: List[str]) -> List[Tuple[int, List[str], int]]:
+        """
+        Splits texts into consecutive batches bounded by EMBEDDING_BATCH_MAX_TOKENS
+        and EMBEDDING_BATCH_MAX_TEXTS. Returns (start_index, texts, token_count) tuples.
+        """
+        batches = []
+        start, current, current_tokens = 0, [], 0
+        for i, text in enumerate(texts):
+            tokens = self.count_tokens(text)
+            if current and (
+                current_tokens + tokens > settings.EMBEDDING_BATCH_MAX_TOKENS
+                or len(current) >= settings.EMBEDDING_BATCH_MAX_TEXTS
+            ):
+                batches.append((start, current, current_tokens))
+                start, current, current_tokens = i, [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append((start, current, current_tokens))
+        return batches
+
+    async def _embed_batch(
+        self, texts: List[str], tokens: int, use_async_client: bool = False, max_retries: Optional[int] = None
+    ) -> List[List[float]]:
+        """Embeds one batch within the rate budget, backing off on 429s and transient errors."""
+        max_retries = settings.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            await self.rate_limiter.acquire(tokens)
+            try:
+                with track_stage("embedding"):
+                    if use_async_client:
+                        vectors = await self.model.aembed_documents(texts)
+                    else:
+                        # The sync client runs in a worker thread: unlike the async client, it is
+                        # not bound to one event loop, so repeated sync `embed_documents` calls are safe.
+                        vectors = await asyncio.to_thread(self.model.embed_documents, texts)
+                self._record_usage(tokens)
+                return vectors
+            except RETRYABLE_ERRORS as e:
+                if attempt == max_retries:
+                    raise
+                delay = self._retry_after(e) or min(60.0, 2 ** attempt) * (0.5 + random.random())
+                if isinstance(e, openai.RateLimitError):
+                    # Everyone waits: the budget is shared by all in-flight batches
+                    self.rate_limiter.pause(delay)
+                logger.warning(
+                    "Embedding batch failed, retrying",
+                    extra={"error_type": type(e).__name__, "retry_in_s": round(delay, 2), "attempt": attempt + 1}
+                )
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _record_usage(tokens: int):
+        EMBEDDING_TOKENS.labels(settings.EMBEDDING_MODEL).inc(tokens)
+        EMBEDDING_COST.labels(settings.EMBEDDING_MODEL).inc(estimate_cost(settings.EMBEDDING_MODEL, tokens))
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Embed a list of texts."""
-        return self.model.embed_documents(texts)
+        return run_sync(self.aembed_documents(texts))
 
     def embed_query(self, text: str) -> List[float]:
-        """Embed a single query string."""
-        return self.model.embed_query(text)
\ No newline at end of file
+        """Embed a single query string (cache, rate limit and retries as in embed_documents)."""
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a list of texts without blocking the event loop.
+        Cached texts are served from the embedding cache; the rest are split into
+        token-budgeted batches that run concurrently (at most EMBEDDING_MAX_IN_FLIGHT).
+        Vectors are returned in input order.
+        """
+        if self.cache is None:
+            return await self._aembed_uncached(texts)
+
+        vectors = await asyncio.to_thread(self.cache.get_many, texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            # Duplicates within the request are embedded once
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = dict(zip(unique_texts, await self._aembed_uncached(unique_texts)))
+            await asyncio.to_thread(self.cache.put_many, unique_texts, [fresh[t] for t in unique_texts])
+            for i in missing:
+                vectors[i] = fresh[texts[i]]
+        return vectors
+
+    async def _aembed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """Batching engine: embeds every text through the API."""
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        semaphore = asyncio.Semaphore(settings.EMBEDDING_MAX_IN_FLIGHT)
+
+        async def run(start: int, batch: List[str], tokens: int):
+            async with semaphore:
+                vectors[start:start + len(batch)] = await self._embed_batch(batch, tokens)
+
+        await asyncio.gather(*(run(*b) for b in self.make_batches(texts)))
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Embed a single query string without blocking the event loop.
+        Cache misses go through the micro-batcher: queries arriving within
+        QUERY_BATCH_MAX_WAIT_MS are embedded in one request, and identical
+        in-flight queries are embedded once.
+        """
+        if self.cache is None:
+            return await self._aembed_query_uncached(text)
+        # In a thread, as in aembed_documents: the cache lock is shared with ingestion
+        # workers, and a busy SQLite database can wait out its timeout
+        cached = (await asyncio.to_thread(self.cache.get_many, [text]))[0]
+        if cached is None:
+            cached = await self._aembed_query_uncached(text)
+            await asyncio.to_thread(self.cache.put_many, [text], [cached])
+        return cached
+
+    async def _aembed_query_uncached(self, text: str) -> List[float]:
+        if not settings.QUERY_BATCHING_ENABLED:
+            return (await self._aembed_query_batch([text]))[0]
+        return await self.query_batcher.submit(text)
+
+    async def _aembed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        One API call for a micro-batch of queries (at most QUERY_BATCH_MAX_SIZE short strings).
+        Queries are embedded from the API's long-lived event loop, so the async client is
+        safe here and saves a worker-thread hop per batch.
+        Queries are on the request path: retries and time are bounded by the
+        "query_embedding" stage budget instead of the ingestion back-off.
+        """
+        tokens = sum(self.count_tokens(t) for t in texts)
+        return await run_with_budget("query_embedding", self._embed_batch(
+            texts, tokens, use_async_client=True, max_retries=settings.STAGE_MAX_RETRIES["query_embedding"]
+        ))
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import unicodedata
+from typing import Iterable, Optional, Set
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed chunk identity for incremental re-ingestion.
+# A chunk's ID is a hash of its normalized text and its source, so re-running
+# ingestion on unchanged files yields the same IDs and nothing is re-embedded.
+
+CHUNK_ID_LENGTH = 64  # hex sha256
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalizes and collapses whitespace so cosmetic edits don't change identity."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def chunk_id(text: str, source: str) -> str:
+    """Stable primary key for a chunk: sha256(source + NUL + normalized text)."""
+    payload = f"{source}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+class ManifestStore:
+    """
+    Local record of which chunk IDs each source currently has in a collection.
+    One small JSON file per source, under INGEST_MANIFEST_DIR/<collection>/, plus
+    the ID of the collection instance they describe (see `bind`).
+    """
+
+    INSTANCE_FILE = "collection.id"
+
+    def __init__(self, collection_name: str, root: str = None):
+        self.directory = os.path.join(root or settings.INGEST_MANIFEST_DIR, collection_name)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, source: str) -> str:
+        name = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def _manifest_files(self) -> Iterable[str]:
+        return [os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(".json")]
+
+    def bind(self, instance_id: str) -> bool:
+        """
+        Ties the manifests to one collection instance (e.g. its Milvus collection ID).
+        If they were recorded for another one (the collection was dropped and re-created),
+        they describe rows that no longer exist: all are discarded, so everything is
+        ingested again. Returns True when the manifests were reset.
+        """
+        path = os.path.join(self.directory, self.INSTANCE_FILE)
+        recorded: Optional[str] = None
+        try:
+            with open(path, encoding="utf-8") as f:
+                recorded = f.read().strip()
+        except FileNotFoundError:
+            pass
+        if recorded == instance_id:
+            return False
+        stale = self._manifest_files()
+        for file in stale:
+            os.remove(file)
+        if stale:
+            logger.warning(
+                "Manifests recorded for another collection instance discarded",
+                extra={"directory": self.directory, "recorded": recorded, "instance": instance_id, "sources": len(stale)},
+            )
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(instance_id)
+        return bool(stale)
+
+    def sources(self) -> Set[str]:
+        """Every source with a manifest."""
+        sources = set()
+        for file in self._manifest_files():
+            with open(file, encoding="utf-8") as f:
+                sources.add(json.load(f)["source"])
+        return sources
+
+    def load(self, source: str) -> Set[str]:
+        """Chunk IDs recorded for `source` (empty if it was never ingested)."""
+        try:
+            with open(self._path(source), encoding="utf-8") as f:
+                return set(json.load(f)["chunk_ids"])
+        except FileNotFoundError:
+            return set()
+
+    def save(self, source: str, chunk_ids: Iterable[str]):
+        """Atomically replaces the manifest for `source`."""
+        payload = {"source": source, "chunk_ids": sorted(chunk_ids)}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self._path(source))
+
+    def delete(self, source: str):
+        """Forgets `source` (its chunks were removed from the collection)."""
+        try:
+            os.remove(self._path(source))
+        except FileNotFoundError:
+            pass
+
+    def fingerprint(self) -> str:
+        """Hash of every chunk ID recorded for the collection (changes whenever its content does)."""
+        ids = set()
+        for file in self._manifest_files():
+            with open(file, encoding="utf-8") as f:
+                ids.update(json.load(f)["chunk_ids"])
+        return hashlib.sha256("\n".join(sorted(ids)).encode("utf-8")).hexdigest()
@@ -1,3 +1,11 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
 from pymilvus import (
     connections,
     utility,
@@ -5,33 +13,97 @@ from pymilvus import (
     CollectionSchema,
     DataType,
     Collection,
+    MilvusException,
 )
+from pymilvus.exceptions import (
+    CollectionNotExistException,
+    ConnectError,
+    ConnectionNotExistException,
+    ErrorCode,
+    MilvusUnavailableException,
+)
+from pymilvus.client.types import LoadState
+from src.core.batching import MicroBatcher
 from src.core.config import settings
+from src.core.metrics import track_stage
+from src.ingestion.manifest import CHUNK_ID_LENGTH
+
+logger = logging.getLogger(__name__)
+
+# Milvus server error code for a collection that exists but isn't loaded (merr.ErrCollectionNotLoaded)
+_COLLECTION_NOT_LOADED = 101
+
+# Distinguishes the connection aliases of handlers in the same process
+_handler_ids = itertools.count()
+
+def stale_handle(e: MilvusException) -> bool:
+    """
+    Failures that new handles can fix: the connection dropped, or the collection was
+    re-created, re-aliased or released. Anything else (e.g. invalid search parameters)
+    would fail the same way again.
+    """
+    if isinstance(e, (ConnectError, ConnectionNotExistException, MilvusUnavailableException, CollectionNotExistException)):
+        return True
+    return e.code in (ErrorCode.COLLECTION_NOT_FOUND, _COLLECTION_NOT_LOADED)
 
 class MilvusHandler:
+    """
+    Owns the Milvus connections and collection handles.
+    The collection is checked, created and loaded once (`load_collection`, called from
+    the API lifespan); afterwards every search reuses cached handles, spread round-robin
+    over MILVUS_CONNECTION_POOL_SIZE connections of its own. Handles are only rebuilt after a
+    connection or collection failure, which also covers the collection being re-created or
+    its alias being switched.
+    """
+
     def __init__(self):
         self.uri = settings.MILVUS_URI
         self.collection_name = settings.MILVUS_COLLECTION_NAME
         self.dim = settings.EMBEDDING_DIMENSION
-        self._connect()
+        self.index_profile = settings.index_profile
+        # Dedicated, bounded pool for blocking pymilvus calls issued from async code
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.MILVUS_SEARCH_MAX_WORKERS,
+            thread_name_prefix="milvus-search",
+        )
+        # This handler's own connections: rebuilding them leaves other clients' alone
+        handler_id = next(_handler_ids)
+        self.aliases = [f"rag-pool-{handler_id}-{i}" for i in range(settings.MILVUS_CONNECTION_POOL_SIZE)]
+        self._handles: Optional[List[Collection]] = None
+        self._generation_handle: Optional[Collection] = None
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        # One micro-batcher per distinct (search params, limit, output fields)
+        self._search_batchers: Dict[Tuple, MicroBatcher] = {}
 
     def _connect(self):
-        """Establish connection to Milvus."""
-        print(f"Connecting to Milvus at {self.uri}...")
-        connections.connect(alias="default", uri=self.uri)
-        print("Connected to Milvus.")
+        """Establish the pooled connections to Milvus."""
+        logger.info("Connecting to Milvus", extra={"uri": self.uri, "connections": len(self.aliases)})
+        for alias in self.aliases:
+            connections.connect(alias=alias, uri=self.uri)
+        # The "default" connection, used by other Milvus clients (e.g. the shared semantic cache);
+        # opened once and never dropped by this handler
+        if not connections.has_connection("default"):
+            connections.connect(alias="default", uri=self.uri)
+        logger.info("Connected to Milvus")
+
+    @property
+    def _alias(self) -> str:
+        """Connection for schema, utility and generation calls."""
+        return self.aliases[0]
 
     def create_collection_if_not_exists(self):
         """Creates the collection schema if it doesn't exist."""
-        if utility.has_collection(self.collection_name):
-            print(f"Collection '{self.collection_name}' already exists.")
-            return Collection(self.collection_name)
+        if utility.has_collection(self.collection_name, using=self._alias):
+            logger.info("Collection already exists", extra={"collection": self.collection_name})
+            return Collection(self.collection_name, using=self._alias)
 
-        print(f"Creating collection '{self.collection_name}'...")
+        logger.info("Creating collection", extra={"collection": self.collection_name})
         
         # 1. Define Fields
         fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+            # Content-addressed ID (see src.ingestion.manifest.chunk_id) so re-ingestion can upsert
+            FieldSchema(name="id", dtype=DataType.VARCHAR, is_primary=True, auto_id=False, max_length=CHUNK_ID_LENGTH),
             FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
             FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=self.dim),
             # Metadata fields for filtering
@@ -42,24 +114,205 @@ class MilvusHandler:
         schema = CollectionSchema(fields, "Knowledge base for RAG Agent")
 
         # 3. Create Collection
-        collection = Collection(self.collection_name, schema)
+        collection = Collection(self.collection_name, schema, using=self._alias)
 
-        # 4. Create Index (IVF_FLAT is good for general purpose, or HNSW for performance)
-        index_params = {
-            "metric_type": "L2",
-            "index_type": "IVF_FLAT",
-            "params": {"nlist": 128},
-        }
+        # 4. Create Index from the configured profile (see VECTOR_INDEX_PROFILES)
+        index_params = self.index_params()
         collection.create_index(field_name="vector", index_params=index_params)
         
         # 5. Load collection into memory
         collection.load()
-        print(f"Collection '{self.collection_name}' created and loaded.")
+        logger.info("Collection created and loaded", extra={"collection": self.collection_name})
         return collection
 
+    def index_params(self) -> Dict[str, Any]:
+        """Build-time parameters for `create_index`."""
+        return {
+            "metric_type": self.index_profile.metric_type,
+            "index_type": self.index_profile.index_type,
+            "params": self.index_profile.build_params,
+        }
+
+    def search_params(self, overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Search-time parameters matching the index the collection was built with,
+        with `overrides` (e.g. an experiment variant's {"nprobe": 32}) on top.
+        """
+        return {
+            "metric_type": self.index_profile.metric_type,
+            "params": {**self.index_profile.search_params, **(overrides or {})},
+        }
+
+    def _ensure_handles(self) -> List[Collection]:
+        """
+        The cached handles, one per pooled connection. The first call connects, creates
+        the collection if needed and loads it into memory; so does the first call after
+        `invalidate`. Read and rebuilt under the lock, so a concurrent invalidate is never
+        seen half-done.
+        """
+        with self._lock:
+            if self._handles is None:
+                self._connect()
+                self.create_collection_if_not_exists().load()
+                self._handles = [Collection(self.collection_name, using=alias) for alias in self.aliases]
+            return self._handles
+
+    def load_collection(self) -> Collection:
+        """Connects, creates the collection if needed and loads it into memory, once."""
+        return self._ensure_handles()[0]
+
+    def invalidate(self, stale: Optional[Collection] = None):
+        """
+        Drops cached handles and this handler's connections; the next call reconnects and reloads.
+        With `stale` (the handle that failed), does nothing if another thread already rebuilt them.
+        """
+        with self._lock:
+            if stale is not None and not any(handle is stale for handle in self._handles or ()):
+                return
+            self._handles = None
+            self._generation_handle = None
+            for alias in self.aliases:
+                connections.disconnect(alias)
+
+    # Knowledge base generation: a one-row collection next to the knowledge base,
+    # rewritten by every ingestion that changes it. Processes that cache answers
+    # locally compare it to notice ingestion runs in other processes.
+
+    @property
+    def generation_collection_name(self) -> str:
+        return f"{self.collection_name}_generation"
+
+    def _generation_collection(self, create: bool) -> Optional[Collection]:
+        if self._generation_handle is None:
+            self.load_collection()
+            name = self.generation_collection_name
+            if utility.has_collection(name, using=self._alias):
+                collection = Collection(name, using=self._alias)
+            elif create:
+                fields = [
+                    FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+                    FieldSchema(name="generation", dtype=DataType.VARCHAR, max_length=64),
+                    # Milvus collections need a vector field; this one is never searched
+                    FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=2),
+                ]
+                collection = Collection(name, CollectionSchema(fields, f"Generation of {self.collection_name}"), using=self._alias)
+                collection.create_index(
+                    field_name="vector", index_params={"metric_type": "L2", "index_type": "FLAT", "params": {}}
+                )
+            else:
+                return None
+            collection.load()
+            self._generation_handle = collection
+        return self._generation_handle
+
+    def write_generation(self, generation: str):
+        """Records a new knowledge base generation (called by ingestion after it changed the collection)."""
+        self._generation_collection(create=True).upsert([[0], [generation], [[0.0, 0.0]]])
+
+    def read_generation(self) -> Optional[str]:
+        """The knowledge base generation last written by ingestion, None if never written."""
+        collection = self._generation_collection(create=False)
+        if collection is None:
+            return None
+        rows = collection.query(expr="id == 0", output_fields=["generation"], consistency_level="Strong")
+        return rows[0]["generation"] if rows else None
+
     def get_collection(self) -> Collection:
-        """Returns the collection object, loading it if necessary."""
-        self.create_collection_if_not_exists()
-        collection = Collection(self.collection_name)
-        collection.load()
-        return collection
\ No newline at end of file
+        """Returns a cached collection handle (round-robin over the pool), loading on first use."""
+        handles = self._ensure_handles()
+        return handles[next(self._round_robin) % len(handles)]
+
+    def is_ready(self) -> bool:
+        """Readiness probe: handles are cached and the server reports the collection as loaded."""
+        if self._handles is None:
+            return False
+        try:
+            return utility.load_state(self.collection_name, using=self._alias) == LoadState.Loaded
+        except MilvusException:
+            return False
+
+    def search(
+        self,
+        data: List[List[float]],
+        param: Dict[str, Any],
+        limit: int,
+        output_fields: List[str],
+    ):
+        """Runs a (blocking) vector search against the collection."""
+        def run_search(collection):
+            return collection.search(
+                data=data,
+                anns_field="vector",
+                param=param,
+                limit=limit,
+                output_fields=output_fields,
+            )
+
+        with track_stage("milvus_search"):
+            collection = self.get_collection()
+            try:
+                return run_search(collection)
+            except MilvusException as e:
+                if not stale_handle(e):
+                    raise
+                logger.warning("Milvus search failed; reloading collection handles", extra={"error": str(e)})
+                self.invalidate(collection)
+                return run_search(self.get_collection())
+
+    async def asearch(
+        self,
+        data: List[List[float]],
+        param: Dict[str, Any],
+        limit: int,
+        output_fields: List[str],
+    ):
+        """
+        Non-blocking variant of `search`.
+        The pymilvus call runs on the bounded executor, so the event loop stays free
+        and at most MILVUS_SEARCH_MAX_WORKERS searches are in flight per process.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            partial(self.search, data, param, limit, output_fields),
+        )
+
+    async def asearch_one(
+        self,
+        vector: List[float],
+        param: Dict[str, Any],
+        limit: int,
+        output_fields: List[str],
+    ):
+        """
+        Searches for a single query vector and returns its hits.
+        With QUERY_BATCHING_ENABLED, concurrent calls with the same parameters are
+        merged into one multi-vector search, and identical vectors are searched once.
+        """
+        if not settings.QUERY_BATCHING_ENABLED:
+            return (await self.asearch([vector], param, limit, output_fields))[0]
+
+        group = (json.dumps(param, sort_keys=True), limit, tuple(output_fields))
+        batcher = self._search_batchers.get(group)
+        if batcher is None:
+            async def search_batch(vectors: List[List[float]]):
+                return list(await self.asearch(vectors, param, limit, output_fields))
+
+            batcher = self._search_batchers[group] = MicroBatcher(
+                search_batch,
+                max_batch_size=settings.QUERY_BATCH_MAX_SIZE,
+                max_wait=settings.QUERY_BATCH_MAX_WAIT_MS / 1000,
+            )
+        return await batcher.submit(vector, key=tuple(vector))
+
+    def batching_stats(self) -> Dict[str, Any]:
+        """Micro-batching counters summed over all search parameter groups."""
+        stats = [b.stats() for b in self._search_batchers.values()]
+        batches = sum(s["batches"] for s in stats)
+        items = sum(s["items"] for s in stats)
+        return {
+            "batches": batches,
+            "items": items,
+            "coalesced": sum(s["coalesced"] for s in stats),
+            "avg_batch_size": items / batches if batches else 0.0,
+        }
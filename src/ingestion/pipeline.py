@@ -1,76 +1,210 @@
-from typing import List, Dict
+import asyncio
+import json
+import logging
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from src.ingestion.milvus_client import MilvusHandler
-from src.ingestion.embeddings import EmbeddingService
+from pymilvus import DataType
+from src.ingestion.manifest import ManifestStore, chunk_id
+from src.core.concurrency import run_sync
+from src.core.config import settings
+from src.core.log import setup_logging
+from src.core.container import container
+
+logger = logging.getLogger(__name__)
+
+# Sample knowledge base used by the __main__ demo and the retrieval benchmarks
+SAMPLE_DOCUMENTS = [
+    {
+        "text": "Dani has Type 1 Bipolar Disorder and ADHD. He prefers direct communication and practical solutions. MLOps priorities include drift detection and automated dashboards.",
+        "source": "user_profile_2025.txt"
+    },
+    {
+        "text": "Production RAG requires robust monitoring. Latency is a key metric. Agentic RAG adds complexity but improves reasoning.",
+        "source": "rag_architecture_guide.pdf"
+    },
+    {
+        "text": "The Tech Stack for the backend includes the Python ecosystem as the main language, Docker and Kubernetes for containerization, and FastAPI for backends. MLflow is used for experiment tracking, and Google Colab for prototyping. Production requires CI/CD, monitoring, and logging.",
+        "source": "tech_stack_requirements.txt"
+    }
+]
 
 class IngestionPipeline:
     def __init__(self):
-        self.milvus = MilvusHandler()
-        self.embedder = EmbeddingService()
+        # Shared with the rest of the process (one connection pool and embedding budget)
+        self.milvus = container.milvus
+        self.embedder = container.embeddings
+        self.manifests = ManifestStore(self.milvus.collection_name)
+        # Sparse index kept in step with the collection, only when hybrid retrieval uses it
+        self.bm25 = container.bm25 if settings.RETRIEVAL_MODE == "hybrid" else None
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
             separators=["\n\n", "\n", " ", ""]
         )
 
-    def run(self, documents: List[Dict[str, str]]):
+    def iter_chunks(self, documents: Iterable[Dict[str, str]]) -> Iterator[Tuple[str, str, str]]:
+        """Lazily splits documents into (chunk_id, chunk_text, source) triples."""
+        for doc in documents:
+            for chunk in self.text_splitter.split_text(doc["text"]):
+                yield chunk_id(chunk, doc["source"]), chunk, doc["source"]
+
+    def run(self, documents: Iterable[Dict[str, str]], prune: Optional[bool] = None):
         """
-        Ingests a list of raw documents into Milvus.
+        Ingests raw documents into Milvus.
         documents format: [{"text": "...", "source": "filename"}]
+        Any iterable works (e.g. a generator reading files); it is consumed lazily.
         """
-        print(f"Starting ingestion for {len(documents)} documents...")
-        
-        # 1. Chunking
-        texts_to_embed = []
-        sources = []
-        
-        for doc in documents:
-            chunks = self.text_splitter.split_text(doc["text"])
-            for chunk in chunks:
-                texts_to_embed.append(chunk)
-                sources.append(doc["source"])
-                
-        print(f"Created {len(texts_to_embed)} chunks.")
-
-        # 2. Embedding
-        # In production, batch this if > 1000 chunks
-        print("Generating embeddings...")
-        vectors = self.embedder.embed_documents(texts_to_embed)
-
-        # 3. Insert into Milvus
-        collection = self.milvus.get_collection()
-        
-        # Data must be list of columns: [[text_1, ...], [vector_1, ...], [source_1, ...]]
-        # Note: 'id' is auto-generated
-        data = [
-            texts_to_embed,
-            vectors,
-            sources
-        ]
-        
-        print("Inserting into Milvus...")
-        collection.insert(data)
-        collection.flush() # Ensure data is written to disk
-        print(f"Successfully inserted {len(texts_to_embed)} vectors.")
+        return run_sync(self.arun(documents, prune))
+
+    async def arun(self, documents: Iterable[Dict[str, str]], prune: Optional[bool] = None):
+        """
+        Streaming, incremental ingestion: chunker -> embedder workers -> inserter,
+        connected by bounded queues. Each stage holds at most INGEST_QUEUE_SIZE
+        batches, so peak memory stays constant regardless of corpus size.
+
+        Chunks whose content ID is already recorded in the source's manifest are
+        skipped; new ones are embedded and upserted, and IDs the source no longer
+        produces are deleted once the upserts are flushed. With `prune`
+        (default INGEST_PRUNE_MISSING_SOURCES), so are the chunks of sources
+        recorded earlier that this run doesn't contain (deleted files); pass
+        prune=False to ingest a subset of the corpus.
+        """
+        logger.info("Starting streaming ingestion")
+        embed_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+        insert_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+        num_embedders = settings.EMBEDDING_MAX_IN_FLIGHT
+        # source -> chunk IDs recorded by the previous run / produced by this run
+        previous_ids: Dict[str, Set[str]] = {}
+        current_ids: Dict[str, Set[str]] = {}
+        upserted = 0
+
+        collection = await asyncio.to_thread(self.milvus.get_collection)
+        if collection.schema.primary_field.dtype != DataType.VARCHAR:
+            raise RuntimeError(
+                f"Collection '{collection.name}' uses auto-generated IDs. Drop it and re-run "
+                "ingestion to recreate it with content-addressed chunk IDs."
+            )
+        # Manifests of a dropped and re-created collection would skip every chunk
+        instance = await asyncio.to_thread(collection.describe)
+        await asyncio.to_thread(self.manifests.bind, str(instance["collection_id"]))
+
+        # 1. Chunking: pull documents lazily, skip known chunks, emit fixed-size batches
+        def next_batch(chunks: Iterator[Tuple[str, str, str]]) -> List[Tuple[str, str, str]]:
+            batch = []
+            for item in chunks:
+                cid, _, source = item
+                if source not in previous_ids:
+                    previous_ids[source] = self.manifests.load(source)
+                    current_ids[source] = set()
+                seen = current_ids[source]
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                if cid not in previous_ids[source]:
+                    batch.append(item)
+                    if len(batch) == settings.INGEST_CHUNK_BATCH_SIZE:
+                        break
+            return batch
+
+        async def chunker():
+            chunks = self.iter_chunks(documents)
+            # Reading the next document may block (file I/O), so do it off the loop
+            while batch := await asyncio.to_thread(next_batch, chunks):
+                await embed_queue.put(batch)
+            for _ in range(num_embedders):
+                await embed_queue.put(None)
+
+        # 2. Embedding: concurrent workers, rate-limited by EmbeddingService
+        async def embedder():
+            while (batch := await embed_queue.get()) is not None:
+                ids, texts, sources = map(list, zip(*batch))
+                # float32 rows take 6 KB per 1536-dim vector instead of ~50 KB as Python floats
+                vectors = list(np.asarray(await self.embedder.aembed_documents(texts), dtype=np.float32))
+                await insert_queue.put((ids, texts, vectors, sources))
+            await insert_queue.put(None)
+
+        # 3. Upsert into Milvus in fixed-size batches
+        async def inserter():
+            rows = settings.INGEST_INSERT_BATCH_SIZE
+            # Data must be list of columns in schema order: [[id_1, ...], [text_1, ...], [vector_1, ...], [source_1, ...]]
+            buffer = [[], [], [], []]
+            finished = 0
+
+            async def upsert(data):
+                nonlocal upserted
+                # Upsert (not insert): content IDs make a re-run after a crash idempotent
+                await asyncio.to_thread(collection.upsert, data)
+                if self.bm25 is not None:
+                    ids, texts, _, sources = data
+                    await asyncio.to_thread(self.bm25.add, ids, texts, sources)
+                upserted += len(data[0])
+                logger.info("Upsert progress", extra={"upserted": upserted})
+
+            while finished < num_embedders:
+                item = await insert_queue.get()
+                if item is None:
+                    finished += 1
+                    continue
+                for column, values in zip(buffer, item):
+                    column.extend(values)
+                while len(buffer[0]) >= rows:
+                    await upsert([column[:rows] for column in buffer])
+                    buffer = [column[rows:] for column in buffer]
+            if buffer[0]:
+                await upsert(buffer)
+
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(chunker())
+            for _ in range(num_embedders):
+                tg.create_task(embedder())
+            tg.create_task(inserter())
+
+        # 4. Delete chunks that disappeared from their source, or whose source is gone
+        # (only after the new ones landed)
+        stale_ids = [cid for source, ids in previous_ids.items() for cid in ids - current_ids[source]]
+        removed_sources = set()
+        if settings.INGEST_PRUNE_MISSING_SOURCES if prune is None else prune:
+            removed_sources = self.manifests.sources() - current_ids.keys()
+            for source in removed_sources:
+                stale_ids.extend(self.manifests.load(source))
+        for i in range(0, len(stale_ids), settings.INGEST_INSERT_BATCH_SIZE):
+            batch = stale_ids[i:i + settings.INGEST_INSERT_BATCH_SIZE]
+            await asyncio.to_thread(collection.delete, f"id in {json.dumps(batch)}")
+            if self.bm25 is not None:
+                await asyncio.to_thread(self.bm25.remove, batch)
+
+        # One flush at the end instead of one per batch
+        await asyncio.to_thread(collection.flush) # Ensure data is written to disk
+
+        # 5. Record what each source now contains
+        for source, ids in current_ids.items():
+            if ids != previous_ids[source]:
+                self.manifests.save(source, ids)
+        for source in removed_sources:
+            self.manifests.delete(source)
+
+        unchanged = sum(len(ids & previous_ids[source]) for source, ids in current_ids.items())
+        logger.info("Ingestion done", extra={
+            "upserted": upserted, "unchanged": unchanged, "stale_removed": len(stale_ids), "sources_removed": len(removed_sources),
+        })
+        if self.embedder.cache is not None:
+            logger.info("Embedding cache stats", extra=self.embedder.cache.stats())
+
+        # 6. Invalidate cached answers built on the previous knowledge base: the shared
+        # (milvus) backend directly; API processes with a per-process cache notice the
+        # new generation within SEMANTIC_CACHE_GENERATION_CHECK_SECONDS
+        if upserted or stale_ids:
+            generation = self.manifests.fingerprint()
+            await asyncio.to_thread(self.milvus.write_generation, generation)
+            semantic_cache = container.semantic_cache
+            if semantic_cache is not None:
+                semantic_cache.invalidate()
+            logger.info("Semantic answer cache invalidated", extra={"generation": generation})
+        return upserted
 
 # Helper to run manually
 if __name__ == "__main__":
+    setup_logging()
     pipeline = IngestionPipeline()
-    
-    # UPDATED: Added a 3rd document with the Tech Stack info
-    sample_docs = [
-        {
-            "text": "Dani has Type 1 Bipolar Disorder and ADHD. He prefers direct communication and practical solutions. MLOps priorities include drift detection and automated dashboards.",
-            "source": "user_profile_2025.txt"
-        },
-        {
-            "text": "Production RAG requires robust monitoring. Latency is a key metric. Agentic RAG adds complexity but improves reasoning.",
-            "source": "rag_architecture_guide.pdf"
-        },
-        {
-            "text": "The Tech Stack for the backend includes the Python ecosystem as the main language, Docker and Kubernetes for containerization, and FastAPI for backends. MLflow is used for experiment tracking, and Google Colab for prototyping. Production requires CI/CD, monitoring, and logging.",
-            "source": "tech_stack_requirements.txt"
-        }
-    ]
-    
-    pipeline.run(sample_docs)
\ No newline at end of file
+    pipeline.run(SAMPLE_DOCUMENTS)
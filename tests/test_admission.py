@@ -0,0 +1,107 @@
+import asyncio
+import time
+import pytest
+from src.core.admission import AdmissionController, Overloaded
+from src.core.concurrency import DeadlineExceeded, deadline_scope
+
+async def _hold(controller: AdmissionController, release: asyncio.Event) -> bool:
+    async with controller.admit() as degraded:
+        await release.wait()
+    return degraded
+
+def test_admits_up_to_capacity_then_queues():
+    controller = AdmissionController(max_in_flight=2, queue_size=1, queue_timeout=1.0)
+
+    async def main():
+        release = asyncio.Event()
+        holders = [asyncio.ensure_future(_hold(controller, release)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        assert (controller.in_flight, controller.waiting) == (2, 1)
+        release.set()
+        await asyncio.gather(*holders)
+
+    asyncio.run(main())
+    assert controller.stats()["admitted"] == 3
+    assert controller.stats()["queued"] == 1
+    assert (controller.in_flight, controller.waiting) == (0, 0)
+
+def test_full_queue_is_rejected_with_429():
+    controller = AdmissionController(max_in_flight=1, queue_size=0, queue_timeout=1.0)
+
+    async def main():
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded) as rejected:
+            await controller.acquire()
+        release.set()
+        await holder
+        return rejected.value
+
+    rejected = asyncio.run(main())
+    assert rejected.status_code == 429
+    assert controller.rejected_queue_full == 1
+
+def test_queue_timeout_is_rejected_with_503():
+    controller = AdmissionController(max_in_flight=1, queue_size=1, queue_timeout=0.05)
+
+    async def main():
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded) as rejected:
+            await controller.acquire()
+        release.set()
+        await holder
+        return rejected.value
+
+    assert asyncio.run(main()).status_code == 503
+    assert controller.rejected_queue_timeout == 1
+    assert controller.waiting == 0
+
+def test_queue_wait_is_capped_by_the_request_deadline():
+    controller = AdmissionController(max_in_flight=1, queue_size=1, queue_timeout=10.0)
+
+    async def main():
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(controller, release))
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        # Whichever fires first: the capped queue wait or the deadline itself
+        with pytest.raises((Overloaded, DeadlineExceeded)):
+            async with deadline_scope(time.monotonic() + 0.05):
+                await controller.acquire()
+        waited = time.monotonic() - started
+        release.set()
+        await holder
+        return waited
+
+    assert asyncio.run(main()) < 1.0
+
+def test_requests_admitted_near_capacity_are_degraded(monkeypatch):
+    monkeypatch.setattr("src.core.admission.settings.DEGRADED_UTILIZATION", 0.5)
+    controller = AdmissionController(max_in_flight=4, queue_size=0, queue_timeout=1.0)
+
+    async def main():
+        release = asyncio.Event()
+        holders = [asyncio.ensure_future(_hold(controller, release)) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*holders)
+
+    # Degraded once 2 of the 4 slots (counting its own) are taken
+    assert asyncio.run(main()) == [False, True, True, True]
+    assert controller.degraded == 3
+
+def test_zero_capacity_disables_admission_control():
+    controller = AdmissionController(max_in_flight=0, queue_size=0, queue_timeout=0.0)
+
+    async def main():
+        release = asyncio.Event()
+        holders = [asyncio.ensure_future(_hold(controller, release)) for _ in range(100)]
+        await asyncio.sleep(0.01)
+        assert controller.in_flight == 100
+        release.set()
+        return await asyncio.gather(*holders)
+
+    assert not any(asyncio.run(main()))
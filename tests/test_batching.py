@@ -0,0 +1,115 @@
+import asyncio
+import time
+import pytest
+from src.core.batching import MicroBatcher
+from src.core.concurrency import deadline_scope, time_left
+
+def _recording_batcher(max_batch_size: int = 16, max_wait: float = 0.01, delay: float = 0.0):
+    calls = []
+
+    async def double(items):
+        calls.append(list(items))
+        await asyncio.sleep(delay)
+        return [item * 2 for item in items]
+
+    return MicroBatcher(double, max_batch_size, max_wait), calls
+
+def test_concurrent_submissions_share_one_call():
+    batcher, calls = _recording_batcher()
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert asyncio.run(main()) == [0, 2, 4, 6, 8]
+    assert calls == [[0, 1, 2, 3, 4]]
+
+def test_batches_are_capped_at_max_batch_size():
+    batcher, calls = _recording_batcher(max_batch_size=2)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert asyncio.run(main()) == [0, 2, 4, 6, 8]
+    assert [len(call) for call in calls] == [2, 2, 1]
+
+def test_duplicate_keys_are_coalesced():
+    batcher, calls = _recording_batcher(delay=0.02)
+
+    async def main():
+        first = asyncio.ensure_future(batcher.submit(3, key="three"))
+        await asyncio.sleep(0.005)
+        # Submitted while the first is in flight: waits for the same result
+        second = await batcher.submit(3, key="three")
+        return await first, second
+
+    assert asyncio.run(main()) == (6, 6)
+    assert calls == [[3]]
+    assert batcher.stats()["coalesced"] == 1
+
+def test_failure_reaches_every_caller():
+    async def fail(items):
+        raise ValueError("backend down")
+
+    batcher = MicroBatcher(fail, 16, 0.01)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_wrong_number_of_results_is_an_error():
+    async def short(items):
+        return items[:-1]
+
+    batcher = MicroBatcher(short, 16, 0.01)
+
+    async def main():
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(main()))
+
+def test_cancelled_caller_does_not_cancel_the_batch():
+    batcher, calls = _recording_batcher(delay=0.05)
+
+    async def main():
+        impatient = asyncio.ensure_future(batcher.submit(1))
+        patient = asyncio.ensure_future(batcher.submit(2))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(main()) == 4
+    assert calls == [[1, 2]]
+
+def test_batch_runs_without_the_callers_deadline():
+    seen = []
+
+    async def record(items):
+        seen.append(time_left())
+        return items
+
+    batcher = MicroBatcher(record, 16, 0.01)
+
+    async def main():
+        async with deadline_scope(time.monotonic() + 5):
+            return await batcher.submit("x")
+
+    assert asyncio.run(main()) == "x"
+    assert seen == [None]
+
+def test_can_be_reused_across_event_loops():
+    batcher, calls = _recording_batcher()
+    assert asyncio.run(batcher.submit(1)) == 2
+    assert asyncio.run(batcher.submit(2)) == 4
+    assert calls == [[1], [2]]
+
+@pytest.mark.parametrize("size", [1, 3])
+def test_sequential_submissions_are_not_delayed(size):
+    batcher, calls = _recording_batcher(max_batch_size=size, max_wait=10.0)
+
+    async def main():
+        return [await asyncio.wait_for(batcher.submit(i), 1.0) for i in range(3)]
+
+    assert asyncio.run(main()) == [0, 2, 4]
+    assert calls == [[0], [1], [2]]
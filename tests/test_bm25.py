@@ -0,0 +1,66 @@
+import pytest
+from src.ingestion.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+CHUNKS = {
+    "uri": "Set MILVUS_URI to the Milvus server address before starting the API.",
+    "deploy": "The rag-backend service runs on Kubernetes behind an ingress.",
+    "cache": "The semantic cache answers repeated questions without calling the LLM.",
+}
+
+@pytest.fixture
+def index(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    index.add(list(CHUNKS), list(CHUNKS.values()), ["docs.md"] * len(CHUNKS))
+    return index
+
+def _ids(hits):
+    return [hit[0] for hit in hits]
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    terms = tokenize("Where is MILVUS_URI set for rag-backend?")
+    assert {"milvus_uri", "milvus", "uri", "rag-backend", "rag", "backend", "set"} <= set(terms)
+    assert "where" not in terms and "is" not in terms
+
+def test_exact_identifier_ranks_first(index):
+    hits = index.search("what is milvus_uri", limit=3)
+    assert _ids(hits)[0] == "uri"
+    assert hits[0][1] == CHUNKS["uri"] and hits[0][2] == "docs.md"
+
+def test_no_matching_terms(index):
+    assert index.search("zebra", limit=3) == []
+    assert index.search("the is a", limit=3) == []
+
+def test_reindexing_replaces_a_chunk(index):
+    index.add(["cache"], ["Answers are cached in Milvus."], ["docs.md"])
+    assert "cache" not in _ids(index.search("semantic", limit=3))
+    assert "cache" in _ids(index.search("cached answers", limit=3))
+
+def test_removed_chunks_are_not_returned(index):
+    index.remove(["deploy"])
+    assert index.search("kubernetes", limit=3) == []
+
+def test_scores_after_updates_match_a_fresh_index(index, tmp_path):
+    index.add(["extra"], ["Milvus runs the vector search for the API."], ["other.md"])
+    index.remove(["deploy"])
+    index.add(["cache"], ["The cache lives in Milvus too."], ["docs.md"])
+
+    fresh = BM25Index(str(tmp_path / "fresh.sqlite3"))
+    fresh.add(
+        ["uri", "cache", "extra"],
+        [CHUNKS["uri"], "The cache lives in Milvus too.", "Milvus runs the vector search for the API."],
+        ["docs.md", "docs.md", "other.md"],
+    )
+    for query in ("milvus api", "cache", "milvus_uri server"):
+        assert index.search(query, limit=5) == pytest.approx(fresh.search(query, limit=5))
+
+def test_stats_survive_reopening(index, tmp_path):
+    before = index.search("milvus", limit=3)
+    reopened = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    assert reopened.search("milvus", limit=3) == before
+
+def test_reciprocal_rank_fusion():
+    scores = reciprocal_rank_fusion([(["a", "b", "c"], 1.0), (["b", "d"], 2.0)], k=60)
+    assert scores["a"] == pytest.approx(1 / 61)
+    assert scores["b"] == pytest.approx(1 / 62 + 2 / 61)
+    assert scores["d"] == pytest.approx(2 / 62)
+    assert max(scores, key=scores.get) == "b"
@@ -0,0 +1,73 @@
+import asyncio
+import time
+import pytest
+from src.core.concurrency import DeadlineExceeded, deadline_scope, run_with_budget, time_left
+
+@pytest.fixture
+def budgets(monkeypatch):
+    monkeypatch.setattr("src.core.concurrency.settings.STAGE_TIMEOUT_SECONDS", {"fast": 0.05, "slow": 10.0})
+
+def test_no_deadline_outside_a_request():
+    assert time_left() is None
+
+def test_deadline_follows_the_request_into_tasks():
+    async def main():
+        async with deadline_scope(time.monotonic() + 5):
+            return await asyncio.create_task(asyncio.sleep(0, result=time_left()))
+
+    left = asyncio.run(main())
+    assert left is not None and 4 < left <= 5
+
+def test_deadline_cancels_the_block():
+    async def main():
+        async with deadline_scope(time.monotonic() + 0.05):
+            await asyncio.sleep(5)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+
+def test_inner_timeouts_are_not_reported_as_the_deadline():
+    async def main():
+        async with deadline_scope(time.monotonic() + 5):
+            await asyncio.wait_for(asyncio.sleep(5), 0.01)
+
+    with pytest.raises(asyncio.TimeoutError) as raised:
+        asyncio.run(main())
+    assert not isinstance(raised.value, DeadlineExceeded)
+
+def test_stage_budget_exceeded(budgets):
+    async def main():
+        async with deadline_scope(time.monotonic() + 5):
+            await run_with_budget("fast", asyncio.sleep(5))
+
+    with pytest.raises(asyncio.TimeoutError) as raised:
+        asyncio.run(main())
+    assert not isinstance(raised.value, DeadlineExceeded)
+
+def test_stage_budget_is_capped_by_the_deadline(budgets):
+    async def main():
+        async with deadline_scope(time.monotonic() + 0.05):
+            await run_with_budget("slow", asyncio.sleep(5))
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+    assert time.monotonic() - started < 1.0
+
+def test_stage_after_the_deadline_fails_at_once(budgets):
+    async def main():
+        async with deadline_scope(time.monotonic() + 0.02):
+            time.sleep(0.05)  # Blocks the loop past the deadline
+            await run_with_budget("slow", asyncio.sleep(5))
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(main())
+    assert time.monotonic() - started < 1.0
+
+def test_stage_within_budget_returns_its_result(budgets):
+    async def main():
+        async with deadline_scope(time.monotonic() + 5):
+            return await run_with_budget("slow", asyncio.sleep(0, result="done"))
+
+    assert asyncio.run(main()) == "done"
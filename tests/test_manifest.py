@@ -0,0 +1,54 @@
+import pytest
+from src.ingestion.manifest import ManifestStore, chunk_id
+
+@pytest.fixture
+def store(tmp_path):
+    return ManifestStore("kb", root=str(tmp_path))
+
+def test_chunk_id_ignores_cosmetic_whitespace():
+    assert chunk_id("Milvus  stores\nvectors ", "a.txt") == chunk_id("Milvus stores vectors", "a.txt")
+    assert chunk_id("Milvus stores vectors", "a.txt") != chunk_id("Milvus stores vectors", "b.txt")
+
+def test_save_load_and_delete(store):
+    assert store.load("a.txt") == set()
+    store.save("a.txt", ["id1", "id2"])
+    store.save("b.txt", ["id3"])
+    assert store.load("a.txt") == {"id1", "id2"}
+    assert store.sources() == {"a.txt", "b.txt"}
+
+    store.delete("a.txt")
+    store.delete("never-saved.txt")
+    assert store.sources() == {"b.txt"}
+
+def test_fingerprint_changes_with_content(store):
+    store.save("a.txt", ["id1"])
+    before = store.fingerprint()
+    store.save("a.txt", ["id1", "id2"])
+    assert store.fingerprint() != before
+    store.save("a.txt", ["id1"])
+    assert store.fingerprint() == before
+
+def test_bind_to_the_same_instance_keeps_the_manifests(store, tmp_path):
+    assert store.bind("instance-1") is False
+    store.save("a.txt", ["id1"])
+
+    assert ManifestStore("kb", root=str(tmp_path)).bind("instance-1") is False
+    assert store.load("a.txt") == {"id1"}
+
+def test_bind_to_a_recreated_collection_discards_the_manifests(store, tmp_path):
+    store.bind("instance-1")
+    store.save("a.txt", ["id1"])
+
+    reopened = ManifestStore("kb", root=str(tmp_path))
+    assert reopened.bind("instance-2") is True
+    assert reopened.sources() == set()
+    assert reopened.load("a.txt") == set()
+    # Bound to the new instance from now on
+    assert reopened.bind("instance-2") is False
+
+def test_manifests_are_per_collection(tmp_path):
+    ManifestStore("kb", root=str(tmp_path)).save("a.txt", ["id1"])
+    other = ManifestStore("other", root=str(tmp_path))
+    other.bind("instance-9")
+    assert other.load("a.txt") == set()
+    assert ManifestStore("kb", root=str(tmp_path)).load("a.txt") == {"id1"}
@@ -0,0 +1,52 @@
+import pytest
+from langchain_core.documents import Document
+from src.agent.rerank import pack_context
+
+def _doc(text: str, score: float = 1.0) -> Document:
+    return Document(page_content=text, metadata={"rerank_score": score})
+
+def _pack(documents, **kwargs):
+    # One token per word; the rendered chunk is just its text
+    return pack_context(documents, lambda text: len(text.split()), lambda doc: doc.page_content, **kwargs)
+
+@pytest.fixture(autouse=True)
+def context_settings(monkeypatch):
+    monkeypatch.setattr("src.agent.rerank.settings.CONTEXT_MAX_DOCUMENTS", 4)
+    monkeypatch.setattr("src.agent.rerank.settings.CONTEXT_MAX_TOKENS", 10)
+    monkeypatch.setattr("src.agent.rerank.settings.RERANK_REJECT_SCORE", 0.15)
+    monkeypatch.setattr("src.agent.rerank.settings.CONTEXT_DEDUP_SIMILARITY", 0.8)
+
+def test_packs_best_first_up_to_the_document_limit():
+    documents = [_doc(f"chunk {i}") for i in range(6)]
+    packed, tokens = _pack(documents, max_documents=3)
+    assert [d.page_content for d in packed] == ["chunk 0", "chunk 1", "chunk 2"]
+    assert tokens == 6
+
+def test_chunk_over_budget_is_skipped_and_a_smaller_one_packed():
+    documents = [
+        _doc("alpha beta gamma delta"),
+        _doc("one two three four five six seven"),
+        _doc("short chunk"),
+    ]
+    packed, tokens = _pack(documents)
+    assert [d.page_content for d in packed] == ["alpha beta gamma delta", "short chunk"]
+    assert tokens == 6
+
+def test_best_chunk_is_packed_even_over_budget():
+    packed, tokens = _pack([_doc(" ".join(f"w{i}" for i in range(25))), _doc("small")])
+    assert len(packed) == 1
+    assert tokens == 25
+
+def test_stops_at_the_reject_score():
+    packed, _ = _pack([_doc("good one", 0.9), _doc("weak one", 0.1), _doc("weaker", 0.05)])
+    assert [d.page_content for d in packed] == ["good one"]
+
+def test_unscored_chunks_are_kept():
+    packed, _ = _pack([Document(page_content="dense hit"), Document(page_content="another hit")])
+    assert len(packed) == 2
+
+def test_near_duplicates_are_skipped(monkeypatch):
+    monkeypatch.setattr("src.agent.rerank.settings.CONTEXT_MAX_TOKENS", 100)
+    text = "milvus stores the vectors of every chunk in the knowledge base"
+    packed, _ = _pack([_doc(text), _doc(text + " today"), _doc("fastapi serves the chat endpoints")])
+    assert [d.page_content for d in packed] == [text, "fastapi serves the chat endpoints"]
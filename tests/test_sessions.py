@@ -0,0 +1,97 @@
+import asyncio
+import aiosqlite
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from src.agent.sessions import close_checkpointer, expire_sessions, prune_thread
+
+def _config(thread_id: str):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+async def _turns(checkpointer, thread_id: str, turns: int):
+    """Saves one checkpoint (with a pending write) per turn, like the session graph does."""
+    saved = None
+    for turn in range(turns):
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"turn": turn}
+        checkpoint["channel_versions"] = {"turn": turn + 1}
+        saved = await checkpointer.aput(_config(thread_id), checkpoint, {"step": turn}, {"turn": turn + 1})
+        await checkpointer.aput_writes(saved, [("turn", turn)], task_id=f"task-{turn}")
+    return saved
+
+async def _history(checkpointer, thread_id: str):
+    return [item async for item in checkpointer.alist(_config(thread_id))]
+
+def _run(checkpointer_factory, scenario):
+    async def main():
+        checkpointer = checkpointer_factory()
+        try:
+            return await scenario(checkpointer)
+        finally:
+            await close_checkpointer(checkpointer)
+    return asyncio.run(main())
+
+@pytest.fixture
+def sqlite_saver(tmp_path):
+    return lambda: AsyncSqliteSaver(aiosqlite.connect(str(tmp_path / "sessions.sqlite3")))
+
+def test_prune_keeps_only_the_latest_checkpoint(sqlite_saver):
+    async def scenario(checkpointer):
+        latest = await _turns(checkpointer, "t1", 4)
+        await _turns(checkpointer, "t2", 2)
+        await prune_thread(checkpointer, "t1")
+        return latest, await _history(checkpointer, "t1"), await _history(checkpointer, "t2")
+
+    latest, t1, t2 = _run(sqlite_saver, scenario)
+    (kept,) = t1
+    assert kept.config["configurable"]["checkpoint_id"] == latest["configurable"]["checkpoint_id"]
+    assert kept.checkpoint["channel_values"] == {"turn": 3}
+    assert [(task, channel, value) for task, channel, value in kept.pending_writes] == [("task-3", "turn", 3)]
+    # Other threads are left alone
+    assert len(t2) == 2
+
+def test_prune_during_a_concurrent_turn_keeps_the_newest(sqlite_saver):
+    async def scenario(checkpointer):
+        await _turns(checkpointer, "t1", 2)
+        # A concurrent turn saves a checkpoint while this one is pruned
+        await asyncio.gather(prune_thread(checkpointer, "t1"), _turns(checkpointer, "t1", 1))
+        await prune_thread(checkpointer, "t1")
+        return await _history(checkpointer, "t1")
+
+    (kept,) = _run(sqlite_saver, scenario)
+    assert kept.checkpoint["channel_values"] == {"turn": 0}
+
+def test_expire_deletes_idle_sqlite_threads(sqlite_saver):
+    async def scenario(checkpointer):
+        for thread_id in ("old", "new"):
+            await _turns(checkpointer, thread_id, 2)
+            await prune_thread(checkpointer, thread_id)
+        kept = await expire_sessions(checkpointer, ttl_seconds=3600)
+        await asyncio.sleep(0.5)
+        await _turns(checkpointer, "new", 1)
+        await prune_thread(checkpointer, "new")
+        expired = await expire_sessions(checkpointer, ttl_seconds=0.25)
+        return kept, expired, await _history(checkpointer, "old"), await _history(checkpointer, "new")
+
+    kept, expired, old, new = _run(sqlite_saver, scenario)
+    assert kept == 0
+    assert expired == 1
+    assert old == [] and len(new) == 1
+
+def test_stores_without_pruning_keep_their_history():
+    async def scenario(checkpointer):
+        await _turns(checkpointer, "t1", 3)
+        await prune_thread(checkpointer, "t1")
+        return await _history(checkpointer, "t1")
+
+    assert len(_run(InMemorySaver, scenario)) == 3
+
+def test_expire_scans_other_stores():
+    async def scenario(checkpointer):
+        await _turns(checkpointer, "t1", 2)
+        kept = await expire_sessions(checkpointer, ttl_seconds=3600)
+        expired = await expire_sessions(checkpointer, ttl_seconds=0)
+        return kept, expired, await _history(checkpointer, "t1")
+
+    assert _run(InMemorySaver, scenario) == (0, 1, [])
@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import pytest
+from mlflow.tracking import MlflowClient
+from prometheus_client import REGISTRY
+from src.core.config import settings
+from src.core.telemetry import TelemetryEvent, TelemetryExporter
+
+# TelemetryExporter against a local file-based MLflow store: no tracking server needed.
+
+def _count(outcome: str) -> float:
+    return REGISTRY.get_sample_value("rag_telemetry_events_total", {"outcome": outcome}) or 0.0
+
+def _run_event(request_id: str, latency: float = 1.0) -> TelemetryEvent:
+    return TelemetryEvent(
+        kind="run", request_id=request_id, tags={"strategy": "A", "request_id": request_id},
+        metrics={"latency_seconds": latency},
+    )
+
+def _spilled(exporter: TelemetryExporter):
+    with open(exporter.spill_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def _runs(exporter: TelemetryExporter, request_id: str):
+    client = MlflowClient(exporter.tracking_uri)
+    return client.search_runs([exporter._experiment_id], filter_string=f"tags.request_id = '{request_id}'")
+
+@pytest.fixture
+def exporter(tmp_path, monkeypatch):
+    monkeypatch.setenv("MLFLOW_ALLOW_FILE_STORE", "true")
+    monkeypatch.setattr(settings, "TELEMETRY_FLUSH_INTERVAL_SECONDS", 0.05)
+    exporter = TelemetryExporter(
+        tracking_uri=(tmp_path / "mlruns").as_uri(),
+        experiment_name="telemetry-test",
+        spill_path=str(tmp_path / "spill.jsonl"),
+    )
+    yield exporter
+    exporter.stop(timeout=5)
+
+@pytest.fixture
+def stalled_exporter(exporter, monkeypatch):
+    """An exporter whose worker never takes events off its one-slot queue."""
+    monkeypatch.setattr(exporter._queue, "maxsize", 1)
+    release = threading.Event()
+    exporter._worker = release.wait
+    exporter.start()
+    yield exporter
+    release.set()
+    exporter._thread.join(5)
+    exporter._thread = None
+
+def test_overflow_spills_events_to_disk(stalled_exporter, monkeypatch):
+    monkeypatch.setattr(settings, "TELEMETRY_OVERFLOW_POLICY", "spill")
+    for i in range(3):
+        stalled_exporter.record_request(f"req-{i}", {}, {"latency_seconds": 1.0})
+
+    assert [event["request_id"] for event in _spilled(stalled_exporter)] == ["req-1", "req-2"]
+
+def test_overflow_drops_events(stalled_exporter, monkeypatch):
+    monkeypatch.setattr(settings, "TELEMETRY_OVERFLOW_POLICY", "drop")
+    dropped = _count("dropped")
+    for i in range(3):
+        stalled_exporter.record_request(f"req-{i}", {}, {"latency_seconds": 1.0})
+
+    assert _count("dropped") - dropped == 2
+    assert not os.path.exists(stalled_exporter.spill_path)
+
+def test_stop_drains_the_queue(exporter):
+    exporter.start()
+    for i in range(5):
+        exporter.record_request(f"drain-{i}", {"strategy": "A"}, {"latency_seconds": float(i)})
+    exporter.record_feedback(1.0, request_id="drain-0")
+    exporter.stop()
+
+    for i in range(5):
+        (run,) = _runs(exporter, f"drain-{i}")
+        assert run.info.status == "FINISHED"
+        assert run.data.metrics["latency_seconds"] == float(i)
+    assert _runs(exporter, "drain-0")[0].data.metrics["user_feedback"] == 1.0
+
+def test_failed_event_is_reexported_into_the_same_run(exporter, monkeypatch):
+    client = exporter._mlflow()
+    create_run = client.create_run
+
+    def response_lost(experiment_id, **kwargs):
+        # The run is created, but the exporter never learns its ID
+        if kwargs["tags"]["request_id"] == "lost":
+            create_run(experiment_id, **kwargs)
+            raise ConnectionError("connection reset")
+        return create_run(experiment_id, **kwargs)
+
+    monkeypatch.setattr(client, "create_run", response_lost)
+    exporter._flush([_run_event("exported"), _run_event("lost")])
+
+    # Only the event that failed is spilled, marked as attempted
+    (spilled,) = _spilled(exporter)
+    assert spilled["request_id"] == "lost" and spilled["attempted"] and spilled["run_id"] is None
+    assert len(_runs(exporter, "exported")) == 1
+
+    # Once MLflow answers again, the spilled event completes the run created earlier
+    monkeypatch.setattr(client, "create_run", create_run)
+    exporter._flush([_run_event("next")])
+
+    (run,) = _runs(exporter, "lost")
+    assert run.info.status == "FINISHED"
+    assert run.data.metrics["latency_seconds"] == 1.0
+    assert len(_runs(exporter, "next")) == 1
+    assert not os.path.exists(exporter.spill_path)
+
+def test_feedback_for_unknown_request_is_dropped(exporter):
+    dropped = _count("dropped")
+    exporter._flush([
+        TelemetryEvent(kind="feedback", request_id="never-seen", metrics={"user_feedback": 1.0}),
+        # Not a valid filter value: never searched for
+        TelemetryEvent(kind="feedback", request_id="it's", metrics={"user_feedback": 0.0}),
+        TelemetryEvent(kind="feedback", run_id="0" * 32, metrics={"user_feedback": 1.0}),
+    ])
+
+    assert _count("dropped") - dropped == 3
+    assert exporter._healthy
+    assert not os.path.exists(exporter.spill_path)